@@ -0,0 +1,111 @@
+import os
+import sys
+from typing import Any, NamedTuple
+
+from .context import OpcodesError
+from .shared_utils import select_extension_files
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# Outputs a configuration can ask for, named like the options of the
+# generate command and the arguments of generate_extensions.
+BATCH_OUTPUTS = [
+    "c",
+    "chisel",
+    "spinalhdl",
+    "sverilog",
+    "rust",
+    "go",
+    "latex",
+    "svg",
+    "c_decoder",
+    "compressed_table",
+    "dispatch",
+    "rust_decoder",
+]
+
+
+class BatchConfig(NamedTuple):
+    """A configuration of a batch manifest."""
+
+    name: str
+    directory: str
+    extensions: "list[str]"
+    outputs: "list[str]"
+    pseudo: bool = False
+    warn_overlap: bool = False
+    depfiles: bool = False
+    minimize: bool = False
+
+
+# Read a setting of a manifest table, checking its type
+def manifest_value(table: "dict[str, Any]", key: str, kind: type, default: Any) -> Any:
+    value = table.get(key, default)
+    if not isinstance(value, kind) or (
+        kind is list and not all(isinstance(item, str) for item in value)
+    ):
+        raise OpcodesError(f"Manifest setting {key} = {value!r} has the wrong type")
+    return value
+
+
+# Parse the configurations of a batch manifest
+def parse_manifest(
+    manifest: "dict[str, Any]", base_dir: str = "."
+) -> "list[BatchConfig]":
+    """
+    Returns the configurations of the [[config]] tables of a manifest. Each
+    configuration is written to its directory setting, by default its name,
+    relative to base_dir.
+    """
+    configs = []
+    names = set()
+    for table in manifest.get("config", []):
+        unknown = set(table) - set(BatchConfig._fields)
+        if unknown:
+            raise OpcodesError(f"Unknown manifest settings: {sorted(unknown)}")
+        name = manifest_value(table, "name", str, "")
+        if not name or name in names:
+            raise OpcodesError(f"Every configuration needs a unique name, not {name!r}")
+        names.add(name)
+        outputs = manifest_value(table, "outputs", list, [])
+        unknown = set(outputs) - set(BATCH_OUTPUTS)
+        if unknown:
+            raise OpcodesError(
+                f"Unknown outputs {sorted(unknown)} in configuration {name}"
+            )
+        extensions = manifest_value(table, "extensions", list, [])
+        if not select_extension_files(extensions):
+            raise OpcodesError(f"No extension files match configuration {name}")
+        configs.append(
+            BatchConfig(
+                name,
+                os.path.join(base_dir, manifest_value(table, "directory", str, name)),
+                extensions,
+                outputs,
+                manifest_value(table, "pseudo", bool, False),
+                manifest_value(table, "warn_overlap", bool, False),
+                manifest_value(table, "depfiles", bool, False),
+                manifest_value(table, "minimize", bool, False),
+            )
+        )
+    if not configs:
+        raise OpcodesError("The manifest has no [[config]] tables")
+    return configs
+
+
+# Read a batch manifest
+def load_manifest(file_name: str) -> "list[BatchConfig]":
+    if tomllib is None:
+        raise OpcodesError("Reading batch manifests needs tomli on Python < 3.11")
+    try:
+        with open(file_name, "rb") as f:
+            manifest = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise OpcodesError(f"Cannot read manifest {file_name}: {e}") from e
+    return parse_manifest(manifest, os.path.dirname(file_name))
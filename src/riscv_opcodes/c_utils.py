@@ -1,55 +1,23 @@
 import logging
 import os
 import pprint
+from collections.abc import Iterator
 
-from .constants import causes, csrs, csrs32
+from .context import current_context
+from .decoder import DecodeLeaf, DecodeTree, build_decode_tree
+from .output_utils import OutputTarget, output_sink
 from .resources import read_text_resource
-from .shared_utils import InstrDict, arg_lut
+from .shared_utils import InstrDict
 
 pp = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
 
 
-def make_c(instr_dict: InstrDict):
-    mask_match_str = ""
-    declare_insn_str = ""
-    for i in instr_dict:
-        mask_match_str += (
-            f'#define MATCH_{i.upper().replace(".","_")} {instr_dict[i]["match"]}\n'
-        )
-        mask_match_str += (
-            f'#define MASK_{i.upper().replace(".","_")} {instr_dict[i]["mask"]}\n'
-        )
-        declare_insn_str += f'DECLARE_INSN({i.replace(".","_")}, MATCH_{i.upper().replace(".","_")}, MASK_{i.upper().replace(".","_")})\n'
-
-    csr_names_str = ""
-    declare_csr_str = ""
-    for num, name in csrs + csrs32:
-        csr_names_str += f"#define CSR_{name.upper()} {hex(num)}\n"
-        declare_csr_str += f"DECLARE_CSR({name}, CSR_{name.upper()})\n"
-
-    causes_str = ""
-    declare_cause_str = ""
-    for num, name in causes:
-        causes_str += f"#define CAUSE_{name.upper().replace(' ', '_')} {hex(num)}\n"
-        declare_cause_str += (
-            f"DECLARE_CAUSE(\"{name}\", CAUSE_{name.upper().replace(' ','_')})\n"
-        )
-
-    arg_str = ""
-    for name, rng in arg_lut.items():
-        sanitized_name = name.replace(" ", "_").replace("=", "_eq_")
-        begin = rng[1]
-        end = rng[0]
-        mask = ((1 << (end - begin + 1)) - 1) << begin
-        arg_str += f"#define INSN_FIELD_{sanitized_name.upper()} {hex(mask)}\n"
-
-    enc_header = read_text_resource("encoding.h")
-
+def emit_c(instr_dict: InstrDict) -> Iterator[str]:
+    context = current_context()
     commit = os.popen('git log -1 --format="format:%h"').read()
 
-    # Generate the output as a string
-    output_str = f"""/* SPDX-License-Identifier: BSD-3-Clause */
+    yield f"""/* SPDX-License-Identifier: BSD-3-Clause */
 
 /* Copyright (c) 2023 RISC-V International */
 
@@ -58,22 +26,125 @@ def make_c(instr_dict: InstrDict):
  * https://github.com/riscv/riscv-opcodes ({commit})
  */
 
-{enc_header}
+"""
+    yield read_text_resource("encoding.h")
+    yield """
 /* Automatically generated by parse_opcodes. */
 #ifndef RISCV_ENCODING_H
 #define RISCV_ENCODING_H
-{mask_match_str}
-{csr_names_str}
-{causes_str}
-{arg_str}#endif
-#ifdef DECLARE_INSN
-{declare_insn_str}#endif
-#ifdef DECLARE_CSR
-{declare_csr_str}#endif
-#ifdef DECLARE_CAUSE
-{declare_cause_str}#endif
 """
 
-    # Write the modified output to the file
-    with open("encoding.out.h", "w", encoding="utf-8") as enc_file:
-        enc_file.write(output_str)
+    for i, instr in instr_dict.items():
+        yield f'#define MATCH_{i.upper().replace(".","_")} {hex(instr.match)}\n'
+        yield f'#define MASK_{i.upper().replace(".","_")} {hex(instr.mask)}\n'
+    yield "\n"
+
+    for num, name in context.csrs + context.csrs32:
+        yield f"#define CSR_{name.upper()} {hex(num)}\n"
+    yield "\n"
+
+    for num, name in context.causes:
+        yield f"#define CAUSE_{name.upper().replace(' ', '_')} {hex(num)}\n"
+    yield "\n"
+
+    for name, rng in context.arg_lut.items():
+        sanitized_name = name.replace(" ", "_").replace("=", "_eq_")
+        begin = rng[1]
+        end = rng[0]
+        mask = ((1 << (end - begin + 1)) - 1) << begin
+        yield f"#define INSN_FIELD_{sanitized_name.upper()} {hex(mask)}\n"
+
+    yield "#endif\n#ifdef DECLARE_INSN\n"
+    for i in instr_dict:
+        yield f'DECLARE_INSN({i.replace(".","_")}, MATCH_{i.upper().replace(".","_")}, MASK_{i.upper().replace(".","_")})\n'
+
+    yield "#endif\n#ifdef DECLARE_CSR\n"
+    for num, name in context.csrs + context.csrs32:
+        yield f"DECLARE_CSR({name}, CSR_{name.upper()})\n"
+
+    yield "#endif\n#ifdef DECLARE_CAUSE\n"
+    for num, name in context.causes:
+        yield f"DECLARE_CAUSE(\"{name}\", CAUSE_{name.upper().replace(' ','_')})\n"
+    yield "#endif\n"
+
+
+def make_c(instr_dict: InstrDict, sink: OutputTarget = None) -> bool:
+    return output_sink(sink).write("encoding.out.h", emit_c(instr_dict))
+
+
+# Name of the enumerator of an instruction in the generated decoder
+def c_insn_id(name: str) -> str:
+    return f'RISCV_INSN_{name.upper().replace(".", "_")}'
+
+
+# Generate the C statements that decode a subtree
+def emit_c_decode_subtree(tree: DecodeTree, decided: int, indent: str) -> Iterator[str]:
+    """
+    Yields a switch on the bits of each inner node, nested down to the
+    leaves, which test the bits of their candidates that the enclosing
+    switches have not already decided, most specific candidate first.
+    """
+    if isinstance(tree, DecodeLeaf):
+        for name, match, mask in tree.candidates:
+            remaining = mask & ~decided
+            if not remaining:
+                yield f"{indent}return {c_insn_id(name)};\n"
+                return
+            yield f"{indent}if ((insn & {hex(remaining)}) == {hex(match & remaining)})\n"
+            yield f"{indent}  return {c_insn_id(name)};\n"
+        yield f"{indent}return RISCV_INSN_UNKNOWN;\n"
+        return
+
+    yield f"{indent}switch (insn & {hex(tree.mask)}) {{\n"
+    for value, child in sorted(tree.children.items()):
+        yield f"{indent}case {hex(value)}:\n"
+        yield from emit_c_decode_subtree(child, decided | tree.mask, indent + "  ")
+    yield f"{indent}default:\n"
+    yield f"{indent}  return RISCV_INSN_UNKNOWN;\n"
+    yield f"{indent}}}\n"
+
+
+def emit_c_decoder(instr_dict: InstrDict) -> Iterator[str]:
+    """
+    Yields a C header with an enumeration of the instructions, a function
+    returning their names and a decode function that switches on the fixed bits of the encodings, following the
+    decode tree of riscv_opcodes.decoder, so it returns the same instruction
+    as the Python Decoder for every word.
+    """
+    yield """/* Automatically generated by parse_opcodes. */
+#ifndef RISCV_DECODE_H
+#define RISCV_DECODE_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+enum riscv_insn {
+  RISCV_INSN_UNKNOWN,
+"""
+    for name in instr_dict:
+        yield f"  {c_insn_id(name)},\n"
+    yield """  RISCV_INSN_COUNT
+};
+
+/* Returns the name of an instruction, or NULL for ids out of range. */
+static inline const char *riscv_insn_name(enum riscv_insn insn)
+{
+  static const char *const names[RISCV_INSN_COUNT] = {
+    "unknown",
+"""
+    for name in instr_dict:
+        yield f'    "{name}",\n'
+    yield """  };
+
+  return (unsigned)insn < RISCV_INSN_COUNT ? names[insn] : NULL;
+}
+
+static inline enum riscv_insn riscv_decode(uint32_t insn)
+{
+"""
+    yield from emit_c_decode_subtree(build_decode_tree(instr_dict), 0, "  ")
+    yield "}\n\n#endif\n"
+
+
+def make_c_decoder(instr_dict: InstrDict, sink: OutputTarget = None) -> bool:
+    return output_sink(sink).write("decode.out.h", emit_c_decoder(instr_dict))
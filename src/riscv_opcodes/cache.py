@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+from .context import current_context
+from .resources import resource_root
+from .shared_utils import InstrDict, InstrModel, SingleInstr, create_inst_dict
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
+
+# Bump this whenever the layout of a cache entry changes.
+CACHE_FORMAT_VERSION = 3
+
+# Default cap on the total size of the cache directory.
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def default_cache_dir() -> Path:
+    """Returns the default cache directory, following the XDG convention."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return Path(cache_home) / "riscv_opcodes"
+
+
+def hash_inputs() -> str:
+    """
+    Returns a digest of everything create_inst_dict reads: the names and
+    contents of all extension files (dependencies of $import/$pseudo_op lines
+    can live in any of them), arg_lut.csv and the parser sources themselves.
+    Every module of the package is hashed rather than a list of the modules
+    the parser imports, which would silently go stale.
+    """
+    digest = hashlib.sha256(f"format {CACHE_FORMAT_VERSION}\n".encode())
+
+    root = resource_root()
+    for directory in ("extensions", "extensions/unratified"):
+        for file in sorted(
+            (f for f in (root / directory).iterdir() if f.is_file()),
+            key=lambda f: f.name,
+        ):
+            digest.update(f"{directory}/{file.name}\n".encode())
+            digest.update(file.read_bytes())
+
+    digest.update(b"arg_lut.csv\n")
+    digest.update((root / "arg_lut.csv").read_bytes())
+
+    for source in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(f"{source.name}\n".encode())
+        digest.update(source.read_bytes())
+
+    return digest.hexdigest()
+
+
+class InstrDictCache:
+    """
+    Content-addressed on-disk cache of create_inst_dict results.
+
+    Entries are keyed on a hash of the extension files, arg_lut.csv, the
+    parser sources and the create_inst_dict arguments, so a stale entry can
+    never be returned. Each entry is a JSON file; reading an entry bumps its
+    mtime and the least recently used entries are evicted once the directory
+    grows beyond max_size bytes.
+    """
+
+    def __init__(self, directory: Path, max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._inputs_digest: Optional[str] = None
+
+    def key(
+        self,
+        file_filter: "list[str]",
+        include_pseudo: bool,
+        include_pseudo_ops: "list[str]",
+        warn_overlap: bool,
+    ) -> str:
+        """Returns the cache key for a create_inst_dict call."""
+        if self._inputs_digest is None:
+            self._inputs_digest = hash_inputs()
+        arguments = json.dumps(
+            [file_filter, include_pseudo, include_pseudo_ops, warn_overlap]
+        )
+        return hashlib.sha256(
+            f"{self._inputs_digest}\n{arguments}".encode()
+        ).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> "Optional[dict[str, Any]]":
+        """Returns the cache entry for key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logging.debug(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+        return entry
+
+    def put(self, key: str, entry: "dict[str, Any]"):
+        """Stores an entry and evicts old entries if the cache is too big."""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(tmp_name, self._entry_path(key))
+        except OSError as e:
+            logging.warning(f"Could not write cache entry to {self.directory}: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits max_size."""
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_size:
+                break
+            logging.debug(f"Evicting cache entry {path}")
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def create_inst_dict(
+        self,
+        file_filter: "list[str]",
+        include_pseudo: bool = False,
+        include_pseudo_ops: "Optional[list[str]]" = None,
+        warn_overlap: bool = False,
+        jobs: int = 1,
+        model: Optional[InstrModel] = None,
+    ) -> InstrDict:
+        """
+        Cached equivalent of shared_utils.create_inst_dict. On a miss the
+        dictionary is created from model if one is given.
+
+        Parsing registers "field=alias" arguments in the arg_lut of the
+        current context as a side effect and those show up in the generated C
+        header. The aliases registered by a parse are therefore stored with
+        the entry and registered again when the entry is reused, and so are
+        the warnings it reported (overlaps with warn_overlap).
+        """
+        if include_pseudo_ops is None:
+            include_pseudo_ops = []
+
+        key = self.key(file_filter, include_pseudo, include_pseudo_ops, warn_overlap)
+        context = current_context()
+        arg_lut = context.arg_lut
+        entry = self.get(key)
+        if entry is not None:
+            logging.debug(f"Using cached instruction dictionary {key}")
+            for name, msb, lsb in entry["arg_aliases"]:
+                arg_lut.setdefault(name, (msb, lsb))
+            for message in entry["warnings"]:
+                context.warn(message)
+            return {
+                name: SingleInstr(match, mask, variable_fields, extension, width)
+                for name, (match, mask, width, variable_fields, extension) in entry[
+                    "instr_dict"
+                ].items()
+            }
+
+        # Parse without any previously registered aliases so that exactly the
+        # aliases this parse depends on are recorded.
+        saved_arg_lut = dict(arg_lut)
+        first_warning = len(context.warnings)
+        for name in saved_arg_lut:
+            if "=" in name:
+                del arg_lut[name]
+        try:
+            if model is not None:
+                instr_dict = model.create_inst_dict(
+                    file_filter, include_pseudo, include_pseudo_ops, warn_overlap
+                )
+            else:
+                instr_dict = create_inst_dict(
+                    file_filter, include_pseudo, include_pseudo_ops, warn_overlap, jobs
+                )
+            arg_aliases = [
+                (name, msb, lsb) for name, (msb, lsb) in arg_lut.items() if "=" in name
+            ]
+            warnings = context.warnings[first_warning:]
+        finally:
+            parsed_arg_lut = dict(arg_lut)
+            arg_lut.clear()
+            arg_lut.update(saved_arg_lut)
+            for name, rng in parsed_arg_lut.items():
+                arg_lut.setdefault(name, rng)
+
+        self.put(
+            key,
+            {
+                "arg_aliases": arg_aliases,
+                "warnings": warnings,
+                "instr_dict": {
+                    name: [
+                        instr.match,
+                        instr.mask,
+                        instr.width,
+                        instr.variable_fields,
+                        instr.extension,
+                    ]
+                    for name, instr in instr_dict.items()
+                },
+            },
+        )
+        return instr_dict
@@ -1,18 +1,31 @@
 import logging
 import pprint
+from collections.abc import Iterator
 
-from .constants import causes, csrs, csrs32
+from .context import current_context
+from .minimize_utils import Cube, cube_encoding, minimize_instructions, minimize_legal
+from .output_utils import OutputTarget, output_sink
 from .shared_utils import InstrDict, instr_dict_2_extensions
 
 pp = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
 
 
-def make_chisel(instr_dict: InstrDict, spinal_hdl: bool = False):
+def emit_chisel(
+    instr_dict: InstrDict, spinal_hdl: bool = False, minimize: bool = False
+) -> Iterator[str]:
+    context = current_context()
+
+    yield """
+/* Automatically generated by parse_opcodes */
+object Instructions {
+"""
+
+    # Group the instructions by their first extension, keeping their order.
+    instrs_by_extension: "dict[str, list[str]]" = {}
+    for instr_name, instr in instr_dict.items():
+        instrs_by_extension.setdefault(instr.extension[0], []).append(instr_name)
 
-    chisel_names = ""
-    cause_names_str = ""
-    csr_names_str = ""
     extensions = instr_dict_2_extensions(instr_dict)
     for e in extensions:
         if "rv64_" in e:
@@ -24,61 +37,95 @@ def make_chisel(instr_dict: InstrDict, spinal_hdl: bool = False):
         else:
             e_format = e.upper()
         if not spinal_hdl:
-            chisel_names += f'  val {e_format+"Type"} = Map(\n'
-            for instr_name, instr in instr_dict.items():
-                if instr["extension"][0] == e:
-                    tmp_instr_name = '"' + instr_name.upper().replace(".", "_") + '"'
-                    chisel_names += f'   {tmp_instr_name:<18s} -> BitPat("b{instr["encoding"].replace("-","?")}"),\n'
-            chisel_names += "  )\n"
+            yield f'  val {e_format+"Type"} = Map(\n'
+            for instr_name in instrs_by_extension[e]:
+                instr = instr_dict[instr_name]
+                tmp_instr_name = '"' + instr_name.upper().replace(".", "_") + '"'
+                yield f'   {tmp_instr_name:<18s} -> BitPat("b{instr.encoding.replace("-","?")}"),\n'
+            yield "  )\n"
         else:
-            chisel_names += f'  val {e_format+"Type"} = new {{\n'
-            for instr_name, instr in instr_dict.items():
-                if instr["extension"][0] == e:
-                    tmp_instr_name = instr_name.upper().replace(".", "_")
-                    chisel_names += f'    def {tmp_instr_name:<18s} -> M"{instr["encoding"].replace("-","-")}"\n'
-            chisel_names += "  }\n"
+            yield f'  val {e_format+"Type"} = new {{\n'
+            for instr_name in instrs_by_extension[e]:
+                instr = instr_dict[instr_name]
+                tmp_instr_name = instr_name.upper().replace(".", "_")
+                yield f'    def {tmp_instr_name:<18s} -> M"{instr.encoding.replace("-","-")}"\n'
+            yield "  }\n"
 
-    for num, name in causes:
-        cause_names_str += f'  val {name.lower().replace(" ","_")} = {hex(num)}\n'
-    cause_names_str += """  val all = {
+    yield """
+}
+"""
+    if minimize:
+        yield from emit_chisel_minimized(instr_dict, spinal_hdl)
+    yield """object Causes {
+"""
+    for num, name in context.causes:
+        yield f'  val {name.lower().replace(" ","_")} = {hex(num)}\n'
+    yield """  val all = {
     val res = collection.mutable.ArrayBuffer[Int]()
 """
-    for num, name in causes:
-        cause_names_str += f'    res += {name.lower().replace(" ","_")}\n'
-    cause_names_str += """    res.toArray
-  }"""
+    for num, name in context.causes:
+        yield f'    res += {name.lower().replace(" ","_")}\n'
+    yield """    res.toArray
+  }
+}
+object CSRs {
+"""
 
-    for num, name in csrs + csrs32:
-        csr_names_str += f"  val {name} = {hex(num)}\n"
-    csr_names_str += """  val all = {
+    for num, name in context.csrs + context.csrs32:
+        yield f"  val {name} = {hex(num)}\n"
+    yield """  val all = {
     val res = collection.mutable.ArrayBuffer[Int]()
 """
-    for num, name in csrs:
-        csr_names_str += f"""    res += {name}\n"""
-    csr_names_str += """    res.toArray
+    for num, name in context.csrs:
+        yield f"""    res += {name}\n"""
+    yield """    res.toArray
   }
   val all32 = {
     val res = collection.mutable.ArrayBuffer(all:_*)
 """
-    for num, name in csrs32:
-        csr_names_str += f"""    res += {name}\n"""
-    csr_names_str += """    res.toArray
-  }"""
+    for num, name in context.csrs32:
+        yield f"""    res += {name}\n"""
+    yield """    res.toArray
+  }
+}
+"""
 
-    with open(
-        "inst.spinalhdl" if spinal_hdl else "inst.chisel", "w", encoding="utf-8"
-    ) as chisel_file:
-        chisel_file.write(
-            f"""
-/* Automatically generated by parse_opcodes */
-object Instructions {{
-{chisel_names}
-}}
-object Causes {{
-{cause_names_str}
-}}
-object CSRs {{
-{csr_names_str}
-}}
+
+def emit_chisel_minimized(instr_dict: InstrDict, spinal_hdl: bool) -> Iterator[str]:
+    """
+    Yields the minimized legal words and, for each instruction, its minimized
+    patterns, which only tell it apart from the other instructions: a word
+    is an instruction if it matches one of its patterns and a legal pattern.
+    """
+
+    def pattern(cube: Cube) -> str:
+        if spinal_hdl:
+            return f'M"{cube_encoding(cube)}"'
+        return f'BitPat("b{cube_encoding(cube).replace("-", "?")}")'
+
+    yield """object MinimizedDecode {
+  val legal = Seq(
 """
-        )
+    for cube in minimize_legal(instr_dict):
+        yield f"    {pattern(cube)},\n"
+    yield """  )
+  val instructions = Map(
+"""
+    for name, cubes in minimize_instructions(instr_dict).items():
+        tmp_instr_name = '"' + name.upper().replace(".", "_") + '"'
+        yield f"    {tmp_instr_name} -> Seq({', '.join(map(pattern, cubes))}),\n"
+    yield """  )
+}
+"""
+
+
+def make_chisel(
+    instr_dict: InstrDict,
+    spinal_hdl: bool = False,
+    sink: OutputTarget = None,
+    minimize: bool = False,
+) -> bool:
+    return output_sink(sink).write(
+        "inst.spinalhdl" if spinal_hdl else "inst.chisel",
+        emit_chisel(instr_dict, spinal_hdl, minimize),
+    )
@@ -0,0 +1,143 @@
+"""
+Client of the `riscv_opcodes serve` daemon. It only uses the standard library
+so that it starts quickly: run it as `python3 -m riscv_opcodes.client`.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+
+class ServerError(Exception):
+    """An error reported by the server, or a failure to reach it."""
+
+
+def default_socket_path() -> Path:
+    """
+    Returns the default socket path: riscv_opcodes.sock in $XDG_RUNTIME_DIR,
+    or a per-user file in the temporary directory.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "riscv_opcodes.sock"
+    return Path(tempfile.gettempdir()) / f"riscv_opcodes-{os.getuid()}.sock"
+
+
+class OpcodesClient:
+    """
+    A connection to the server. Requests and responses are JSON objects, one
+    per line; keeping the client open saves connecting for every request.
+    """
+
+    def __init__(self, socket_path: "Optional[os.PathLike[str]]" = None):
+        self.socket_path = default_socket_path() if socket_path is None else socket_path
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(str(self.socket_path))
+        except OSError as e:
+            self.socket.close()
+            raise ServerError(f"Cannot connect to {self.socket_path}: {e}") from e
+        self.stream = self.socket.makefile("rb")
+
+    def request(self, request: "dict[str, Any]") -> "dict[str, Any]":
+        """Sends a request and returns the response, raising its error if any."""
+        self.socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        line = self.stream.readline()
+        if not line:
+            raise ServerError("The server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ServerError(response["error"])
+        return response
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+    def __enter__(self) -> "OpcodesClient":
+        return self
+
+    def __exit__(self, *exc_info: Any):
+        self.close()
+
+
+def client_main(argv: "list[str]"):
+    parser = argparse.ArgumentParser(
+        prog="riscv_opcodes client",
+        description="Send a request to a running riscv_opcodes server",
+    )
+    parser.add_argument("command", choices=["generate", "query", "decode"])
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Socket the server listens on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-pseudo", action="store_true", help="Include pseudo-instructions"
+    )
+    parser.add_argument(
+        "-minimize",
+        action="store_true",
+        help="Add minimized decode patterns to the HDL outputs",
+    )
+    parser.add_argument(
+        "--output",
+        action="append",
+        default=[],
+        help="Output to generate: c, chisel, spinalhdl, sverilog, rust, go, latex, svg, c_decoder, compressed_table, dispatch or rust_decoder; can be given several times",
+    )
+    parser.add_argument(
+        "--directory",
+        default=".",
+        help="Directory the outputs are generated in (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--name",
+        action="append",
+        help="Instruction to query; can be given several times (default: all)",
+    )
+    parser.add_argument(
+        "--word",
+        action="append",
+        default=[],
+        help="Hexadecimal instruction word to decode; can be given several times",
+    )
+    parser.add_argument(
+        "extensions",
+        nargs="+",
+        help="Extensions to use. This is a glob of the rv_.. files, e.g. 'rv_i rv64_i rv_c'.",
+    )
+    args = parser.parse_args(argv)
+
+    request: dict[str, Any] = {
+        "command": args.command,
+        "extensions": args.extensions,
+        "pseudo": args.pseudo,
+    }
+    if args.command == "generate":
+        request["outputs"] = args.output
+        request["minimize"] = args.minimize
+        request["directory"] = os.path.abspath(args.directory)
+    elif args.command == "query" and args.name is not None:
+        request["names"] = args.name
+    elif args.command == "decode":
+        request["words"] = args.word
+
+    try:
+        with OpcodesClient(args.socket) as client:
+            response = client.request(request)
+    except ServerError as e:
+        print(f"ERROR:: {e}", file=sys.stderr)
+        raise SystemExit(1) from e
+    json.dump(response, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    client_main(sys.argv[1:])
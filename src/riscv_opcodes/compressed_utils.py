@@ -0,0 +1,136 @@
+import array
+import struct
+import sys
+from collections.abc import Iterator
+
+from .decoder import decode_candidates
+from .output_utils import OutputTarget, output_sink
+from .shared_utils import InstrDict
+
+# Number of 16-bit instruction words.
+HALFWORD_COUNT = 1 << 16
+
+# Number of table entries per line of the C and Rust tables.
+TABLE_LINE_ENTRIES = 16
+
+# Alignment of the header of .npy files.
+NPY_HEADER_ALIGNMENT = 64
+
+
+# Check whether an encoding is a 16-bit instruction
+def is_compressed(match: int, mask: int) -> bool:
+    return mask & 0x3 == 0x3 and match & 0x3 != 0x3 and mask < HALFWORD_COUNT
+
+
+# List the compressed instructions of a dictionary
+def compressed_instructions(instr_dict: InstrDict) -> "list[str]":
+    """
+    Returns the names of the 16-bit instructions of instr_dict, in order. The
+    id of an instruction in the decode table is its index in this list plus
+    one; 0 stands for halfwords that aren't a known compressed instruction,
+    including those whose low bits are 11 (the first half of a longer
+    instruction).
+    """
+    return [
+        name
+        for name, instr in instr_dict.items()
+        if is_compressed(instr.match, instr.mask)
+    ]
+
+
+# Decode every halfword
+def build_compressed_table(instr_dict: InstrDict) -> "array.array[int]":
+    """
+    Returns the id of the instruction of each of the 65536 halfwords. Every
+    instruction writes its id to the halfwords it matches, which are found
+    by enumerating the values of its free bits rather than by testing every
+    halfword. The instructions are applied from the lowest to the highest
+    decode priority (see decode_candidates), so where encodings overlap the
+    table holds the instruction the Python Decoder would return.
+    """
+    names = compressed_instructions(instr_dict)
+    ids = {name: i + 1 for i, name in enumerate(names)}
+    table = array.array("H", bytes(2 * HALFWORD_COUNT))
+    candidates = decode_candidates({name: instr_dict[name] for name in names})
+    for name, match, mask in reversed(candidates):
+        free = ~mask & (HALFWORD_COUNT - 1)
+        value = free
+        while True:
+            table[match | value] = ids[name]
+            if not value:
+                break
+            value = (value - 1) & free
+    return table
+
+
+# Format the entries of a table, a line at a time
+def table_lines(table: "array.array[int]", indent: str) -> Iterator[str]:
+    for start in range(0, len(table), TABLE_LINE_ENTRIES):
+        entries = table[start : start + TABLE_LINE_ENTRIES]
+        yield f"{indent}{', '.join(map(str, entries))},\n"
+
+
+def emit_compressed_c(instr_dict: InstrDict) -> Iterator[str]:
+    names = compressed_instructions(instr_dict)
+    yield f"""/* Automatically generated by parse_opcodes. */
+#ifndef RISCV_COMPRESSED_H
+#define RISCV_COMPRESSED_H
+
+#include <stdint.h>
+
+/* riscv_compressed_decode[halfword] is an index into riscv_compressed_names. */
+static const char *const riscv_compressed_names[{len(names) + 1}] = {{
+  "unknown",
+"""
+    for name in names:
+        yield f'  "{name}",\n'
+    yield f"""}};
+
+static const uint16_t riscv_compressed_decode[{HALFWORD_COUNT}] = {{
+"""
+    yield from table_lines(build_compressed_table(instr_dict), "  ")
+    yield "};\n\n#endif\n"
+
+
+def emit_compressed_rust(instr_dict: InstrDict) -> Iterator[str]:
+    names = compressed_instructions(instr_dict)
+    yield f"""
+/* Automatically generated by parse_opcodes */
+/* COMPRESSED_DECODE[halfword] is an index into COMPRESSED_NAMES. */
+pub static COMPRESSED_NAMES: [&str; {len(names) + 1}] = [
+    "unknown",
+"""
+    for name in names:
+        yield f'    "{name}",\n'
+    yield f"""];
+
+pub static COMPRESSED_DECODE: [u16; {HALFWORD_COUNT}] = [
+"""
+    yield from table_lines(build_compressed_table(instr_dict), "    ")
+    yield "];\n"
+
+
+def emit_compressed_npy(instr_dict: InstrDict) -> Iterator[bytes]:
+    """
+    Yields the decode table as a NumPy .npy file (format version 1.0) of
+    little-endian uint16 values, which numpy.load reads without numpy being
+    needed to write it.
+    """
+    table = build_compressed_table(instr_dict)
+    header = f"{{'descr': '<u2', 'fortran_order': False, 'shape': ({len(table)},), }}"
+    # The magic string, version and header length take 10 bytes, and the
+    # header ends with a newline.
+    padding = -(10 + len(header) + 1) % NPY_HEADER_ALIGNMENT
+    header += " " * padding + "\n"
+    yield b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode()
+    if sys.byteorder == "big":
+        table.byteswap()
+    yield table.tobytes()
+
+
+def make_compressed_tables(instr_dict: InstrDict, sink: OutputTarget = None) -> bool:
+    sink = output_sink(sink)
+    changed = sink.write("compressed.out.h", emit_compressed_c(instr_dict))
+    changed |= sink.write("compressed.rs", emit_compressed_rust(instr_dict))
+    changed |= sink.write("compressed.npy", emit_compressed_npy(instr_dict))
+    return changed
@@ -79,15 +79,24 @@ def read_arg_lut_csv(filename: str) -> "dict[str, tuple[int, int]]":
         return {row[0]: (int(row[1]), int(row[2])) for row in csv_reader}
 
 
-arg_lut = read_arg_lut_csv("arg_lut.csv")
+def load_arg_lut() -> "dict[str, tuple[int, int]]":
+    """
+    Returns the argument lookup table: arg_lut.csv and the arguments that
+    are only used internally.
+    """
+    table = read_arg_lut_csv("arg_lut.csv")
+
+    # for mop
+    table["mop_r_t_30"] = (30, 30)
+    table["mop_r_t_27_26"] = (27, 26)
+    table["mop_r_t_21_20"] = (21, 20)
+    table["mop_rr_t_30"] = (30, 30)
+    table["mop_rr_t_27_26"] = (27, 26)
+    table["c_mop_t"] = (10, 8)
+    return table
+
 
-# for mop
-arg_lut["mop_r_t_30"] = (30, 30)
-arg_lut["mop_r_t_27_26"] = (27, 26)
-arg_lut["mop_r_t_21_20"] = (21, 20)
-arg_lut["mop_rr_t_30"] = (30, 30)
-arg_lut["mop_rr_t_27_26"] = (27, 26)
-arg_lut["c_mop_t"] = (10, 8)
+arg_lut = load_arg_lut()
 
 # dictionary containing the mapping of the argument to the what the fields in
 # the latex table should be
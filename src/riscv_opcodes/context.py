@@ -0,0 +1,104 @@
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from . import constants
+
+
+class OpcodesError(Exception):
+    """An error in the extension files or in what was asked to be generated."""
+
+
+class GenerationContext:
+    """
+    State shared by the parser and the generators: the argument table, which
+    grows the "field=alias" arguments found while parsing, the CSR and cause
+    tables and the warnings reported so far. Every parse and generator reads
+    the context of the current thread or task (see current_context), so runs
+    in different contexts can go on concurrently without seeing each other's
+    aliases or warnings.
+    """
+
+    def __init__(
+        self,
+        arg_lut: "Optional[dict[str, tuple[int, int]]]" = None,
+        csrs: "Optional[list[tuple[int, str]]]" = None,
+        csrs32: "Optional[list[tuple[int, str]]]" = None,
+        causes: "Optional[list[tuple[int, str]]]" = None,
+    ):
+        if arg_lut is None:
+            # Start from the table of constants.py, without the aliases that
+            # parses in the default context have added to it.
+            arg_lut = {
+                name: rng for name, rng in constants.arg_lut.items() if "=" not in name
+            }
+        self.arg_lut = dict(arg_lut)
+        self.csrs = list(constants.csrs if csrs is None else csrs)
+        self.csrs32 = list(constants.csrs32 if csrs32 is None else csrs32)
+        self.causes = list(constants.causes if causes is None else causes)
+        self.warnings: list[str] = []
+
+    def warn(self, message: str):
+        """Records a warning and logs it."""
+        self.warnings.append(message)
+        logging.warning(message)
+
+
+# Create a context from the current content of the CSV files
+def load_context() -> GenerationContext:
+    """
+    Returns a new context whose tables are read again from the CSV files
+    instead of being copied from constants.py, which read them at import
+    time, so edits made since then are taken into account.
+    """
+    return GenerationContext(
+        constants.load_arg_lut(),
+        constants.read_int_map_csv("csrs.csv"),
+        constants.read_int_map_csv("csrs32.csv"),
+        constants.read_int_map_csv("causes.csv"),
+    )
+
+
+# The context used outside of any generation_context block. It works on the
+# tables of constants.py directly, like the parser always has.
+default_context = GenerationContext()
+default_context.arg_lut = constants.arg_lut
+default_context.csrs = constants.csrs
+default_context.csrs32 = constants.csrs32
+default_context.causes = constants.causes
+
+_current_context: "ContextVar[GenerationContext]" = ContextVar(
+    "riscv_opcodes_context", default=default_context
+)
+
+
+def current_context() -> GenerationContext:
+    """Returns the context of the current thread or task."""
+    return _current_context.get()
+
+
+# Run a block in a generation context
+@contextmanager
+def generation_context(
+    context: Optional[GenerationContext] = None,
+) -> "Iterator[GenerationContext]":
+    """
+    Makes context (by default a new one) the current context for the
+    duration of the block. Contexts are per thread, so each thread of a pool
+    needs its own block.
+    """
+    if context is None:
+        context = GenerationContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+# Make a context the current one for the rest of a worker process
+def use_context(context: GenerationContext):
+    """Process pool initializer that installs a copy of the parent's context."""
+    _current_context.set(context)
@@ -0,0 +1,247 @@
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional, Union
+
+from .shared_utils import InstrDict
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+class DecodeLeaf(NamedTuple):
+    """
+    A leaf of the decode tree. The candidates are (name, match, mask) tuples
+    ordered from the most to the least specific encoding; the first one that
+    matches the word is the decoded instruction.
+    """
+
+    candidates: "tuple[tuple[str, int, int], ...]"
+
+
+class DecodeNode(NamedTuple):
+    """
+    An inner node of the decode tree. The word is masked with mask and the
+    result selects the child; a value without a child is an unknown encoding.
+    """
+
+    mask: int
+    children: "Dict[int, DecodeTree]"
+
+
+DecodeTree = Union[DecodeNode, DecodeLeaf]
+
+
+# Choose the single bit that best splits a set of candidates
+def best_split_bit(candidates: "list[tuple[str, int, int]]") -> Optional[int]:
+    """
+    Returns the bit that is fixed to 0 in some candidates and to 1 in others,
+    preferring the bit that splits them most evenly, or None if there is no
+    such bit. Candidates that leave the bit unconstrained end up on both sides.
+    """
+    best_bit = None
+    best_score = 0
+    bit = 1
+    all_masks = 0
+    for _, _, mask in candidates:
+        all_masks |= mask
+    while bit <= all_masks:
+        if all_masks & bit:
+            ones = zeros = 0
+            for _, match, mask in candidates:
+                if mask & bit:
+                    if match & bit:
+                        ones += 1
+                    else:
+                        zeros += 1
+            score = min(ones, zeros)
+            if score > best_score:
+                best_bit = bit
+                best_score = score
+        bit <<= 1
+    return best_bit
+
+
+# Recursively build the decode tree for a set of candidates
+def build_subtree(candidates: "list[tuple[str, int, int]]") -> DecodeTree:
+    if len(candidates) <= 1:
+        return DecodeLeaf(tuple(candidates))
+
+    # Bits fixed in every candidate can be switched on all at once, and
+    # every candidate lands in exactly one child.
+    common = -1
+    for _, _, mask in candidates:
+        common &= mask
+    first_match = candidates[0][1]
+    varying = 0
+    for _, match, _ in candidates:
+        varying |= (match ^ first_match) & common
+
+    if varying:
+        groups: "dict[int, list[tuple[str, int, int]]]" = {}
+        for candidate in candidates:
+            groups.setdefault(candidate[1] & varying, []).append(candidate)
+        return DecodeNode(
+            varying, {value: build_subtree(group) for value, group in groups.items()}
+        )
+
+    # Otherwise split on a single bit; candidates that don't constrain it
+    # are copied into both children.
+    bit = best_split_bit(candidates)
+    if bit is None:
+        # The remaining candidates overlap; pick by specificity at decode time.
+        return DecodeLeaf(tuple(candidates))
+    zeros = [c for c in candidates if not c[2] & bit or not c[1] & bit]
+    ones = [c for c in candidates if not c[2] & bit or c[1] & bit]
+    return DecodeNode(bit, {0: build_subtree(zeros), bit: build_subtree(ones)})
+
+
+# Order the instructions of a dictionary by decode priority
+def decode_candidates(instr_dict: InstrDict) -> "list[tuple[str, int, int]]":
+    """
+    Returns the (name, match, mask) tuples of the instructions, the one with
+    the most fixed bits first; ties keep the order of instr_dict. Where
+    encodings overlap (the pairs allowed by overlapping_instructions, such as
+    c_nop and c_addi), the first instruction that matches a word wins.
+    """
+    return sorted(
+        ((name, instr.match, instr.mask) for name, instr in instr_dict.items()),
+        key=lambda candidate: -bin(candidate[2]).count("1"),
+    )
+
+
+# Build a decode tree from an instruction dictionary
+def build_decode_tree(instr_dict: InstrDict) -> DecodeTree:
+    """
+    Compiles the match/mask values of an instruction dictionary into a decision
+    tree. Inner nodes switch on the fixed bits that best discriminate between
+    the remaining instructions. Instructions whose encodings overlap (such as
+    c_nop and c_addi) share a leaf, where they are tried in the order of
+    decode_candidates.
+    """
+    return build_subtree(decode_candidates(instr_dict))
+
+
+# Decode an array of instruction words with a decode tree
+def decode_subtree_many(
+    tree: DecodeTree,
+    words: "np.ndarray",
+    indices: "np.ndarray",
+    result: "np.ndarray",
+    name_index: "dict[str, int]",
+):
+    """
+    Decodes words[indices] into result[indices]. Each inner node partitions
+    the indices by the bits it switches on (at the top of the tree these are
+    the quadrant and major opcode bits) and each leaf tests its candidates
+    against all of its words at once, so the Python overhead is per tree node
+    rather than per word.
+    """
+    import numpy as np
+
+    if isinstance(tree, DecodeLeaf):
+        pending = indices
+        for name, match, mask in tree.candidates:
+            hit = (words[pending] & np.uint32(mask)) == np.uint32(match)
+            result[pending[hit]] = name_index[name]
+            pending = pending[~hit]
+            if not pending.size:
+                break
+        return
+
+    keys = words[indices] & np.uint32(tree.mask)
+    order = np.argsort(keys, kind="stable")
+    values, starts = np.unique(keys[order], return_index=True)
+    ends = list(starts[1:]) + [len(order)]
+    for value, start, end in zip(values.tolist(), starts.tolist(), ends):
+        child = tree.children.get(value)
+        if child is not None:
+            decode_subtree_many(
+                child, words, indices[order[start:end]], result, name_index
+            )
+
+
+# Compute the depth of a decode tree
+def tree_depth(tree: DecodeTree) -> int:
+    if isinstance(tree, DecodeLeaf):
+        return 0
+    return 1 + max(tree_depth(child) for child in tree.children.values())
+
+
+class Decoder:
+    """
+    Decodes instruction words to instruction names using a decode tree built
+    from an instruction dictionary, typically the result of create_inst_dict.
+
+    Compressed instructions only fix bits in the low half of the word, so a
+    16-bit instruction can be passed on its own or with arbitrary upper bits.
+    Instructions from different base ISAs can share an encoding (c_flw and
+    c_ld, for example), so the dictionary should be built only from the
+    extensions of the target.
+    """
+
+    def __init__(self, instr_dict: InstrDict):
+        self.tree = build_decode_tree(instr_dict)
+        self.names = tuple(instr_dict)
+        self.extensions = tuple(instr.extension for instr in instr_dict.values())
+        self._name_index = {name: i for i, name in enumerate(self.names)}
+
+    def decode(self, word: int) -> Optional[str]:
+        """Returns the name of the instruction word, or None if it is unknown."""
+        node = self.tree
+        while isinstance(node, DecodeNode):
+            child = node.children.get(word & node.mask)
+            if child is None:
+                return None
+            node = child
+        for name, match, mask in node.candidates:
+            if word & mask == match:
+                return name
+        return None
+
+    def decode_many(self, words: "np.ndarray") -> "np.ndarray":
+        """
+        Decodes an array of instruction words at once. Returns an array of
+        indices into self.names, with -1 for unknown encodings. Requires numpy.
+        """
+        import numpy as np
+
+        words = np.asarray(words, dtype=np.uint32).ravel()
+        result = np.full(len(words), -1, dtype=np.int32)
+        if len(words):
+            decode_subtree_many(
+                self.tree,
+                words,
+                np.arange(len(words)),
+                result,
+                self._name_index,
+            )
+        return result
+
+    def instruction_counts(self, decoded: "np.ndarray") -> "dict[str, int]":
+        """Returns the number of occurrences of each instruction in decoded."""
+        import numpy as np
+
+        counts = np.bincount(decoded[decoded >= 0], minlength=len(self.names))
+        return {
+            self.names[i]: count for i, count in enumerate(counts.tolist()) if count
+        }
+
+    def extension_counts(self, decoded: "np.ndarray") -> "dict[str, int]":
+        """
+        Returns the number of instructions in decoded that belong to each
+        extension. Instructions that are part of several extensions count
+        towards each of them.
+        """
+        import numpy as np
+
+        counts = np.bincount(decoded[decoded >= 0], minlength=len(self.names))
+        extension_counts: "dict[str, int]" = {}
+        for i, count in enumerate(counts.tolist()):
+            if count:
+                for extension in self.extensions[i]:
+                    extension_counts[extension] = (
+                        extension_counts.get(extension, 0) + count
+                    )
+        return extension_counts
+
+    def depth(self) -> int:
+        """Returns the maximum number of inner nodes visited by decode."""
+        return tree_depth(self.tree)
@@ -0,0 +1,90 @@
+import os
+from collections.abc import Iterable, Iterator
+from typing import Union
+
+from .output_utils import DirectorySink, OutputTarget, output_sink
+from .resources import resource_root
+
+# Resources read by the parser for every instruction dictionary.
+PARSER_RESOURCES = ["arg_lut.csv"]
+
+# Resources read by the generators of each output, besides the extension files.
+OUTPUT_RESOURCES = {
+    "encoding.out.h": ["encoding.h", "csrs.csv", "csrs32.csv", "causes.csv"],
+    "inst.chisel": ["csrs.csv", "csrs32.csv", "causes.csv"],
+    "inst.spinalhdl": ["csrs.csv", "csrs32.csv", "causes.csv"],
+    "inst.sverilog": ["csrs.csv", "csrs32.csv"],
+    "inst.rs": ["csrs.csv", "csrs32.csv", "causes.csv"],
+    "inst.go": ["csrs.csv"],
+}
+
+
+# Find the file system path of a resource
+def resource_file_path(
+    resource: str, start: "Union[str, os.PathLike[str], None]" = os.curdir
+) -> str:
+    """
+    Returns the path of a resource relative to directory start, or its
+    absolute path if it lies outside of it or start is None.
+    """
+    path = os.path.abspath(str(resource_root() / resource))
+    if start is None:
+        return path
+    relative = os.path.relpath(path, start)
+    return path if relative.startswith("..") else relative
+
+
+# Escape a path for use in a make rule
+def escape_make_path(path: str) -> str:
+    return path.replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+
+# Generate a make rule listing the prerequisites of an output
+def emit_depfile(
+    target: str,
+    resources: "Iterable[str]",
+    directory: "Union[str, os.PathLike[str], None]" = os.curdir,
+) -> Iterator[str]:
+    """
+    Yields a depfile in the format written by gcc -MD -MP, which make, ninja
+    and bazel understand: a rule with the output as target and the files the
+    resources are read from as prerequisites, one per line, followed by an
+    empty rule for each prerequisite so that make doesn't stop when one of
+    them is deleted. Like the target, the prerequisites are relative to the
+    directory the depfile is written into; they are absolute if they lie
+    outside of it or directory is None.
+    """
+    paths = [
+        escape_make_path(resource_file_path(resource, directory))
+        for resource in resources
+    ]
+    yield f"{escape_make_path(target)}:"
+    for path in paths:
+        yield f" \\\n  {path}"
+    yield "\n"
+    for path in paths:
+        yield f"\n{path}:\n"
+
+
+# List the resources an output depends on
+def depfile_resources(target: str, extension_files: "list[str]") -> "list[str]":
+    """
+    Returns the extension files target was generated from followed by the
+    other resources its generator reads.
+    """
+    resources = dict.fromkeys(extension_files)
+    resources.update(dict.fromkeys(PARSER_RESOURCES + OUTPUT_RESOURCES.get(target, [])))
+    return list(resources)
+
+
+# Write the depfile of an output next to it
+def make_depfile(
+    target: str, extension_files: "list[str]", sink: OutputTarget = None
+) -> bool:
+    output = output_sink(sink)
+    # Outputs that aren't files have no directory to be relative to.
+    directory = output.directory if isinstance(output, DirectorySink) else None
+    return output.write(
+        f"{target}.d",
+        emit_depfile(target, depfile_resources(target, extension_files), directory),
+    )
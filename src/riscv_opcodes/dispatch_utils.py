@@ -0,0 +1,337 @@
+from collections.abc import Iterator
+from itertools import combinations
+from typing import NamedTuple
+
+from .decoder import decode_candidates
+from .output_utils import OutputTarget, output_sink
+from .shared_utils import InstrDict
+
+# Number of major opcodes, the bits [6:2] of a 32-bit instruction.
+MAJOR_OPCODE_COUNT = 32
+
+
+class DispatchField(NamedTuple):
+    """A bit field that can index the second level of the dispatch tables."""
+
+    name: str
+    msb: int
+    lsb: int
+
+    @property
+    def width(self) -> int:
+        return self.msb - self.lsb + 1
+
+    def extract(self, word: int) -> int:
+        return (word >> self.lsb) & ((1 << self.width) - 1)
+
+
+# The fields the second level may be indexed by, alone or two at a time.
+DISPATCH_FIELDS = [
+    DispatchField("funct3", 14, 12),
+    DispatchField("funct7", 31, 25),
+    DispatchField("funct6", 31, 26),
+    DispatchField("funct5", 31, 27),
+    DispatchField("funct2", 26, 25),
+    DispatchField("rs2", 24, 20),
+    DispatchField("rs1", 19, 15),
+    DispatchField("rd", 11, 7),
+]
+
+# Most bits a second-level table is indexed by.
+MAX_INDEX_BITS = 10
+
+
+class DispatchBucket(NamedTuple):
+    """
+    The second level of the tables for one major opcode. A word selects the
+    slot whose index is the concatenation of its fields, most significant
+    field first; the slot lists the instructions the word can still be, most
+    specific first, and the first one that matches is the decoded instruction.
+    """
+
+    fields: "tuple[DispatchField, ...]"
+    slots: "list[tuple[str, ...]]"
+
+
+# Concatenate the fields of a word
+def field_index(word: int, fields: "tuple[DispatchField, ...]") -> int:
+    index = 0
+    for field in fields:
+        index = index << field.width | field.extract(word)
+    return index
+
+
+# Sort the candidates of a bucket into the slots of a second-level table
+def bucket_slots(
+    candidates: "list[tuple[str, int, int]]", fields: "tuple[DispatchField, ...]"
+) -> "list[tuple[str, ...]]":
+    """
+    Returns the candidates of each slot, keeping their order. A candidate
+    that leaves some of the index bits free goes to every slot it can match.
+    """
+    size = 1 << sum(field.width for field in fields)
+    slots: list[list[str]] = [[] for _ in range(size)]
+    for name, match, mask in candidates:
+        value = field_index(match, fields)
+        free = ~field_index(mask, fields) & (size - 1)
+        index = free
+        while True:
+            slots[value | index].append(name)
+            if not index:
+                break
+            index = (index - 1) & free
+    return [tuple(slot) for slot in slots]
+
+
+# Choose the fields that best split the candidates of a major opcode
+def build_dispatch_bucket(candidates: "list[tuple[str, int, int]]") -> DispatchBucket:
+    """
+    Tries no field, each field of DISPATCH_FIELDS and each pair of disjoint
+    fields of at most MAX_INDEX_BITS bits. It keeps the choice where
+    instructions share a slot with the fewest other candidates on average,
+    then the one with the shortest longest slot, then the smallest table.
+    Only fields that some candidate fixes a bit of are tried.
+    """
+    all_masks = 0
+    for _, _, mask in candidates:
+        all_masks |= mask
+    fields = [field for field in DISPATCH_FIELDS if field_index(all_masks, (field,))]
+    choices: list[tuple[DispatchField, ...]] = [()]
+    choices += [(field,) for field in fields]
+    choices += [
+        pair
+        for pair in combinations(fields, 2)
+        if pair[0].lsb > pair[1].msb or pair[1].lsb > pair[0].msb
+        if pair[0].width + pair[1].width <= MAX_INDEX_BITS
+    ]
+    best = None
+    best_cost = None
+    for choice in choices:
+        slots = bucket_slots(candidates, choice)
+        lengths = [len(slot) for slot in slots]
+        total = sum(lengths)
+        average = sum(length * length for length in lengths) / total if total else 0
+        cost = (average, max(lengths), len(slots))
+        if best_cost is None or cost < best_cost:
+            best = DispatchBucket(choice, slots)
+            best_cost = cost
+    assert best is not None
+    return best
+
+
+# Build the dispatch tables of the 32-bit instructions
+def build_dispatch_tables(instr_dict: InstrDict) -> "list[DispatchBucket]":
+    """
+    Returns a bucket for each major opcode, indexed by the bits [6:2]. The
+    candidates keep the order of decode_candidates, so the tables decode
+    every 32-bit word like the Python Decoder.
+    """
+    candidates = [
+        candidate
+        for candidate in decode_candidates(instr_dict)
+        if candidate[1] & 0x3 == 0x3 and candidate[2] & 0x3 == 0x3
+    ]
+    buckets = []
+    for opcode in range(MAJOR_OPCODE_COUNT):
+        word = opcode << 2 | 0x3
+        buckets.append(
+            build_dispatch_bucket(
+                [
+                    (name, match, mask)
+                    for name, match, mask in candidates
+                    if word & mask & 0x7F == match & 0x7F
+                ]
+            )
+        )
+    return buckets
+
+
+class FlatDispatchTables(NamedTuple):
+    """
+    The dispatch tables as arrays. Each bucket is (high shift, high bits,
+    low shift, low bits, first slot); each slot is (first entry, entry
+    count); each entry is (match, mask, instruction id).
+    """
+
+    buckets: "list[tuple[int, int, int, int, int]]"
+    slots: "list[tuple[int, int]]"
+    entries: "list[tuple[int, int, int]]"
+
+
+# Lay the dispatch tables out as arrays
+def flatten_dispatch_tables(instr_dict: InstrDict) -> FlatDispatchTables:
+    """
+    Instruction ids are the position of the instruction in instr_dict plus
+    one, like the riscv_insn enumeration of decode.out.h; slots with the same
+    candidates share their entries.
+    """
+    ids = {name: i + 1 for i, name in enumerate(instr_dict)}
+    tables = FlatDispatchTables([], [], [])
+    entry_offsets: dict[tuple[str, ...], int] = {}
+    for bucket in build_dispatch_tables(instr_dict):
+        # A bucket with a single field uses it as the low field.
+        high, low = ((None,) * 2 + bucket.fields)[-2:]
+        tables.buckets.append(
+            (
+                high.lsb if high else 0,
+                high.width if high else 0,
+                low.lsb if low else 0,
+                low.width if low else 0,
+                len(tables.slots),
+            )
+        )
+        for slot in bucket.slots:
+            if slot not in entry_offsets:
+                entry_offsets[slot] = len(tables.entries)
+                tables.entries.extend(
+                    (instr_dict[name].match, instr_dict[name].mask, ids[name])
+                    for name in slot
+                )
+            tables.slots.append((entry_offsets[slot], len(slot)))
+    return tables
+
+
+def emit_c_dispatch(instr_dict: InstrDict) -> Iterator[str]:
+    tables = flatten_dispatch_tables(instr_dict)
+    yield f"""/* Automatically generated by parse_opcodes. */
+#ifndef RISCV_DISPATCH_H
+#define RISCV_DISPATCH_H
+
+#include <stdint.h>
+
+struct riscv_dispatch_bucket {{
+  uint8_t high_shift, high_bits, low_shift, low_bits;
+  uint32_t first_slot;
+}};
+
+struct riscv_dispatch_slot {{
+  uint32_t first_entry, entry_count;
+}};
+
+struct riscv_dispatch_entry {{
+  uint32_t match, mask;
+  uint16_t insn;
+}};
+
+/* Instruction ids index riscv_dispatch_names; 0 is an unknown instruction. */
+static const char *const riscv_dispatch_names[{len(instr_dict) + 1}] = {{
+  "unknown",
+"""
+    for name in instr_dict:
+        yield f'  "{name}",\n'
+    yield f"""}};
+
+static const struct riscv_dispatch_bucket riscv_dispatch_buckets[{MAJOR_OPCODE_COUNT}] = {{
+"""
+    for bucket in tables.buckets:
+        yield f"  {{{', '.join(map(str, bucket))}}},\n"
+    yield f"""}};
+
+static const struct riscv_dispatch_slot riscv_dispatch_slots[{len(tables.slots)}] = {{
+"""
+    for slot in tables.slots:
+        yield f"  {{{slot[0]}, {slot[1]}}},\n"
+    yield f"""}};
+
+static const struct riscv_dispatch_entry riscv_dispatch_entries[{max(len(tables.entries), 1)}] = {{
+"""
+    for match, mask, insn in tables.entries:
+        yield f"  {{{hex(match)}, {hex(mask)}, {insn}}},\n"
+    if not tables.entries:
+        # C has no empty arrays.
+        yield "  {0, 0, 0},\n"
+    yield """};
+
+/* Returns the id of a 32-bit instruction, or 0 for unknown and 16-bit words. */
+static inline uint16_t riscv_dispatch(uint32_t insn)
+{
+  const struct riscv_dispatch_bucket *bucket;
+  const struct riscv_dispatch_slot *slot;
+  uint32_t index, i;
+  if ((insn & 0x3) != 0x3)
+    return 0;
+  bucket = &riscv_dispatch_buckets[(insn >> 2) & 0x1f];
+  index = ((insn >> bucket->high_shift) & ((1u << bucket->high_bits) - 1))
+          << bucket->low_bits
+        | ((insn >> bucket->low_shift) & ((1u << bucket->low_bits) - 1));
+  slot = &riscv_dispatch_slots[bucket->first_slot + index];
+  for (i = slot->first_entry; i < slot->first_entry + slot->entry_count; i++)
+    if ((insn & riscv_dispatch_entries[i].mask) == riscv_dispatch_entries[i].match)
+      return riscv_dispatch_entries[i].insn;
+  return 0;
+}
+
+#endif
+"""
+
+
+def emit_rust_dispatch(instr_dict: InstrDict) -> Iterator[str]:
+    tables = flatten_dispatch_tables(instr_dict)
+    yield f"""
+/* Automatically generated by parse_opcodes */
+pub struct DispatchBucket {{
+    pub high_shift: u32,
+    pub high_bits: u32,
+    pub low_shift: u32,
+    pub low_bits: u32,
+    pub first_slot: usize,
+}}
+
+pub struct DispatchEntry {{
+    pub match_: u32,
+    pub mask: u32,
+    pub insn: u16,
+}}
+
+/* Instruction ids index DISPATCH_NAMES; 0 is an unknown instruction. */
+pub static DISPATCH_NAMES: [&str; {len(instr_dict) + 1}] = [
+    "unknown",
+"""
+    for name in instr_dict:
+        yield f'    "{name}",\n'
+    yield f"""];
+
+pub static DISPATCH_BUCKETS: [DispatchBucket; {MAJOR_OPCODE_COUNT}] = [
+"""
+    for high_shift, high_bits, low_shift, low_bits, first_slot in tables.buckets:
+        yield (
+            f"    DispatchBucket {{ high_shift: {high_shift}, high_bits: {high_bits}, "
+            f"low_shift: {low_shift}, low_bits: {low_bits}, first_slot: {first_slot} }},\n"
+        )
+    yield f"""];
+
+/* (first entry, entry count) */
+pub static DISPATCH_SLOTS: [(usize, usize); {len(tables.slots)}] = [
+"""
+    for slot in tables.slots:
+        yield f"    ({slot[0]}, {slot[1]}),\n"
+    yield f"""];
+
+pub static DISPATCH_ENTRIES: [DispatchEntry; {len(tables.entries)}] = [
+"""
+    for match, mask, insn in tables.entries:
+        yield f"    DispatchEntry {{ match_: {hex(match)}, mask: {hex(mask)}, insn: {insn} }},\n"
+    yield """];
+
+/* Returns the id of a 32-bit instruction, or 0 for unknown and 16-bit words. */
+pub fn dispatch(insn: u32) -> u16 {
+    if insn & 0x3 != 0x3 {
+        return 0;
+    }
+    let bucket = &DISPATCH_BUCKETS[((insn >> 2) & 0x1f) as usize];
+    let index = ((insn >> bucket.high_shift) & ((1 << bucket.high_bits) - 1)) << bucket.low_bits
+        | ((insn >> bucket.low_shift) & ((1 << bucket.low_bits) - 1));
+    let (first, count) = DISPATCH_SLOTS[bucket.first_slot + index as usize];
+    DISPATCH_ENTRIES[first..first + count]
+        .iter()
+        .find(|entry| insn & entry.mask == entry.match_)
+        .map_or(0, |entry| entry.insn)
+}
+"""
+
+
+def make_dispatch_tables(instr_dict: InstrDict, sink: OutputTarget = None) -> bool:
+    sink = output_sink(sink)
+    changed = sink.write("dispatch.out.h", emit_c_dispatch(instr_dict))
+    changed |= sink.write("dispatch.rs", emit_rust_dispatch(instr_dict))
+    return changed
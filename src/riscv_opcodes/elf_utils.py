@@ -0,0 +1,293 @@
+import argparse
+import json
+import logging
+import mmap
+import struct
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from .cache import InstrDictCache, default_cache_dir
+from .context import OpcodesError
+from .decoder import Decoder
+from .shared_utils import create_inst_dict, select_extension_files
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ELF_MAGIC = b"\x7fELF"
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+EM_RISCV = 243
+SHT_NOBITS = 8
+SHF_EXECINSTR = 0x4
+PT_LOAD = 1
+PF_X = 0x1
+
+# struct formats of the ELF file, section and program headers, by ELF class
+ELF_HEADER = {ELFCLASS32: "<HHIIIIIHHHHHH", ELFCLASS64: "<HHIQQQIHHHHHH"}
+SECTION_HEADER = {ELFCLASS32: "<IIIIIIIIII", ELFCLASS64: "<IIQQQQIIQQ"}
+PROGRAM_HEADER = {ELFCLASS32: "<IIIIIIII", ELFCLASS64: "<IIQQQQQQ"}
+
+# Extensions left out of the default decoders. Zcmp and Zcmt reuse the
+# encodings of the compressed double-precision loads and stores of rv_c_d,
+# which every RV64GC binary may use.
+DEFAULT_EXCLUDED_EXTENSIONS = {"rv_zcmp", "rv_zcmt"}
+
+
+class ElfError(Exception):
+    """Raised for files that are not little-endian RISC-V ELF files."""
+
+
+class CodeRange(NamedTuple):
+    """A range of the file holding instructions."""
+
+    offset: int
+    size: int
+
+
+# Find the executable sections of an ELF file
+def executable_ranges(data: memoryview) -> "tuple[int, list[CodeRange]]":
+    """
+    Returns the ELF class and the file ranges of the executable sections.
+    Only the headers are read. If the file has no section headers the
+    executable PT_LOAD segments are used instead.
+    """
+    if bytes(data[:4]) != ELF_MAGIC or len(data) < 52:
+        raise ElfError("not an ELF file")
+    elf_class, elf_data = data[4], data[5]
+    if elf_class not in ELF_HEADER:
+        raise ElfError(f"unknown ELF class {elf_class}")
+    if elf_data != ELFDATA2LSB:
+        raise ElfError("not a little-endian ELF file")
+
+    (_, machine, _, _, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum, _) = (
+        struct.unpack_from(ELF_HEADER[elf_class], data, 16)
+    )
+    if machine != EM_RISCV:
+        raise ElfError(f"not a RISC-V ELF file (e_machine is {machine})")
+
+    ranges = []
+    try:
+        if shoff:
+            if shnum == 0:
+                # Extended section numbering; the count is in section 0.
+                shnum = struct.unpack_from(SECTION_HEADER[elf_class], data, shoff)[5]
+            for i in range(shnum):
+                (_, sh_type, sh_flags, _, sh_offset, sh_size, *_) = struct.unpack_from(
+                    SECTION_HEADER[elf_class], data, shoff + i * shentsize
+                )
+                if sh_flags & SHF_EXECINSTR and sh_type != SHT_NOBITS and sh_size:
+                    ranges.append(CodeRange(sh_offset, sh_size))
+        else:
+            for i in range(phnum):
+                header = struct.unpack_from(
+                    PROGRAM_HEADER[elf_class], data, phoff + i * phentsize
+                )
+                if elf_class == ELFCLASS64:
+                    p_type, p_flags, p_offset, _, _, p_filesz, *_ = header
+                else:
+                    p_type, p_offset, _, _, p_filesz, _, p_flags, _ = header
+                if p_type == PT_LOAD and p_flags & PF_X and p_filesz:
+                    ranges.append(CodeRange(p_offset, p_filesz))
+    except struct.error as e:
+        raise ElfError(f"truncated header: {e}") from e
+
+    for code in ranges:
+        if code.offset + code.size > len(data):
+            raise ElfError(f"section at offset {code.offset:#x} is truncated")
+    return elf_class, ranges
+
+
+# Split a stream of 16-bit parcels into instruction words
+def instruction_words(parcels: "np.ndarray") -> "np.ndarray":
+    """
+    Returns the instruction words in a little-endian array of 16-bit parcels.
+    An instruction whose parcel has bits [1:0] set to 11 is 32 bits long and
+    any other instruction is 16 bits long. Since a parcel that isn't 32-bit
+    always ends an instruction, the parcels following it alternate between
+    the first and second half of 32-bit instructions until the next such
+    parcel, which lets the instruction boundaries be found without walking
+    the parcels one by one. Longer encodings aren't used by any extension
+    and are treated like 32-bit ones.
+    """
+    import numpy as np
+
+    count = len(parcels)
+    if not count:
+        return np.zeros(0, dtype=np.uint32)
+    long = (parcels & 3) == 3
+    positions = np.arange(count)
+    # Index of the last 16-bit parcel before each parcel, or -1
+    last_short = np.maximum.accumulate(np.where(long, -1, positions))
+    previous_short = np.concatenate(([-1], last_short[:-1]))
+    # The parcel after a 16-bit parcel starts an instruction, and so does
+    # every other parcel in a run of 32-bit parcels after it.
+    start = (positions - previous_short - 1) % 2 == 0
+
+    first = parcels[start].astype(np.uint32)
+    is_long = long[start]
+    starts = positions[start]
+    # A 32-bit instruction cut off at the end of the section is dropped.
+    complete = ~is_long | (starts + 1 < count)
+    upper = np.zeros(len(starts), dtype=np.uint32)
+    upper[is_long & complete] = parcels[starts[is_long & complete] + 1]
+    return (first | (upper << np.uint32(16)))[complete]
+
+
+# Pick extensions that provide every instruction used
+def required_extensions(
+    instruction_counts: "dict[str, int]", decoder: Decoder
+) -> "dict[str, int]":
+    """
+    Returns the extensions needed for the given instructions, with the number
+    of instructions attributed to each. An instruction that is part of several
+    extensions (such as those shared by Zbb and Zbkb) is attributed to an
+    extension that is required anyway if possible, and otherwise to the one
+    providing most of the remaining instructions.
+    """
+    extensions_of = dict(zip(decoder.names, decoder.extensions))
+    remaining = dict(instruction_counts)
+    required: "dict[str, int]" = {}
+    # Extensions that are the only choice for some instruction are required.
+    chosen = {
+        extensions_of[name][0] for name in remaining if len(extensions_of[name]) == 1
+    }
+    while remaining:
+        for name in list(remaining):
+            for extension in extensions_of[name]:
+                if extension in chosen:
+                    count = remaining.pop(name)
+                    required[extension] = required.get(extension, 0) + count
+                    break
+        if remaining:
+            candidates: "Counter[str]" = Counter()
+            for name, count in remaining.items():
+                for extension in extensions_of[name]:
+                    candidates[extension] += count
+            chosen.add(candidates.most_common(1)[0][0])
+    return dict(sorted(required.items()))
+
+
+# List the extension files the default decoder of a base ISA uses
+def default_extensions(xlen: int) -> "list[str]":
+    """
+    Returns the ratified extensions of the base ISA (rv_* and rv<xlen>_*)
+    except those of DEFAULT_EXCLUDED_EXTENSIONS.
+    """
+    names = [
+        path.removeprefix("extensions/")
+        for path in select_extension_files(["rv_*", f"rv{xlen}_*"])
+    ]
+    return [name for name in names if name not in DEFAULT_EXCLUDED_EXTENSIONS]
+
+
+class ElfScan(NamedTuple):
+    """Instructions found in the executable sections of an ELF file."""
+
+    elf_class: int
+    total: int
+    unknown: int
+    instructions: "dict[str, int]"
+
+
+# Decode the executable sections of an ELF file
+def scan_elf(path: Path, decoders: "dict[int, Decoder]") -> ElfScan:
+    """
+    Memory-maps an ELF file and decodes the instructions in its executable
+    sections, using the decoder for its ELF class. The sections are decoded
+    in place, without copying them out of the mapping.
+    """
+    import numpy as np
+
+    with open(path, "rb") as elf_file:
+        with mmap.mmap(elf_file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            with memoryview(mapping) as data:
+                elf_class, ranges = executable_ranges(data)
+                decoder = decoders[elf_class]
+                instructions: "Counter[str]" = Counter()
+                total = unknown = 0
+                for code in ranges:
+                    parcels = np.frombuffer(
+                        data, dtype="<u2", count=code.size // 2, offset=code.offset
+                    )
+                    decoded = decoder.decode_many(instruction_words(parcels))
+                    del parcels
+                    total += len(decoded)
+                    unknown += int((decoded < 0).sum())
+                    instructions.update(decoder.instruction_counts(decoded))
+    return ElfScan(elf_class, total, unknown, dict(instructions))
+
+
+def elf_main(argv: "list[str]"):
+    parser = argparse.ArgumentParser(
+        prog="riscv_opcodes elf",
+        description="Report the extensions required by the code in RISC-V ELF files",
+    )
+    parser.add_argument("files", nargs="+", type=Path, help="ELF files to scan")
+    parser.add_argument(
+        "--extensions",
+        nargs="+",
+        help="Extensions to decode against. This is a glob of the rv_.. files; "
+        "by default the ratified extensions of the base ISA of each file are used, "
+        "except Zcmp and Zcmt which conflict with the compressed floating-point "
+        "loads and stores.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=default_cache_dir(),
+        help="Directory of the parsed instruction cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the extension files instead of using the cache",
+    )
+
+    args = parser.parse_args(argv)
+
+    try:
+        import numpy as _  # pylint: disable=unused-import
+    except ImportError as e:
+        raise OpcodesError("The elf command requires numpy") from e
+
+    create = (
+        create_inst_dict
+        if args.no_cache
+        else InstrDictCache(args.cache_dir).create_inst_dict
+    )
+    decoders = {
+        elf_class: Decoder(create(args.extensions or default_extensions(xlen), False))
+        for elf_class, xlen in ((ELFCLASS32, 32), (ELFCLASS64, 64))
+    }
+
+    results: "dict[str, Any]" = {}
+    failed = False
+    for path in args.files:
+        try:
+            scan = scan_elf(path, decoders)
+        except (OSError, ValueError, ElfError) as e:
+            logging.error(f"{path}: {e}")
+            failed = True
+            continue
+        extensions = required_extensions(scan.instructions, decoders[scan.elf_class])
+        results[str(path)] = {
+            "total": scan.total,
+            "unknown": scan.unknown,
+            "extensions": extensions,
+        }
+        if not args.json:
+            print(
+                f"{path}: {' '.join(extensions)} "
+                f"({scan.total} instructions, {scan.unknown} unknown)"
+            )
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,447 @@
+import logging
+import os
+from collections.abc import Collection
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Any, NamedTuple, Optional, Union
+
+from .batch_utils import BATCH_OUTPUTS, BatchConfig
+from .c_utils import emit_c, emit_c_decoder
+from .cache import InstrDictCache
+from .chisel_utils import emit_chisel
+from .compressed_utils import (
+    emit_compressed_c,
+    emit_compressed_npy,
+    emit_compressed_rust,
+)
+from .constants import emitted_pseudo_ops
+from .context import (
+    GenerationContext,
+    OpcodesError,
+    current_context,
+    generation_context,
+    use_context,
+)
+from .depfile_utils import depfile_resources, make_depfile
+from .dispatch_utils import emit_c_dispatch, emit_rust_dispatch
+from .go_utils import emit_go
+from .json_utils import emit_json
+from .latex_utils import (
+    emit_latex_table,
+    emit_priv_latex_table,
+    latex_file_filters,
+    latex_tables,
+    priv_latex_tables,
+)
+from .output_utils import (
+    DirectorySink,
+    Emitter,
+    OutputSink,
+    OutputTarget,
+    output_sink,
+    render_output_bytes,
+)
+from .rust_utils import emit_rust
+from .shared_utils import (
+    InstrModel,
+    add_segmented_vls_insn,
+    capture_log_records,
+    file_filter_selects,
+    replay_log_records,
+    select_extension_files,
+)
+from .sverilog_utils import emit_sverilog
+from .svg_utils import emit_svg
+
+
+class EmitterTask(NamedTuple):
+    """An emitter call and the name of the output it generates."""
+
+    emit: Emitter
+    args: "tuple[Any, ...]"
+    output: str
+
+
+# Run an emitter task, capturing its log messages
+def run_captured_emitter_task(
+    task: EmitterTask, sink: Optional[OutputSink]
+) -> "tuple[list[logging.LogRecord], Optional[OpcodesError], Union[bool, bytes]]":
+    """
+    Returns the records logged by the emitter, the error it failed with, if
+    any, and either whether it changed its output in sink or, without a sink,
+    the output.
+    """
+    error = None
+    result: Union[bool, bytes] = False
+    with capture_log_records() as log_records:
+        try:
+            chunks = task.emit(*task.args)
+            result = (
+                render_output_bytes(chunks)
+                if sink is None
+                else sink.write(task.output, chunks)
+            )
+        except OpcodesError as e:
+            error = e
+    return log_records, error, result
+
+
+# Log whether an output was written
+def log_output_status(output: str, changed: bool):
+    if changed:
+        logging.info(f"{output} generated successfully")
+    else:
+        logging.info(f"{output} is unchanged")
+
+
+# Run emitter tasks, in a process pool if jobs > 1
+def run_emitter_tasks(
+    tasks: "list[EmitterTask]", jobs: int = 1, sink: OutputTarget = None
+) -> "list[str]":
+    """
+    Runs the emitters one after the other, or concurrently in a pool of up to
+    jobs worker processes, and writes their outputs to sink. The emitters
+    only read the instruction dictionaries, which are sent to the workers
+    along with the current context and the aliases it registered while
+    parsing. Workers write to a directory sink themselves and send any other
+    output back to be written here. The messages of each emitter are logged
+    in task order as the emitters finish, so the log is the same either way.
+    Returns the outputs whose content changed.
+    """
+    sink = output_sink(sink)
+    changed_outputs = []
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            changed = sink.write(task.output, task.emit(*task.args))
+            log_output_status(task.output, changed)
+            if changed:
+                changed_outputs.append(task.output)
+        return changed_outputs
+
+    worker_sink = sink if isinstance(sink, DirectorySink) else None
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(tasks)),
+        initializer=use_context,
+        initargs=(current_context(),),
+    ) as executor:
+        for task, (log_records, error, result) in zip(
+            tasks,
+            executor.map(run_captured_emitter_task, tasks, repeat(worker_sink)),
+        ):
+            replay_log_records(log_records)
+            if error is not None:
+                raise error
+            changed = (
+                sink.write(task.output, [result])
+                if isinstance(result, bytes)
+                else result
+            )
+            log_output_status(task.output, changed)
+            if changed:
+                changed_outputs.append(task.output)
+    return changed_outputs
+
+
+# Return the file filter an output selects its extension files with
+def output_file_filter(output: str, extensions: "list[str]") -> "list[str]":
+    """
+    The latex tables select their own extensions; every other output is
+    generated from the extensions given on the command line.
+    """
+    latex_outputs = {
+        "instr-table.tex": latex_tables,
+        "priv-instr-table.tex": priv_latex_tables,
+    }
+    if output not in latex_outputs:
+        return extensions
+    return [
+        fil
+        for file_filter in latex_file_filters(latex_outputs[output]())
+        for fil in file_filter
+    ]
+
+
+# List the extension files an output is generated from
+def output_extension_files(
+    output: str, extensions: "list[str]", model: InstrModel
+) -> "list[str]":
+    """
+    Returns the resource paths of the extension files read to generate the
+    output: the files its file filter selects and the files they import.
+    """
+    return model.dependencies(output_file_filter(output, extensions))
+
+
+# Check whether changed files affect an output
+def output_affected(
+    output: str,
+    extensions: "list[str]",
+    model: InstrModel,
+    changed_files: "Collection[str]",
+) -> bool:
+    """
+    An output is affected by the files it was generated from and by any
+    extension file its file filter selects, so that adding or deleting such
+    a file generates it again even though the deleted file is no longer one
+    of its dependencies.
+    """
+    file_filter = output_file_filter(output, extensions)
+    return any(
+        file_filter_selects(file_filter, file_name) for file_name in changed_files
+    ) or not set(changed_files).isdisjoint(
+        depfile_resources(output, output_extension_files(output, extensions, model))
+    )
+
+
+def generate_extensions(
+    extensions: list[str],
+    include_pseudo: bool,
+    c: bool,
+    chisel: bool,
+    spinalhdl: bool,
+    sverilog: bool,
+    rust: bool,
+    go: bool,
+    latex: bool,
+    svg: bool,
+    warn_overlap: bool = False,
+    cache: Optional[InstrDictCache] = None,
+    jobs: int = 1,
+    depfiles: bool = False,
+    sink: OutputTarget = None,
+    context: Optional[GenerationContext] = None,
+    model: Optional[InstrModel] = None,
+    changed_files: "Optional[Collection[str]]" = None,
+    c_decoder: bool = False,
+    compressed_table: bool = False,
+    dispatch: bool = False,
+    rust_decoder: bool = False,
+    minimize: bool = False,
+) -> "list[str]":
+    """
+    Generates the selected outputs for the extensions and writes them to
+    sink: by default the current directory, or another directory, a
+    dictionary that receives the content of each output as bytes, a callback
+    or an OutputSink (see output_sink). Returns the names of the outputs
+    whose content changed.
+
+    The run happens in context, by default a new GenerationContext, so
+    several runs can go on concurrently in one process. Errors in the
+    extension files are raised as OpcodesError. Runs that pass the same
+    model share the extension files it has parsed.
+
+    With minimize, the Chisel, SpinalHDL and SystemVerilog outputs also get
+    logic-minimized decode patterns (see minimize_utils).
+
+    With changed_files, a collection of resource paths such as
+    "extensions/rv_i" or "csrs.csv", only the outputs affected by one of them
+    are generated again (see output_affected).
+    """
+    with generation_context(context):
+        sink = output_sink(sink)
+
+        # Every instruction dictionary of this run is created from one model, so
+        # each extension file is parsed only once.
+        if model is None:
+            model = InstrModel(jobs)
+        create = (
+            partial(cache.create_inst_dict, model=model)
+            if cache is not None
+            else model.create_inst_dict
+        )
+
+        instr_dict = create(extensions, include_pseudo, warn_overlap=warn_overlap)
+        instr_dict = dict(sorted(instr_dict.items()))
+        instr_dict_with_segment = add_segmented_vls_insn(instr_dict)
+
+        tasks: list[EmitterTask] = [
+            EmitterTask(emit_json, (instr_dict_with_segment,), "instr_dict.json")
+        ]
+
+        if c:
+            instr_dict_c = create(
+                extensions,
+                False,
+                include_pseudo_ops=emitted_pseudo_ops,
+                warn_overlap=warn_overlap,
+            )
+            instr_dict_c = dict(sorted(instr_dict_c.items()))
+            tasks.append(EmitterTask(emit_c, (instr_dict_c,), "encoding.out.h"))
+
+        if chisel:
+            tasks.append(
+                EmitterTask(emit_chisel, (instr_dict, False, minimize), "inst.chisel")
+            )
+
+        if spinalhdl:
+            tasks.append(
+                EmitterTask(emit_chisel, (instr_dict, True, minimize), "inst.spinalhdl")
+            )
+
+        if sverilog:
+            tasks.append(
+                EmitterTask(emit_sverilog, (instr_dict, minimize), "inst.sverilog")
+            )
+
+        if rust or rust_decoder:
+            tasks.append(EmitterTask(emit_rust, (instr_dict, rust_decoder), "inst.rs"))
+
+        if go:
+            tasks.append(
+                EmitterTask(
+                    emit_go,
+                    (instr_dict_with_segment, extensions),
+                    "inst.go",
+                )
+            )
+
+        if latex:
+            tasks.append(EmitterTask(emit_latex_table, (model,), "instr-table.tex"))
+            tasks.append(
+                EmitterTask(
+                    emit_priv_latex_table,
+                    (model,),
+                    "priv-instr-table.tex",
+                )
+            )
+
+        if svg:
+            tasks.append(EmitterTask(emit_svg, (instr_dict,), "inst.svg"))
+
+        if c_decoder:
+            tasks.append(EmitterTask(emit_c_decoder, (instr_dict,), "decode.out.h"))
+
+        if compressed_table:
+            tasks.append(
+                EmitterTask(emit_compressed_c, (instr_dict,), "compressed.out.h")
+            )
+            tasks.append(
+                EmitterTask(emit_compressed_rust, (instr_dict,), "compressed.rs")
+            )
+            tasks.append(
+                EmitterTask(emit_compressed_npy, (instr_dict,), "compressed.npy")
+            )
+
+        if dispatch:
+            tasks.append(EmitterTask(emit_c_dispatch, (instr_dict,), "dispatch.out.h"))
+            tasks.append(EmitterTask(emit_rust_dispatch, (instr_dict,), "dispatch.rs"))
+
+        if changed_files is not None:
+            tasks = [
+                task
+                for task in tasks
+                if output_affected(task.output, extensions, model, changed_files)
+            ]
+
+        changed_outputs = run_emitter_tasks(tasks, jobs, sink)
+
+        if depfiles:
+            for task in tasks:
+                depfile_changed = make_depfile(
+                    task.output,
+                    output_extension_files(task.output, extensions, model),
+                    sink,
+                )
+                if depfile_changed:
+                    changed_outputs.append(f"{task.output}.d")
+
+        return changed_outputs
+
+
+# Generate the outputs of a configuration
+def generate_config(config: BatchConfig, model: InstrModel) -> "list[str]":
+    """
+    Generates the outputs of the configuration into its directory from the
+    extension files parsed by model, in a context of its own, running up to
+    model.jobs generators at a time. Returns the outputs whose content
+    changed.
+    """
+    os.makedirs(config.directory, exist_ok=True)
+    return generate_extensions(
+        config.extensions,
+        config.pseudo,
+        **{output: output in config.outputs for output in BATCH_OUTPUTS},
+        warn_overlap=config.warn_overlap,
+        jobs=model.jobs,
+        depfiles=config.depfiles,
+        sink=config.directory,
+        minimize=config.minimize,
+        model=model,
+    )
+
+
+# The model shared by the configurations run in a worker process.
+_worker_model: Optional[InstrModel] = None
+
+
+# Install the parsed model in a worker process
+def use_model(model: InstrModel):
+    """Process pool initializer that installs the model parsed by the parent."""
+    global _worker_model  # pylint: disable=global-statement
+    model.jobs = 1
+    _worker_model = model
+
+
+# Generate a configuration in a worker process, capturing its log messages
+def run_captured_config(
+    config: BatchConfig,
+) -> "tuple[list[logging.LogRecord], Optional[OpcodesError], list[str]]":
+    assert _worker_model is not None
+    error = None
+    changed: list[str] = []
+    with capture_log_records() as log_records:
+        try:
+            changed = generate_config(config, _worker_model)
+        except OpcodesError as e:
+            error = e
+    return log_records, error, changed
+
+
+# Generate every configuration of a manifest
+def run_batch(configs: "list[BatchConfig]", jobs: int = 1) -> "dict[str, list[str]]":
+    """
+    Parses the union of the extension files the configurations need once,
+    then generates each configuration from the shared parse, concurrently in
+    up to jobs worker processes. The messages of each configuration are
+    logged in manifest order. Returns the outputs whose content changed by
+    configuration name.
+    """
+    model = InstrModel(jobs)
+    file_filters = [config.extensions for config in configs]
+    if any("latex" in config.outputs for config in configs):
+        file_filters += latex_file_filters(latex_tables() + priv_latex_tables())
+    file_names = sorted(
+        {
+            file_name
+            for file_filter in file_filters
+            for file_name in select_extension_files(file_filter)
+        }
+    )
+    logging.info(f"Parsing {len(file_names)} extension files")
+    model.encode(file_names)
+    for file_filter in file_filters:
+        # Loads the files named by $pseudo_op and $import lines.
+        model.dependencies(file_filter)
+
+    changed: dict[str, list[str]] = {}
+    if jobs <= 1 or len(configs) <= 1:
+        for config in configs:
+            logging.info(f"Generating configuration {config.name}")
+            changed[config.name] = generate_config(config, model)
+        return changed
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(configs)),
+        initializer=use_model,
+        initargs=(model,),
+    ) as executor:
+        for config, (log_records, error, outputs) in zip(
+            configs, executor.map(run_captured_config, configs)
+        ):
+            logging.info(f"Generating configuration {config.name}")
+            replay_log_records(log_records)
+            if error is not None:
+                raise error
+            changed[config.name] = outputs
+    return changed
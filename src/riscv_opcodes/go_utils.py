@@ -1,20 +1,23 @@
 import logging
 import pprint
+from collections.abc import Iterator
 from typing import Sequence
 
-from .constants import csrs
+from .context import current_context
+from .output_utils import OutputTarget, output_sink
 from .shared_utils import InstrDict, signed
 
 pp = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
 
 
-def make_go(instr_dict: InstrDict, extensions: Sequence[str]):
+def emit_go(instr_dict: InstrDict, extensions: Sequence[str]) -> Iterator[str]:
+    context = current_context()
 
     args = 'make inst.go EXTENSIONS="' + " ".join(extensions) + '"'
-    prelude = f"""// Code generated by {args}; DO NOT EDIT."""
+    yield f"""// Code generated by {args}; DO NOT EDIT."""
 
-    prelude += """
+    yield """
 package riscv
 
 import "cmd/internal/obj"
@@ -32,33 +35,32 @@ func encode(a obj.As) *inst {
 	switch a {
 """
 
-    csrs_map_str = """  }
-	return nil
-}
-
-var csrs = map[uint16]string {
-"""
-
-    endoffile = """}
-"""
-
-    instr_str = ""
     for i in instr_dict:
-        enc_match = int(instr_dict[i]["match"], 0)
+        enc_match = instr_dict[i].match
         opcode = (enc_match >> 0) & ((1 << 7) - 1)
         funct3 = (enc_match >> 12) & ((1 << 3) - 1)
         rs1 = (enc_match >> 15) & ((1 << 5) - 1)
         rs2 = (enc_match >> 20) & ((1 << 5) - 1)
         csr = (enc_match >> 20) & ((1 << 12) - 1)
         funct7 = (enc_match >> 25) & ((1 << 7) - 1)
-        instr_str += f"""  case A{i.upper().replace("_","")}:
+        yield f"""  case A{i.upper().replace("_","")}:
     return &inst{{ {hex(opcode)}, {hex(funct3)}, {hex(rs1)}, {hex(rs2)}, {signed(csr,12)}, {hex(funct7)} }}
 """
-    for num, name in sorted(csrs, key=lambda row: row[0]):
-        csrs_map_str += f'{hex(num)} : "{name.upper()}",\n'
 
-    with open("inst.go", "w", encoding="utf-8") as file:
-        file.write(prelude)
-        file.write(instr_str)
-        file.write(csrs_map_str)
-        file.write(endoffile)
+    yield """  }
+	return nil
+}
+
+var csrs = map[uint16]string {
+"""
+    for num, name in sorted(context.csrs, key=lambda row: row[0]):
+        yield f'{hex(num)} : "{name.upper()}",\n'
+
+    yield """}
+"""
+
+
+def make_go(
+    instr_dict: InstrDict, extensions: Sequence[str], sink: OutputTarget = None
+) -> bool:
+    return output_sink(sink).write("inst.go", emit_go(instr_dict, extensions))
@@ -0,0 +1,26 @@
+import json
+from collections.abc import Iterator
+
+from .output_utils import OutputTarget, output_sink
+from .shared_utils import InstrDict
+
+
+# Generate instr_dict.json one instruction at a time
+def emit_json(instr_dict: InstrDict) -> Iterator[str]:
+    """
+    Yields the same text as json.dump(..., indent=2) of the dictionary form
+    of instr_dict, without building the whole document first.
+    """
+    if not instr_dict:
+        yield "{}"
+        return
+    separator = "{"
+    for name, instr in instr_dict.items():
+        body = json.dumps(instr.to_dict(), indent=2).replace("\n", "\n  ")
+        yield f"{separator}\n  {json.dumps(name)}: {body}"
+        separator = ","
+    yield "\n}"
+
+
+def make_json(instr_dict: InstrDict, sink: OutputTarget = None) -> bool:
+    return output_sink(sink).write("instr_dict.json", emit_json(instr_dict))
@@ -1,15 +1,29 @@
 import logging
 import pprint
-from typing import TextIO
+from collections.abc import Iterator
+from typing import NamedTuple, Optional
 
 from .constants import latex_fixed_fields, latex_inst_type, latex_mapping
-from .shared_utils import InstrDict, arg_lut, create_inst_dict
+from .context import OpcodesError, current_context
+from .output_utils import OutputTarget, output_sink
+from .shared_utils import InstrDict, InstrModel
 
 pp = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
 
+# (list_of_extensions, title, list_of_instructions, include_pseudo_ops)
+LatexDataset = tuple[list[str], str, list[str], bool]
 
-def make_priv_latex_table():
+
+class LatexTable(NamedTuple):
+    """The instruction types, datasets and caption of a latex table."""
+
+    type_list: "list[str]"
+    dataset: "list[LatexDataset]"
+    caption: str
+
+
+def priv_latex_tables() -> "list[LatexTable]":
     type_list = ["R-type", "I-type"]
     system_instr = ["_h", "_s", "_system", "_svinval", "64_h", "_svinval_h"]
     dataset_list = [(system_instr, "Trap-Return Instructions", ["sret", "mret"], False)]
@@ -74,13 +88,22 @@ def make_priv_latex_table():
         )
     )
     caption = "\\caption{RISC-V Privileged Instructions}"
-    with open("priv-instr-table.tex", "w", encoding="utf-8") as latex_file:
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
+    return [LatexTable(type_list, dataset_list, caption)]
+
+
+def emit_priv_latex_table(model: Optional[InstrModel] = None) -> Iterator[str]:
+    yield from emit_latex_tables(priv_latex_tables(), model)
 
 
-def make_latex_table():
+def make_priv_latex_table(
+    model: Optional[InstrModel] = None, sink: OutputTarget = None
+) -> bool:
+    return output_sink(sink).write("priv-instr-table.tex", emit_priv_latex_table(model))
+
+
+def latex_tables() -> "list[LatexTable]":
     """
-    This function is mean to create the instr-table.tex that is meant to be used
+    This function is mean to describe the instr-table.tex that is meant to be used
     by the riscv-isa-manual. This function basically creates a single latext
     file of multiple tables with each table limited to a single page. Only the
     last table is assigned a latex-caption.
@@ -92,107 +115,138 @@ def make_latex_table():
     assign Title, such that in the end they appear as subheadings within
     the table (note these are inlined headings and not captions of the table).
 
-    All of the above information is collected/created and sent to
-    make_ext_latex_table function to dump out the latex contents into a file.
+    All of the above information is collected/created and later sent to
+    emit_ext_latex_table function to generate the latex contents.
 
     The last table only has to be given a caption - as per the policy of the
     riscv-isa-manual.
     """
-    # open the file and use it as a pointer for all further dumps
-    with open("instr-table.tex", "w", encoding="utf-8") as latex_file:
-
-        # create the rv32i table first. Here we set the caption to empty. We use the
-        # files rv_i and rv32_i to capture instructions relevant for rv32i
-        # configuration. The dataset is a list of 4-element tuples :
-        # (list_of_extensions, title, list_of_instructions, include_pseudo_ops). If list_of_instructions
-        # is empty then it indicates that all instructions of the all the extensions
-        # in list_of_extensions need to be dumped. If not empty, then only the
-        # instructions listed in list_of_instructions will be dumped into latex.
-        caption = ""
-        type_list = ["R-type", "I-type", "S-type", "B-type", "U-type", "J-type"]
-        dataset_list: list[tuple[list[str], str, list[str], bool]] = [
-            (["_i", "32_i"], "RV32I Base Instruction Set", [], False)
-        ]
-        dataset_list.append((["_i"], "", ["fence_tso", "pause"], True))
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
-
-        type_list = ["R-type", "I-type", "S-type"]
-        dataset_list = [
-            (["64_i"], "RV64I Base Instruction Set (in addition to RV32I)", [], False)
-        ]
-        dataset_list.append(
-            (["_zifencei"], "RV32/RV64 Zifencei Standard Extension", [], False)
-        )
-        dataset_list.append(
-            (["_zicsr"], "RV32/RV64 Zicsr Standard Extension", [], False)
-        )
-        dataset_list.append((["_m", "32_m"], "RV32M Standard Extension", [], False))
-        dataset_list.append(
-            (["64_m"], "RV64M Standard Extension (in addition to RV32M)", [], False)
-        )
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
+    tables: list[LatexTable] = []
+
+    # create the rv32i table first. Here we set the caption to empty. We use the
+    # files rv_i and rv32_i to capture instructions relevant for rv32i
+    # configuration. The dataset is a list of 4-element tuples :
+    # (list_of_extensions, title, list_of_instructions, include_pseudo_ops). If list_of_instructions
+    # is empty then it indicates that all instructions of the all the extensions
+    # in list_of_extensions need to be dumped. If not empty, then only the
+    # instructions listed in list_of_instructions will be dumped into latex.
+    caption = ""
+    type_list = ["R-type", "I-type", "S-type", "B-type", "U-type", "J-type"]
+    dataset_list: list[LatexDataset] = [
+        (["_i", "32_i"], "RV32I Base Instruction Set", [], False)
+    ]
+    dataset_list.append((["_i"], "", ["fence_tso", "pause"], True))
+    tables.append(LatexTable(type_list, dataset_list, caption))
+
+    type_list = ["R-type", "I-type", "S-type"]
+    dataset_list = [
+        (["64_i"], "RV64I Base Instruction Set (in addition to RV32I)", [], False)
+    ]
+    dataset_list.append(
+        (["_zifencei"], "RV32/RV64 Zifencei Standard Extension", [], False)
+    )
+    dataset_list.append((["_zicsr"], "RV32/RV64 Zicsr Standard Extension", [], False))
+    dataset_list.append((["_m", "32_m"], "RV32M Standard Extension", [], False))
+    dataset_list.append(
+        (["64_m"], "RV64M Standard Extension (in addition to RV32M)", [], False)
+    )
+    tables.append(LatexTable(type_list, dataset_list, caption))
 
-        type_list = ["R-type"]
-        dataset_list = [(["_a"], "RV32A Standard Extension", [], False)]
-        dataset_list.append(
-            (["64_a"], "RV64A Standard Extension (in addition to RV32A)", [], False)
-        )
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
+    type_list = ["R-type"]
+    dataset_list = [(["_a"], "RV32A Standard Extension", [], False)]
+    dataset_list.append(
+        (["64_a"], "RV64A Standard Extension (in addition to RV32A)", [], False)
+    )
+    tables.append(LatexTable(type_list, dataset_list, caption))
 
-        type_list = ["R-type", "R4-type", "I-type", "S-type"]
-        dataset_list = [(["_f"], "RV32F Standard Extension", [], False)]
-        dataset_list.append(
-            (["64_f"], "RV64F Standard Extension (in addition to RV32F)", [], False)
-        )
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
+    type_list = ["R-type", "R4-type", "I-type", "S-type"]
+    dataset_list = [(["_f"], "RV32F Standard Extension", [], False)]
+    dataset_list.append(
+        (["64_f"], "RV64F Standard Extension (in addition to RV32F)", [], False)
+    )
+    tables.append(LatexTable(type_list, dataset_list, caption))
 
-        type_list = ["R-type", "R4-type", "I-type", "S-type"]
-        dataset_list = [(["_d"], "RV32D Standard Extension", [], False)]
-        dataset_list.append(
-            (["64_d"], "RV64D Standard Extension (in addition to RV32D)", [], False)
-        )
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
+    type_list = ["R-type", "R4-type", "I-type", "S-type"]
+    dataset_list = [(["_d"], "RV32D Standard Extension", [], False)]
+    dataset_list.append(
+        (["64_d"], "RV64D Standard Extension (in addition to RV32D)", [], False)
+    )
+    tables.append(LatexTable(type_list, dataset_list, caption))
+
+    type_list = ["R-type", "R4-type", "I-type", "S-type"]
+    dataset_list = [(["_q"], "RV32Q Standard Extension", [], False)]
+    dataset_list.append(
+        (["64_q"], "RV64Q Standard Extension (in addition to RV32Q)", [], False)
+    )
+    tables.append(LatexTable(type_list, dataset_list, caption))
 
-        type_list = ["R-type", "R4-type", "I-type", "S-type"]
-        dataset_list = [(["_q"], "RV32Q Standard Extension", [], False)]
-        dataset_list.append(
-            (["64_q"], "RV64Q Standard Extension (in addition to RV32Q)", [], False)
+    caption = "\\caption{Instruction listing for RISC-V}"
+    type_list = ["R-type", "R4-type", "I-type", "S-type"]
+    dataset_list = [
+        (["_zfh", "_d_zfh", "_q_zfh"], "RV32Zfh Standard Extension", [], False)
+    ]
+    dataset_list.append(
+        (
+            ["64_zfh"],
+            "RV64Zfh Standard Extension (in addition to RV32Zfh)",
+            [],
+            False,
         )
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
-
-        caption = "\\caption{Instruction listing for RISC-V}"
-        type_list = ["R-type", "R4-type", "I-type", "S-type"]
-        dataset_list = [
-            (["_zfh", "_d_zfh", "_q_zfh"], "RV32Zfh Standard Extension", [], False)
-        ]
-        dataset_list.append(
-            (
-                ["64_zfh"],
-                "RV64Zfh Standard Extension (in addition to RV32Zfh)",
-                [],
-                False,
-            )
+    )
+    tables.append(LatexTable(type_list, dataset_list, caption))
+
+    ## The following is demo to show that Compressed instructions can also be
+    # dumped in the same manner as above
+
+    # type_list = ['']
+    # dataset_list = [(['_c', '32_c', '32_c_f','_c_d'],'RV32C Standard Extension', [])]
+    # dataset_list.append((['64_c'],'RV64C Standard Extension (in addition to RV32C)', []))
+    # tables.append(LatexTable(type_list, dataset_list, caption))  # with ilen 16
+
+    return tables
+
+
+# Generate latex tables of 32-bit instructions
+def emit_latex_tables(
+    tables: "list[LatexTable]", model: Optional[InstrModel] = None
+) -> Iterator[str]:
+    # all tables share one model so every extension file is parsed only once
+    if model is None:
+        model = InstrModel()
+    for table in tables:
+        yield from emit_ext_latex_table(
+            table.type_list, table.dataset, 32, table.caption, model
         )
-        make_ext_latex_table(type_list, dataset_list, latex_file, 32, caption)
 
-        ## The following is demo to show that Compressed instructions can also be
-        # dumped in the same manner as above
 
-        # type_list = ['']
-        # dataset_list = [(['_c', '32_c', '32_c_f','_c_d'],'RV32C Standard Extension', [])]
-        # dataset_list.append((['64_c'],'RV64C Standard Extension (in addition to RV32C)', []))
-        # make_ext_latex_table(type_list, dataset_list, latex_file, 16, caption)
+# List the file filters of the instruction dictionaries of latex tables
+def latex_file_filters(tables: "list[LatexTable]") -> "list[list[str]]":
+    return [
+        ["rv" + e for e in ext_list]
+        for table in tables
+        for ext_list, _, _, _ in table.dataset
+    ]
+
+
+def emit_latex_table(model: Optional[InstrModel] = None) -> Iterator[str]:
+    yield from emit_latex_tables(latex_tables(), model)
 
 
-def make_ext_latex_table(
+def make_latex_table(
+    model: Optional[InstrModel] = None, sink: OutputTarget = None
+) -> bool:
+    return output_sink(sink).write("instr-table.tex", emit_latex_table(model))
+
+
+def emit_ext_latex_table(
     type_list: "list[str]",
-    dataset: "list[tuple[list[str], str, list[str], bool]]",
-    latex_file: TextIO,
+    dataset: "list[LatexDataset]",
     ilen: int,
     caption: str,
-):
+    model: Optional[InstrModel] = None,
+) -> Iterator[str]:
     """
-    For a given collection of extensions this function dumps out a complete
+    For a given collection of extensions this function generates a complete
     latex table which includes the encodings of the instructions.
 
     The ilen input indicates the length of the instruction for which the table
@@ -200,14 +254,15 @@ def make_ext_latex_table(
 
     The caption input is used to create the latex-table caption.
 
+    The instruction dictionaries of the dataset are created from model, so
+    the extension files are only parsed once for all tables sharing it.
+
     The type_list input is a list of instruction types (R, I, B, etc) that are
     treated as header for each table. Each table will have its own requirements
     and type_list must include all the instruction-types that the table needs.
     Note, all elements of this list must be present in the latex_inst_type
     dictionary defined in constants.py
 
-    The latex_file is a file pointer to which the latex-table will dumped into
-
     The dataset is a list of 3-element tuples containing:
         (list_of_extensions, title, list_of_instructions)
     The list_of_extensions must contain all the set of extensions whose
@@ -233,7 +288,7 @@ def make_ext_latex_table(
         Each table is created with ilen+1 columns - ilen columns for each bit of the
         instruction and one column to hold the name of the instruction.
 
-        For each argument of an instruction we use the arg_lut from constants.py
+        For each argument of an instruction we use the arg_lut of the context
         to identify its position in the encoding, and thus create a multicolumn
         entry with the name of the argument as the data. For hardcoded bits, we
         do the same where we capture a string of continuous 1s and 0s, identify
@@ -241,6 +296,7 @@ def make_ext_latex_table(
         multicolumn entry in the table.
 
     """
+    arg_lut = current_context().arg_lut
     column_size = "".join(["p{0.002in}"] * (ilen + 1))
 
     type_entries = (
@@ -334,39 +390,64 @@ def make_ext_latex_table(
         entry += f"\\cline{{2-{ilen+1}}}\n&\n\n"
         type_entries += entry
 
+    if model is None:
+        model = InstrModel()
+
+    yield f"""
+\\newpage
+
+\\begin{{table}}[p]
+\\begin{{small}}
+\\begin{{center}}
+    \\begin{{tabular}} {{{column_size}l}}
+    {" ".join(['&']*ilen)} \\\\
+
+            &
+{type_entries}
+"""
+
     # for each entry in the dataset create a table
-    content = ""
     for ext_list, title, filter_list, include_pseudo in dataset:
         instr_dict: InstrDict = {}
 
         # for all extensions list in ext_list, create a dictionary of
         # instructions associated with those extensions.
         for e in ext_list:
-            instr_dict.update(create_inst_dict(["rv" + e], include_pseudo))
+            instr_dict.update(model.create_inst_dict(["rv" + e], include_pseudo))
 
         # if filter_list is not empty then use that as the official set of
         # instructions that need to be dumped into the latex table
         inst_list = list(instr_dict.keys()) if not filter_list else filter_list
 
+        # the title of the dataset is a sub-heading (sort-of) of the table
+        if title != "":
+            yield f"""
+
+\\multicolumn{{{ilen}}}{{c}}{{}} & \\\\
+\\multicolumn{{{ilen}}}{{c}}{{\\bfseries {title} }} & \\\\
+\\cline{{2-{ilen+1}}}
+
+            &
+"""
+        else:
+            yield "\n"
+
         # for each instruction create an latex table entry just like how we did
         # above with the instruction-type table.
-        instr_entries = ""
         for inst in inst_list:
             if inst not in instr_dict:
-                logging.error(
-                    f"in make_ext_latex_table: Instruction: {inst} not found in instr_dict"
+                raise OpcodesError(
+                    f"in emit_ext_latex_table: Instruction: {inst} not found in instr_dict"
                 )
-                raise SystemExit(1)
             fields = []
 
             # only if the argument is available in arg_lut we consume it, else
             # throw error.
-            for f in instr_dict[inst]["variable_fields"]:
+            for f in instr_dict[inst].variable_fields:
                 if f not in arg_lut:
-                    logging.error(
+                    raise OpcodesError(
                         f"Found variable {f} in instruction {inst} whose mapping is not available"
                     )
-                    raise SystemExit(1)
                 (msb, lsb) = arg_lut[f]
                 name = (
                     f.replace("_", ".") if f not in latex_mapping else latex_mapping[f]
@@ -376,9 +457,9 @@ def make_ext_latex_table(
             msb = ilen - 1
             y = ""
             if ilen == 16:
-                encoding = instr_dict[inst]["encoding"][16:]
+                encoding = instr_dict[inst].encoding[16:]
             else:
-                encoding = instr_dict[inst]["encoding"]
+                encoding = instr_dict[inst].encoding
             for r in range(0, ilen):
                 x = encoding[r]
                 if (msb, ilen - 1 - r + 1) in latex_fixed_fields:
@@ -407,38 +488,11 @@ def make_ext_latex_table(
                 else:
                     entry += f"\\multicolumn{{{msb - lsb + 1}}}{{c|}}{{{name}}} &\n"
             entry += f"\\cline{{2-{ilen+1}}}\n&\n\n"
-            instr_entries += entry
+            yield entry
 
-        # once an entry of the dataset is completed we create the whole table
-        # with the title of that dataset as sub-heading (sort-of)
-        if title != "":
-            content += f"""
-
-\\multicolumn{{{ilen}}}{{c}}{{}} & \\\\
-\\multicolumn{{{ilen}}}{{c}}{{\\bfseries {title} }} & \\\\
-\\cline{{2-{ilen+1}}}
+        yield "\n"
 
-            &
-{instr_entries}
-"""
-        else:
-            content += f"""
-{instr_entries}
-"""
-
-    header = f"""
-\\newpage
-
-\\begin{{table}}[p]
-\\begin{{small}}
-\\begin{{center}}
-    \\begin{{tabular}} {{{column_size}l}}
-    {" ".join(['&']*ilen)} \\\\
-
-            &
-{type_entries}
-"""
-    endtable = f"""
+    yield f"""
 
 \\end{{tabular}}
 \\end{{center}}
@@ -446,5 +500,3 @@ def make_ext_latex_table(
 {caption}
 \\end{{table}}
 """
-    # dump the contents and return
-    latex_file.write(header + content + endtable)
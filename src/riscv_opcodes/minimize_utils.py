@@ -0,0 +1,200 @@
+from typing import NamedTuple
+
+from .decoder import decode_candidates
+from .shared_utils import InstrDict
+
+
+class Cube(NamedTuple):
+    """
+    A set of instruction words: the words whose bits set in care equal those
+    of value. Bits of value outside care are 0. An encoding string such as
+    "-----00----------000-----0110011" is a cube with a care bit per 0 or 1.
+    """
+
+    value: int
+    care: int
+
+
+# Convert an encoding string to a cube
+def encoding_cube(encoding: str) -> Cube:
+    value = care = 0
+    for char in encoding:
+        value <<= 1
+        care <<= 1
+        if char != "-":
+            care |= 1
+            value |= char == "1"
+    return Cube(value, care)
+
+
+# Convert a cube to an encoding string of the given width
+def cube_encoding(cube: Cube, width: int = 32) -> str:
+    return "".join(
+        "-" if not cube.care >> bit & 1 else str(cube.value >> bit & 1)
+        for bit in reversed(range(width))
+    )
+
+
+def cubes_intersect(a: Cube, b: Cube) -> bool:
+    return not (a.value ^ b.value) & a.care & b.care
+
+
+# Check whether cube a contains cube b
+def cube_contains(a: Cube, b: Cube) -> bool:
+    return not a.care & ~b.care and not (a.value ^ b.value) & a.care
+
+
+# Subtract a cube from another
+def sharp(a: Cube, b: Cube) -> "list[Cube]":
+    """
+    Returns disjoint cubes covering the words of a that aren't in b: for each
+    bit b cares about and a doesn't, the words of a that agree with b on the
+    previous such bits and differ from it on this one.
+    """
+    if not cubes_intersect(a, b):
+        return [a]
+    result = []
+    value, care = a
+    free = b.care & ~a.care
+    while free:
+        bit = free & -free
+        free ^= bit
+        result.append(Cube(value | (~b.value & bit), care | bit))
+        value |= b.value & bit
+        care |= bit
+    return result
+
+
+# Check whether a cube lies in the union of other cubes
+def covers(cover: "list[Cube]", cube: Cube) -> bool:
+    """
+    Splits the cube on the bits the cubes of cover care about, Shannon
+    expansion style, until each part lies in a single cube of cover or
+    intersects none of them.
+    """
+    cover = [other for other in cover if cubes_intersect(cube, other)]
+    if not cover:
+        return False
+    if any(cube_contains(other, cube) for other in cover):
+        return True
+    free = cover[0].care & ~cube.care
+    bit = free & -free
+    return covers(cover, Cube(cube.value, cube.care | bit)) and covers(
+        cover, Cube(cube.value | bit, cube.care | bit)
+    )
+
+
+# Drop the care bits of a cube that aren't needed to exclude the off-set
+def expand_against(cube: Cube, off: "list[Cube]") -> Cube:
+    """
+    Each off-set cube has to keep one care bit of cube it differs on. The
+    kept bits are chosen greedily: the bits that are the only difference
+    with an off-set cube first, then the bit that excludes the most of the
+    remaining off-set cubes, the highest bit on ties.
+    """
+    conflicts = {(cube.value ^ other.value) & cube.care & other.care for other in off}
+    if 0 in conflicts:
+        raise ValueError(f"{cube_encoding(cube)} intersects the off-set")
+    kept = 0
+    while conflicts:
+        singles = [conflict for conflict in conflicts if not conflict & (conflict - 1)]
+        if singles:
+            bit = max(singles)
+        else:
+            counts: dict[int, int] = {}
+            for conflict in conflicts:
+                while conflict:
+                    low = conflict & -conflict
+                    counts[low] = counts.get(low, 0) + 1
+                    conflict ^= low
+            bit = max(counts, key=lambda low: (counts[low], low))
+        kept |= bit
+        conflicts = {conflict for conflict in conflicts if not conflict & bit}
+    return Cube(cube.value & kept, kept)
+
+
+# Drop the care bits of a cube while it stays in the on-set
+def expand_within(cube: Cube, on: "list[Cube]") -> Cube:
+    care = cube.care
+    while care:
+        bit = 1 << (care.bit_length() - 1)
+        care ^= bit
+        expanded = Cube(cube.value & ~bit, cube.care & ~bit)
+        if covers(on, expanded):
+            cube = expanded
+    return cube
+
+
+# Remove the cubes of a cover that the others already cover
+def irredundant(cover: "list[Cube]") -> "list[Cube]":
+    """
+    Drops the cubes contained in another cube, then each cube, smallest
+    first, that the union of the remaining ones covers.
+    """
+    cover = sorted(set(cover), key=lambda cube: (bin(cube.care).count("1"), cube))
+    cover = [
+        cube
+        for i, cube in enumerate(cover)
+        if not any(cube_contains(other, cube) for other in cover[:i])
+    ]
+    for cube in reversed(cover[:]):
+        others = [other for other in cover if other != cube]
+        if others and covers(others, cube):
+            cover = others
+    return cover
+
+
+# The words each instruction is decoded from
+def instruction_on_sets(instr_dict: InstrDict) -> "dict[str, list[Cube]]":
+    """
+    Returns the encoding cube of each instruction minus the cubes of the
+    instructions that take priority over it (see decode_candidates), as
+    disjoint cubes. An instruction whose words all decode to others has no
+    cubes.
+    """
+    on_sets: dict[str, list[Cube]] = {}
+    previous: list[Cube] = []
+    for name, _, _ in decode_candidates(instr_dict):
+        cube = encoding_cube(instr_dict[name].encoding)
+        cover = [cube]
+        for other in previous:
+            if cubes_intersect(cube, other):
+                cover = [part for piece in cover for part in sharp(piece, other)]
+        on_sets[name] = cover
+        previous.append(cube)
+    return {name: on_sets[name] for name in instr_dict}
+
+
+# Minimize the patterns that tell the instructions apart
+def minimize_instructions(instr_dict: InstrDict) -> "dict[str, list[Cube]]":
+    """
+    Returns for each instruction, in the order of instr_dict, a minimized
+    cover of the words it is decoded from. The words of the other
+    instructions are the off-set and the illegal words are don't-cares, so a
+    cover only tells its instruction apart from the other instructions:
+    combine it with minimize_legal to reject illegal words.
+    """
+    on_sets = instruction_on_sets(instr_dict)
+    result = {}
+    for name, on in on_sets.items():
+        off = [
+            cube for other, cover in on_sets.items() if other != name for cube in cover
+        ]
+        result[name] = irredundant([expand_against(cube, off) for cube in on])
+    return result
+
+
+# Minimize the set of legal instruction words
+def minimize_legal(instr_dict: InstrDict) -> "list[Cube]":
+    """
+    Returns a minimized cover of the words some instruction is decoded from,
+    with every other word in the off-set. Each cube is expanded as far as it
+    stays within the encodings, largest cube first, skipping cubes that an
+    expanded one already covers.
+    """
+    on = [encoding_cube(instr.encoding) for instr in instr_dict.values()]
+    cover: list[Cube] = []
+    for cube in sorted(set(on), key=lambda cube: (bin(cube.care).count("1"), cube)):
+        if not any(cube_contains(other, cube) for other in cover):
+            cover.append(expand_within(cube, on))
+    return irredundant(cover)
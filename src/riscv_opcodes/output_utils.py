@@ -0,0 +1,165 @@
+import abc
+import hashlib
+import io
+import os
+import threading
+from collections.abc import Iterable, Iterator
+from typing import Any, Callable, Optional, TextIO, Union
+
+# A chunk of an output: text, written UTF-8 encoded, or binary data.
+Chunk = Union[str, bytes]
+
+# An emitter is a generator that yields the content of an output file in
+# chunks, in order. The chunks are written out as they are generated, so no
+# emitter ever holds the complete output in memory.
+Emitter = Callable[..., Iterator[Chunk]]
+
+# Number of bytes read at a time when hashing an existing output.
+HASH_BLOCK_SIZE = 1 << 16
+
+
+# Write the chunks of an output to a text stream
+def write_chunks(stream: TextIO, chunks: "Iterable[str]"):
+    for chunk in chunks:
+        stream.write(chunk)
+
+
+# Encode a chunk of an output
+def chunk_bytes(chunk: Chunk) -> bytes:
+    return chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+# Hash the content of a file
+def file_digest(file_name: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+# Write the chunks of an output to a file if its content changed
+def write_output(file_name: str, chunks: "Iterable[Chunk]") -> bool:
+    """
+    Streams the chunks of an output to a temporary file next to file_name,
+    hashing them as they are written. The temporary file only replaces
+    file_name if its content differs from the existing file, so an output
+    that didn't change keeps its modification time and downstream builds
+    aren't triggered. Returns whether file_name was written.
+    """
+    temp_name = f"{file_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_name, "wb") as temp_file:
+            for chunk in chunks:
+                data = chunk_bytes(chunk)
+                temp_file.write(data)
+                digest.update(data)
+                size += len(data)
+        if (
+            os.path.isfile(file_name)
+            and os.path.getsize(file_name) == size
+            and file_digest(file_name) == digest.digest()
+        ):
+            os.remove(temp_name)
+            return False
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+    return True
+
+
+# Collect the chunks of an output in memory
+def render_output(chunks: "Iterable[str]") -> str:
+    """Returns the complete text of an output."""
+    buffer = io.StringIO()
+    write_chunks(buffer, chunks)
+    return buffer.getvalue()
+
+
+# Collect the chunks of an output in memory as bytes
+def render_output_bytes(chunks: "Iterable[Chunk]") -> bytes:
+    """Returns the complete content of an output, UTF-8 encoded."""
+    buffer = io.BytesIO()
+    for chunk in chunks:
+        buffer.write(chunk_bytes(chunk))
+    return buffer.getvalue()
+
+
+class OutputSink(abc.ABC):
+    """
+    Destination of generated outputs. Each output is written by name and the
+    sink reports whether its content changed.
+    """
+
+    @abc.abstractmethod
+    def write(self, name: str, chunks: "Iterable[Chunk]") -> bool:
+        """Writes the chunks of the named output and returns whether it changed."""
+
+
+class DirectorySink(OutputSink):
+    """Writes outputs as files in a directory, only rewriting changed files."""
+
+    def __init__(self, directory: "Union[str, os.PathLike[str]]" = "."):
+        self.directory = directory
+
+    def write(self, name: str, chunks: "Iterable[Chunk]") -> bool:
+        return write_output(os.path.join(self.directory, name), chunks)
+
+
+class MemorySink(OutputSink):
+    """Keeps the UTF-8 encoded content of each output in a dictionary."""
+
+    def __init__(self, buffers: "Optional[dict[str, bytes]]" = None):
+        self.buffers: dict[str, bytes] = {} if buffers is None else buffers
+
+    def write(self, name: str, chunks: "Iterable[Chunk]") -> bool:
+        data = render_output_bytes(chunks)
+        changed = self.buffers.get(name) != data
+        self.buffers[name] = data
+        return changed
+
+
+class CallbackSink(OutputSink):
+    """
+    Passes the name and UTF-8 encoded content of each output to a callback.
+    The output counts as changed unless the callback returns False.
+    """
+
+    def __init__(self, callback: "Callable[[str, bytes], Any]"):
+        self.callback = callback
+
+    def write(self, name: str, chunks: "Iterable[Chunk]") -> bool:
+        return self.callback(name, render_output_bytes(chunks)) is not False
+
+
+# Anything output_sink accepts as the destination of generated outputs.
+OutputTarget = Union[
+    OutputSink,
+    str,
+    "os.PathLike[str]",
+    "dict[str, bytes]",
+    "Callable[[str, bytes], Any]",
+    None,
+]
+
+
+# Turn an output target into an output sink
+def output_sink(target: OutputTarget = None) -> OutputSink:
+    """
+    Returns the sink for an output target: None for the current directory, a
+    directory path, a dictionary to store the outputs in as bytes, a callback
+    taking the name and content of each output, or an OutputSink.
+    """
+    if target is None:
+        return DirectorySink()
+    if isinstance(target, OutputSink):
+        return target
+    if isinstance(target, (str, os.PathLike)):
+        return DirectorySink(target)
+    if isinstance(target, dict):
+        return MemorySink(target)
+    return CallbackSink(target)
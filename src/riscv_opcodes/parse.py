@@ -1,17 +1,17 @@
 import argparse
-import json
 import logging
+import os
 import pprint
+import sys
+from functools import partial
+from pathlib import Path
 
-from .c_utils import make_c
-from .chisel_utils import make_chisel
-from .constants import emitted_pseudo_ops
-from .go_utils import make_go
-from .latex_utils import make_latex_table, make_priv_latex_table
-from .rust_utils import make_rust
-from .shared_utils import add_segmented_vls_insn, create_inst_dict
-from .sverilog_utils import make_sverilog
-from .svg_utils import make_svg
+from .argument_utils import non_negative_int
+from .batch_utils import load_manifest
+from .cache import DEFAULT_CACHE_SIZE, InstrDictCache, default_cache_dir
+from .context import OpcodesError
+from .generate_utils import generate_extensions, run_batch
+from .watch_utils import DEFAULT_POLL_INTERVAL, watch_extensions
 
 LOG_FORMAT = "%(levelname)s:: %(message)s"
 LOG_LEVEL = logging.INFO
@@ -20,69 +20,7 @@ pretty_printer = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 
 
-def generate_extensions(
-    extensions: list[str],
-    include_pseudo: bool,
-    c: bool,
-    chisel: bool,
-    spinalhdl: bool,
-    sverilog: bool,
-    rust: bool,
-    go: bool,
-    latex: bool,
-    svg: bool,
-    warn_overlap: bool = False,
-):
-    instr_dict = create_inst_dict(extensions, include_pseudo, warn_overlap=warn_overlap)
-    instr_dict = dict(sorted(instr_dict.items()))
-    instr_dict_with_segment = add_segmented_vls_insn(instr_dict)
-
-    with open("instr_dict.json", "w", encoding="utf-8") as outfile:
-        json.dump(instr_dict_with_segment, outfile, indent=2)
-
-    if c:
-        instr_dict_c = create_inst_dict(
-            extensions,
-            False,
-            include_pseudo_ops=emitted_pseudo_ops,
-            warn_overlap=warn_overlap,
-        )
-        instr_dict_c = dict(sorted(instr_dict_c.items()))
-        make_c(instr_dict_c)
-        logging.info("encoding.out.h generated successfully")
-
-    if chisel:
-        make_chisel(instr_dict)
-        logging.info("inst.chisel generated successfully")
-
-    if spinalhdl:
-        make_chisel(instr_dict, True)
-        logging.info("inst.spinalhdl generated successfully")
-
-    if sverilog:
-        make_sverilog(instr_dict)
-        logging.info("inst.sverilog generated successfully")
-
-    if rust:
-        make_rust(instr_dict)
-        logging.info("inst.rs generated successfully")
-
-    if go:
-        make_go(instr_dict_with_segment, extensions)
-        logging.info("inst.go generated successfully")
-
-    if latex:
-        make_latex_table()
-        logging.info("instr-table.tex generated successfully")
-        make_priv_latex_table()
-        logging.info("priv-instr-table.tex generated successfully")
-
-    if svg:
-        make_svg(instr_dict)
-        logging.info("inst.svg generated successfully")
-
-
-def main():
+def generate_main(argv: "list[str]"):
     parser = argparse.ArgumentParser(description="Generate RISC-V constants headers")
     parser.add_argument(
         "-pseudo", action="store_true", help="Include pseudo-instructions"
@@ -101,22 +39,96 @@ def main():
     parser.add_argument("-go", action="store_true", help="Generate output for Go")
     parser.add_argument("-latex", action="store_true", help="Generate output for Latex")
     parser.add_argument("-svg", action="store_true", help="Generate .svg output")
+    parser.add_argument(
+        "-c-decoder",
+        action="store_true",
+        help="Generate a C decode function (decode.out.h)",
+    )
+    parser.add_argument(
+        "-compressed-table",
+        action="store_true",
+        help="Generate the 65536-entry decode table of the 16-bit instructions as C, Rust and NumPy (compressed.out.h, compressed.rs, compressed.npy)",
+    )
+    parser.add_argument(
+        "-dispatch",
+        action="store_true",
+        help="Generate two-level dispatch tables of the 32-bit instructions for C and Rust (dispatch.out.h, dispatch.rs)",
+    )
+    parser.add_argument(
+        "-rust-decoder",
+        action="store_true",
+        help="Generate the Rust output with a decode module: an Opcode enum, a decode function and operand extractors",
+    )
+    parser.add_argument(
+        "-minimize",
+        action="store_true",
+        help="Add logic-minimized decode patterns to the Chisel, SpinalHDL and SystemVerilog outputs",
+    )
     parser.add_argument(
         "--warn-overlap",
         action="store_true",
         help="Warn instead of error on overlapping instruction encodings",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=default_cache_dir(),
+        help="Directory of the parsed instruction cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+        help="Maximum size of the parsed instruction cache in MiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the extension files instead of using the cache",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=non_negative_int,
+        default=1,
+        help="Number of processes used to parse the extension files and run the generators; 0 uses all CPUs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--depfiles",
+        action="store_true",
+        help="Write a make depfile <output>.d next to every output, listing the files it was generated from",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and generate the outputs again whenever the extension or CSV files change",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between two checks for changed files in watch mode (default: %(default)s)",
+    )
     parser.add_argument(
         "extensions",
         nargs="*",
         help="Extensions to use. This is a glob of the rv_.. files, e.g. 'rv*' will give all extensions.",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     print(f"Extensions selected : {args.extensions}")
 
-    generate_extensions(
+    # Watch mode keeps the parsed files in memory instead of using the cache.
+    cache = (
+        None
+        if args.no_cache or args.watch
+        else InstrDictCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    )
+    jobs = args.jobs or os.cpu_count() or 1
+
+    generate = partial(
+        generate_extensions,
         args.extensions,
         args.pseudo,
         args.c,
@@ -128,4 +140,67 @@ def main():
         args.latex,
         args.svg,
         args.warn_overlap,
+        cache,
+        jobs,
+        args.depfiles,
+        c_decoder=args.c_decoder,
+        compressed_table=args.compressed_table,
+        dispatch=args.dispatch,
+        rust_decoder=args.rust_decoder,
+        minimize=args.minimize,
+    )
+
+    if not args.watch:
+        generate()
+        return
+    try:
+        watch_extensions(generate, jobs, args.watch_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def batch_main(argv: "list[str]"):
+    parser = argparse.ArgumentParser(
+        prog="riscv_opcodes batch",
+        description="Generate the outputs of several configurations, parsing each extension file once",
+    )
+    parser.add_argument("manifest", help="TOML file listing the configurations")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=non_negative_int,
+        default=1,
+        help="Number of processes used to parse the extension files and generate the configurations; 0 uses all CPUs (default: %(default)s)",
     )
+    args = parser.parse_args(argv)
+
+    run_batch(load_manifest(args.manifest), args.jobs or os.cpu_count() or 1)
+
+
+# Subcommand modules are imported on demand so that generating doesn't pay
+# for the server, ELF and trace code
+def main():  # pylint: disable=import-outside-toplevel
+    try:
+        if sys.argv[1:2] == ["trace"]:
+            from .trace_utils import trace_main
+
+            trace_main(sys.argv[2:])
+        elif sys.argv[1:2] == ["elf"]:
+            from .elf_utils import elf_main
+
+            elf_main(sys.argv[2:])
+        elif sys.argv[1:2] == ["batch"]:
+            batch_main(sys.argv[2:])
+        elif sys.argv[1:2] == ["serve"]:
+            from .serve_utils import serve_main
+
+            serve_main(sys.argv[2:])
+        elif sys.argv[1:2] == ["client"]:
+            from .client import client_main
+
+            client_main(sys.argv[2:])
+        else:
+            generate_main(sys.argv[1:])
+    except OpcodesError as e:
+        logging.error(e)
+        raise SystemExit(1) from e
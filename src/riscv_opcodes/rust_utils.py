@@ -1,28 +1,133 @@
 import logging
 import pprint
+import re
+from collections.abc import Iterator
 
-from .constants import causes, csrs, csrs32
+from .context import current_context
+from .decoder import DecodeLeaf, DecodeTree, build_decode_tree
+from .output_utils import OutputTarget, output_sink
 from .shared_utils import InstrDict
 
 pp = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
 
 
-def make_rust(instr_dict: InstrDict):
-    mask_match_str = ""
-    for i in instr_dict:
-        mask_match_str += f'const MATCH_{i.upper().replace(".","_")}: u32 = {(instr_dict[i]["match"])};\n'
-        mask_match_str += f'const MASK_{i.upper().replace(".","_")}: u32 = {(instr_dict[i]["mask"])};\n'
-    for num, name in csrs + csrs32:
-        mask_match_str += f"const CSR_{name.upper()}: u16 = {hex(num)};\n"
-    for num, name in causes:
-        mask_match_str += (
-            f'const CAUSE_{name.upper().replace(" ","_")}: u8 = {hex(num)};\n'
+def emit_rust(instr_dict: InstrDict, decoder: bool = False) -> Iterator[str]:
+    context = current_context()
+    yield "\n/* Automatically generated by parse_opcodes */\n"
+    for i, instr in instr_dict.items():
+        yield f'const MATCH_{i.upper().replace(".","_")}: u32 = {hex(instr.match)};\n'
+        yield f'const MASK_{i.upper().replace(".","_")}: u32 = {hex(instr.mask)};\n'
+    for num, name in context.csrs + context.csrs32:
+        yield f"const CSR_{name.upper()}: u16 = {hex(num)};\n"
+    for num, name in context.causes:
+        yield f'const CAUSE_{name.upper().replace(" ","_")}: u8 = {hex(num)};\n'
+    yield "\n"
+    if decoder:
+        yield from emit_rust_decode_module(instr_dict)
+
+
+# Name of the variant of an instruction in the generated Opcode enum
+def rust_opcode_variant(name: str) -> str:
+    return "".join(part[:1].upper() + part[1:] for part in re.split(r"[_.]", name))
+
+
+# Generate the Rust expression that decodes a subtree
+def emit_rust_decode_subtree(
+    tree: DecodeTree, decided: int, indent: str
+) -> Iterator[str]:
+    """
+    Yields a match on the bits of each inner node, nested down to the
+    leaves, which test the bits of their candidates that the enclosing
+    matches have not already decided, most specific candidate first.
+    """
+    if isinstance(tree, DecodeLeaf):
+        tested = False
+        for name, match, mask in tree.candidates:
+            remaining = mask & ~decided
+            variant = f"Some(Opcode::{rust_opcode_variant(name)})"
+            if not remaining:
+                break
+            yield f"{indent}if insn & {hex(remaining)} == {hex(match & remaining)} {{\n"
+            yield f"{indent}    {variant}\n"
+            yield f"{indent}}} else\n"
+            tested = True
+        else:
+            variant = "None"
+        # The expression after an else has to be a block.
+        yield f"{indent}{{ {variant} }}\n" if tested else f"{indent}{variant}\n"
+        return
+
+    yield f"{indent}match insn & {hex(tree.mask)} {{\n"
+    for value, child in sorted(tree.children.items()):
+        yield f"{indent}    {hex(value)} => {{\n"
+        yield from emit_rust_decode_subtree(
+            child, decided | tree.mask, indent + "        "
         )
-    with open("inst.rs", "w", encoding="utf-8") as rust_file:
-        rust_file.write(
-            f"""
-/* Automatically generated by parse_opcodes */
-{mask_match_str}
+        yield f"{indent}    }}\n"
+    yield f"{indent}    _ => None,\n"
+    yield f"{indent}}}\n"
+
+
+def emit_rust_decode_module(instr_dict: InstrDict) -> Iterator[str]:
+    """
+    Yields a decode module with an Opcode enumeration of the instructions,
+    numbered like the riscv_insn enumeration of decode.out.h, a decode
+    function that matches on the fixed bits of the encodings, following the
+    decode tree of riscv_opcodes.decoder, and a function extracting each
+    field of arg_lut from an instruction word. Fields are returned as they
+    are encoded, without reassembling or sign-extending split immediates.
+    """
+    context = current_context()
+    yield """pub mod decode {
+    #[derive(Clone, Copy, Debug, PartialEq, Eq, Hash)]
+    #[repr(u16)]
+    pub enum Opcode {
 """
-        )
+    for i, name in enumerate(instr_dict):
+        yield f"        {rust_opcode_variant(name)} = {i + 1},\n"
+    yield f"""    }}
+
+    static NAMES: [&str; {len(instr_dict)}] = [
+"""
+    for name in instr_dict:
+        yield f'        "{name}",\n'
+    yield f"""    ];
+
+    static OPERANDS: [&[&str]; {len(instr_dict)}] = [
+"""
+    for instr in instr_dict.values():
+        operands = ", ".join(f'"{field}"' for field in instr.variable_fields)
+        yield f"        &[{operands}],\n"
+    yield """    ];
+
+    impl Opcode {
+        pub fn name(self) -> &'static str {
+            NAMES[self as usize - 1]
+        }
+
+        /// The fields of the operands, whose values the functions of the
+        /// same name extract.
+        pub fn operands(self) -> &'static [&'static str] {
+            OPERANDS[self as usize - 1]
+        }
+    }
+
+    pub fn decode(insn: u32) -> Option<Opcode> {
+"""
+    yield from emit_rust_decode_subtree(build_decode_tree(instr_dict), 0, " " * 8)
+    yield "    }\n"
+    for name, (msb, lsb) in context.arg_lut.items():
+        sanitized_name = name.replace(" ", "_").replace("=", "_eq_")
+        yield f"""
+    pub fn {sanitized_name}(insn: u32) -> u32 {{
+        (insn >> {lsb}) & {hex((1 << (msb - lsb + 1)) - 1)}
+    }}
+"""
+    yield "}\n"
+
+
+def make_rust(
+    instr_dict: InstrDict, sink: OutputTarget = None, decoder: bool = False
+) -> bool:
+    return output_sink(sink).write("inst.rs", emit_rust(instr_dict, decoder))
@@ -0,0 +1,289 @@
+import argparse
+import base64
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from .argument_utils import non_negative_int
+from .batch_utils import BATCH_OUTPUTS
+from .client import default_socket_path
+from .context import OpcodesError, generation_context, load_context
+from .decoder import Decoder
+from .generate_utils import generate_extensions
+from .shared_utils import InstrDict, InstrModel
+from .watch_utils import ResourceWatcher, invalidate_model
+
+
+# Read a field of a request, checking its type
+def request_value(request: "dict[str, Any]", key: str, kind: type, default: Any) -> Any:
+    value = request.get(key, default)
+    if not isinstance(value, kind):
+        raise OpcodesError(f"Request field {key} = {value!r} has the wrong type")
+    return value
+
+
+# Read a list field of a request, checking the type of its items
+def request_list(
+    request: "dict[str, Any]", key: str, kind: type, default: "list[Any]"
+) -> "list[Any]":
+    value = request_value(request, key, list, default)
+    for item in value:
+        if not isinstance(item, kind):
+            raise OpcodesError(
+                f"Request field {key} has an item {item!r} of the wrong type"
+            )
+    return value
+
+
+# Parse an instruction word given as an integer or a hexadecimal string
+def request_word(word: Any) -> int:
+    try:
+        if isinstance(word, bool) or not isinstance(word, (int, str)):
+            raise TypeError("not an integer or a string")
+        value = word if isinstance(word, int) else int(word, 16)
+        if not 0 <= value < 1 << 32:
+            raise ValueError("not a 32-bit word")
+        return value
+    except (TypeError, ValueError) as e:
+        raise OpcodesError(f"Invalid instruction word {word!r}") from e
+
+
+class OpcodesServer:
+    """
+    Parsed extension files and instruction dictionaries kept between
+    requests. Before each request the extension files and the CSV files are
+    checked for changes, and only the changed files are parsed again. With
+    output_root, generate requests may only write into directories inside it.
+    """
+
+    def __init__(self, jobs: int = 1, output_root: "Optional[os.PathLike[str]]" = None):
+        self.output_root = output_root
+        self.model = InstrModel(jobs)
+        self.watcher = ResourceWatcher()
+        self.context = load_context()
+        self._instr_dicts: dict[tuple[tuple[str, ...], bool], InstrDict] = {}
+        self._decoders: dict[tuple[tuple[str, ...], bool], Decoder] = {}
+
+    def refresh(self):
+        """Forgets everything derived from extension files that changed."""
+        changed = self.watcher.changes()
+        if changed:
+            logging.info(f"Changed: {', '.join(sorted(changed))}")
+            self.model = invalidate_model(self.model, changed)
+            self._instr_dicts.clear()
+            self._decoders.clear()
+            # Read the tables again and drop the aliases of lines that may no
+            # longer exist.
+            self.context = load_context()
+
+    def instr_dict(self, extensions: "list[str]", pseudo: bool) -> InstrDict:
+        key = (tuple(extensions), pseudo)
+        if key not in self._instr_dicts:
+            with generation_context(self.context):
+                self._instr_dicts[key] = self.model.create_inst_dict(extensions, pseudo)
+        return self._instr_dicts[key]
+
+    def decoder(self, extensions: "list[str]", pseudo: bool) -> Decoder:
+        key = (tuple(extensions), pseudo)
+        if key not in self._decoders:
+            self._decoders[key] = Decoder(self.instr_dict(extensions, pseudo))
+        return self._decoders[key]
+
+    def handle(self, request: "dict[str, Any]") -> "dict[str, Any]":
+        """
+        Answers a generate, query or decode request (see the README), or
+        returns {"error": message} if it fails.
+        """
+        handlers = {
+            "generate": self.generate,
+            "query": self.query,
+            "decode": self.decode,
+        }
+        try:
+            self.refresh()
+            command = request.get("command")
+            if command not in handlers:
+                raise OpcodesError(f"Unknown command {command!r}")
+            return handlers[command](
+                request_list(request, "extensions", str, []),
+                request_value(request, "pseudo", bool, False),
+                request,
+            )
+        except OpcodesError as e:
+            return {"error": str(e)}
+
+    def generate(
+        self, extensions: "list[str]", pseudo: bool, request: "dict[str, Any]"
+    ) -> "dict[str, Any]":
+        outputs = request_list(request, "outputs", str, [])
+        unknown = set(outputs) - set(BATCH_OUTPUTS)
+        if unknown:
+            raise OpcodesError(f"Unknown outputs {sorted(unknown)}")
+        directory = request_value(request, "directory", str, "")
+        if directory and not os.path.isabs(directory):
+            raise OpcodesError(f"The directory {directory} must be an absolute path")
+        if directory and self.output_root is not None:
+            root = os.path.realpath(self.output_root)
+            if os.path.commonpath([os.path.realpath(directory), root]) != root:
+                raise OpcodesError(
+                    f"The directory {directory} is outside of {self.output_root}"
+                )
+        context = load_context()
+        buffers: dict[str, bytes] = {}
+        changed = generate_extensions(
+            extensions,
+            pseudo,
+            **{output: output in outputs for output in BATCH_OUTPUTS},
+            warn_overlap=request_value(request, "warn_overlap", bool, False),
+            minimize=request_value(request, "minimize", bool, False),
+            sink=directory or buffers,
+            context=context,
+            model=self.model,
+        )
+        response: dict[str, Any] = {"changed": changed, "warnings": context.warnings}
+        if not directory:
+            response["outputs"] = {}
+            for name, data in buffers.items():
+                try:
+                    response["outputs"][name] = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    # Binary outputs such as compressed.npy are sent in base64.
+                    response.setdefault("binary_outputs", {})[name] = base64.b64encode(
+                        data
+                    ).decode("ascii")
+        return response
+
+    def query(
+        self, extensions: "list[str]", pseudo: bool, request: "dict[str, Any]"
+    ) -> "dict[str, Any]":
+        instr_dict = self.instr_dict(extensions, pseudo)
+        names = request_list(request, "names", str, list(instr_dict))
+        return {
+            "instructions": {
+                name: instr_dict[name].to_dict() for name in names if name in instr_dict
+            }
+        }
+
+    def decode(
+        self, extensions: "list[str]", pseudo: bool, request: "dict[str, Any]"
+    ) -> "dict[str, Any]":
+        words = [
+            request_word(word) for word in request_value(request, "words", list, [])
+        ]
+        decoder = self.decoder(extensions, pseudo)
+        return {"instructions": [decoder.decode(word) for word in words]}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Answers the requests of a connection, one JSON object per line."""
+
+    server: "OpcodesSocketServer"
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("a request must be a JSON object")
+            except ValueError as e:
+                response = {"error": f"Invalid request: {e}"}
+            else:
+                # The parsed state isn't shared between threads.
+                with self.server.lock:
+                    response = self.server.opcodes.handle(request)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class OpcodesSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves an OpcodesServer on a Unix domain socket. Each connection has a
+    thread, and requests are answered one at a time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: "os.PathLike[str]", opcodes: OpcodesServer):
+        self.opcodes = opcodes
+        self.lock = threading.Lock()
+        remove_stale_socket(socket_path)
+        super().__init__(str(socket_path), RequestHandler)
+
+    def server_bind(self):
+        # Only the user running the server may connect to the socket.
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        os.remove(self.server_address)
+
+
+# Remove the socket of a server that is no longer running
+def remove_stale_socket(socket_path: "os.PathLike[str]"):
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            os.remove(socket_path)
+            return
+    raise OpcodesError(f"A server is already listening on {socket_path}")
+
+
+# Signal handler that stops the server
+def stop_serving(signum: int, frame: Any):
+    raise KeyboardInterrupt
+
+
+def serve_main(argv: "list[str]"):
+    parser = argparse.ArgumentParser(
+        prog="riscv_opcodes serve",
+        description="Answer generate, query and decode requests on a Unix domain socket, keeping the parsed extension files between requests",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Socket to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=non_negative_int,
+        default=1,
+        help="Number of processes used to parse the extension files; 0 uses all CPUs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output-root",
+        type=Path,
+        help="Only let generate requests write into directories inside this one",
+    )
+    parser.add_argument(
+        "extensions",
+        nargs="*",
+        help="Extensions to parse before serving the first request, e.g. 'rv*'.",
+    )
+    args = parser.parse_args(argv)
+
+    opcodes = OpcodesServer(args.jobs or os.cpu_count() or 1, args.output_root)
+    if args.extensions:
+        opcodes.instr_dict(args.extensions, False)
+
+    # Stop on SIGTERM like on Ctrl-C, so the socket is removed.
+    signal.signal(signal.SIGTERM, stop_serving)
+    with OpcodesSocketServer(args.socket, opcodes) as server:
+        logging.info(f"Serving on {args.socket}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
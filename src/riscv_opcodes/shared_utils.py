@@ -1,15 +1,15 @@
-import copy
 import logging
 import os
 import pprint
-import re
+import sys
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 from fnmatch import fnmatch
-from io import StringIO
 from itertools import chain
-from typing import Dict, NoReturn, Optional, TypedDict
+from typing import Any, Dict, Literal, NamedTuple, Optional, Union, overload
 
 from .constants import (
-    arg_lut,
     fixed_ranges,
     imported_regex,
     overlapping_extensions,
@@ -17,7 +17,8 @@ from .constants import (
     pseudo_regex,
     single_fixed,
 )
-from .resources import open_text_resource, resource_root
+from .context import OpcodesError, current_context, use_context
+from .resources import open_text_resource, read_text_resource, resource_root
 
 LOG_FORMAT = "%(levelname)s:: %(message)s"
 LOG_LEVEL = logging.INFO
@@ -26,13 +27,6 @@ pretty_printer = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 
 
-# Log an error message
-def log_and_exit(message: str) -> NoReturn:
-    """Log an error message and exit the program."""
-    logging.error(message)
-    raise SystemExit(1)
-
-
 # Initialize encoding to 32-bit '-' values
 def initialize_encoding(bits: int = 32) -> "list[str]":
     """Initialize encoding with '-' to represent don't care bits."""
@@ -43,12 +37,12 @@ def initialize_encoding(bits: int = 32) -> "list[str]":
 def validate_bit_range(msb: int, lsb: int, entry_value: int, line: str):
     """Validate the bit range and entry value."""
     if msb < lsb:
-        log_and_exit(
+        raise OpcodesError(
             f'{line.split(" ")[0]:<10} has position {msb} less than position {lsb} in its encoding'
         )
 
     if entry_value >= (1 << (msb - lsb + 1)):
-        log_and_exit(
+        raise OpcodesError(
             f'{line.split(" ")[0]:<10} has an illegal value {entry_value} assigned as per the bit width {msb - lsb}'
         )
 
@@ -66,7 +60,7 @@ def parse_instruction_line(line: str) -> "tuple[str, str]":
 def check_overlapping_bits(encoding: "list[str]", ind: int, line: str):
     """Check for overlapping bits in the encoding."""
     if encoding[31 - ind] != "-":
-        log_and_exit(
+        raise OpcodesError(
             f'{line.split(" ")[0]:<10} has {ind} bit overlapping in its opcodes'
         )
 
@@ -112,6 +106,7 @@ def process_single_fixed(remaining: str, encoding: "list[str]", line: str):
 # Main function to check argument look-up table
 def check_arg_lut(args: "list[str]", encoding_args: "list[str]", name: str):
     """Check if arguments are present in arg_lut."""
+    arg_lut = current_context().arg_lut
     for arg in args:
         if arg not in arg_lut:
             arg = handle_arg_lut_mapping(arg, name)
@@ -122,18 +117,19 @@ def check_arg_lut(args: "list[str]", encoding_args: "list[str]", name: str):
 # Handle missing argument mappings
 def handle_arg_lut_mapping(arg: str, name: str):
     """Handle cases where an argument needs to be mapped to an existing one."""
+    arg_lut = current_context().arg_lut
     parts = arg.split("=")
     if len(parts) == 2:
         existing_arg, _new_arg = parts
         if existing_arg in arg_lut:
             arg_lut[arg] = arg_lut[existing_arg]
         else:
-            log_and_exit(
+            raise OpcodesError(
                 f" Found field {existing_arg} in variable {arg} in instruction {name} "
                 f"whose mapping in arg_lut does not exist"
             )
     else:
-        log_and_exit(
+        raise OpcodesError(
             f" Found variable {arg} in instruction {name} "
             f"whose mapping in arg_lut does not exist"
         )
@@ -149,19 +145,147 @@ def update_encoding_args(encoding_args: "list[str]", arg: str, msb: int, lsb: in
 
 
 # Compute match and mask
+def encoding_to_match_mask(encoding: "list[str]") -> "tuple[int, int]":
+    """Convert the encoding list to integer match and mask values."""
+    bits = "".join(encoding)
+    match = bits.replace("-", "0")
+    mask = bits.replace("0", "1").replace("-", "0")
+    return int(match, 2), int(mask, 2)
+
+
+# Compute match and mask as hex strings
 def convert_encoding_to_match_mask(encoding: "list[str]") -> "tuple[str, str]":
     """Convert the encoding list to match and mask strings."""
-    match = "".join(encoding).replace("-", "0")
-    mask = "".join(encoding).replace("0", "1").replace("-", "0")
-    return hex(int(match, 2)), hex(int(mask, 2))
+    match, mask = encoding_to_match_mask(encoding)
+    return hex(match), hex(mask)
+
+
+# Derive the encoding string from match and mask
+def match_mask_to_encoding(match: int, mask: int, width: int = 32) -> str:
+    """Convert integer match and mask values to an encoding string."""
+    match_bits = format(match, f"0{width}b")
+    mask_bits = format(mask, f"0{width}b")
+    return "".join(
+        bit if fixed == "1" else "-" for bit, fixed in zip(match_bits, mask_bits)
+    )
+
+
+# Interned name tuples, shared by every instruction with the same names.
+_interned_names: "dict[tuple[str, ...], tuple[str, ...]]" = {}
+
+
+# Intern a sequence of field or extension names
+def intern_names(names: "Iterable[str]") -> "tuple[str, ...]":
+    """Returns a shared tuple holding interned copies of the given names."""
+    key = tuple(sys.intern(name) for name in names)
+    return _interned_names.setdefault(key, key)
+
 
+class SingleInstr(Mapping[str, Union[str, "list[str]"]]):
+    """
+    A single instruction. The encoding is held as integer match and mask
+    values of the given bit width; the string forms used by JSON and the
+    text emitters ("encoding" and the hex "match"/"mask") are only derived
+    when asked for. The field and extension names are interned tuples that
+    are shared with every other instruction using the same names, so
+    instructions are cheap to keep around and to copy.
+
+    For compatibility with code written against the dictionary form, an
+    instruction is also a read-only mapping: instr["encoding"],
+    instr["match"], dict(instr), etc. return the string forms.
+    """
+
+    __slots__ = ("match", "mask", "width", "variable_fields", "extension")
+
+    KEYS = ("encoding", "variable_fields", "extension", "match", "mask")
+
+    def __init__(
+        self,
+        match: int,
+        mask: int,
+        variable_fields: "Iterable[str]",
+        extension: "Iterable[str]",
+        width: int = 32,
+    ):
+        self.match = match
+        self.mask = mask
+        self.width = width
+        self.variable_fields = intern_names(variable_fields)
+        self.extension = intern_names(extension)
+
+    @property
+    def encoding(self) -> str:
+        """The encoding string, with '-' for bits that are not fixed."""
+        return match_mask_to_encoding(self.match, self.mask, self.width)
+
+    def with_extensions(self, extension: "Iterable[str]") -> "SingleInstr":
+        """Returns a copy of this instruction that is also part of the given extensions."""
+        return self.replace(extension=self.extension + tuple(extension))
+
+    def replace(self, **changes: Any) -> "SingleInstr":
+        """
+        Returns a copy of this instruction with some attributes replaced.
+        Attributes that are not replaced are shared with this instruction.
+        """
+        attributes = {
+            "match": self.match,
+            "mask": self.mask,
+            "variable_fields": self.variable_fields,
+            "extension": self.extension,
+            "width": self.width,
+        }
+        attributes.update(changes)
+        return SingleInstr(**attributes)
+
+    @overload
+    def __getitem__(self, key: Literal["encoding", "match", "mask"]) -> str: ...
+
+    @overload
+    def __getitem__(
+        self, key: Literal["variable_fields", "extension"]
+    ) -> "list[str]": ...
+
+    @overload
+    def __getitem__(self, key: str) -> "Union[str, list[str]]": ...
+
+    def __getitem__(self, key: str) -> "Union[str, list[str]]":
+        if key == "encoding":
+            return self.encoding
+        if key == "variable_fields":
+            return list(self.variable_fields)
+        if key == "extension":
+            return list(self.extension)
+        if key == "match":
+            return hex(self.match)
+        if key == "mask":
+            return hex(self.mask)
+        raise KeyError(key)
+
+    def __iter__(self) -> "Iterator[str]":
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def to_dict(self) -> "dict[str, Union[str, list[str]]]":
+        """Returns the dictionary form used in instr_dict.json."""
+        return dict(self)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SingleInstr):
+            return super().__eq__(other)
+        return (
+            self.match == other.match
+            and self.mask == other.mask
+            and self.width == other.width
+            and self.variable_fields == other.variable_fields
+            and self.extension == other.extension
+        )
+
+    __hash__ = None  # type: ignore
 
-class SingleInstr(TypedDict):
-    encoding: str
-    variable_fields: "list[str]"
-    extension: "list[str]"
-    match: str
-    mask: str
+    def __repr__(self) -> str:
+        return f"SingleInstr({self.to_dict()!r})"
 
 
 InstrDict = Dict[str, SingleInstr]
@@ -180,7 +304,7 @@ def process_enc_line(line: str, ext: str) -> "tuple[str, SingleInstr]":
         - also checks that the mapping of arguments of an instruction exists in
           arg_lut.
     If the above checks pass, then the function returns a tuple of the name and
-    a dictionary containing basic information of the instruction which includes:
+    a SingleInstr containing basic information of the instruction which includes:
         - variables: list of arguments used by the instruction whose mapping
           exists in the arg_lut dictionary
         - encoding: this contains the 32-bit encoding of the instruction where
@@ -188,9 +312,9 @@ def process_enc_line(line: str, ext: str) -> "tuple[str, SingleInstr]":
           reprsent the static encoding of the bits
         - extension: this field contains the rv* filename from which this
           instruction was included
-        - match: hex value representing the bits that need to match to detect
+        - match: value representing the bits that need to match to detect
           this instruction
-        - mask: hex value representin the bits that need to be masked to extract
+        - mask: value representing the bits that need to be masked to extract
           the value required for matching.
     """
     encoding = initialize_encoding()
@@ -205,7 +329,7 @@ def process_enc_line(line: str, ext: str) -> "tuple[str, SingleInstr]":
     process_single_fixed(remaining, encoding, line)
 
     # Convert the list of encodings into a match and mask
-    match, mask = convert_encoding_to_match_mask(encoding)
+    match, mask = encoding_to_match_mask(encoding)
 
     # Check arguments in arg_lut
     args = single_fixed.sub(" ", remaining).split()
@@ -213,14 +337,17 @@ def process_enc_line(line: str, ext: str) -> "tuple[str, SingleInstr]":
 
     check_arg_lut(args, encoding_args, name)
 
-    # Return single_dict
-    return name, {
-        "encoding": "".join(encoding),
-        "variable_fields": args,
-        "extension": [os.path.basename(ext)],
-        "match": match,
-        "mask": mask,
-    }
+    return name, SingleInstr(match, mask, args, [os.path.basename(ext)])
+
+
+# Compare the encodings of two instructions
+def same_encoding(instr1: SingleInstr, instr2: SingleInstr) -> bool:
+    """Checks if two instructions have identical encodings."""
+    return (instr1.match, instr1.mask, instr1.width) == (
+        instr2.match,
+        instr2.mask,
+        instr2.width,
+    )
 
 
 # Extract ISA Type
@@ -270,6 +397,104 @@ def overlaps(x: str, y: str) -> bool:
     return all(has_no_conflict(x[i], y[i]) for i in range(len(x)))
 
 
+# Check whether two match/mask pairs can match the same instruction word
+def encodings_overlap(match1: int, mask1: int, match2: int, mask2: int) -> bool:
+    """Checks if two encodings agree on every bit that both of them fix."""
+    return (match1 ^ match2) & mask1 & mask2 == 0
+
+
+# Base ISA types that are considered the same as the given one
+def same_base_isa_types(isa_type: str) -> "set[str]":
+    """Returns the ISA types that has_same_base_isa accepts for isa_type."""
+    if isa_type == "rv":
+        return {"rv", "rv32", "rv64"}
+    if isa_type in {"rv32", "rv64"}:
+        return {isa_type, "rv"}
+    return {isa_type}
+
+
+class OverlapIndex:
+    """
+    Index of the instructions added so far, used to find encoding overlaps
+    without comparing every pair of instructions.
+
+    Instructions are bucketed by base ISA type and by their fixed opcode
+    bits: bits [6:0] if all of them are fixed, otherwise bits [1:0] if those
+    are fixed, otherwise a catch-all bucket. Only the buckets whose opcode
+    bits agree with a new instruction are examined, and the remaining
+    candidates are checked on their integer match/mask pairs.
+    """
+
+    def __init__(self):
+        # name -> (insertion order, match, mask)
+        self._entries: dict[str, tuple[int, int, int]] = {}
+        # (ISA type, number of fixed opcode bits, opcode bits) -> names
+        self._buckets: dict[tuple[str, int, int], list[str]] = {}
+        # name -> ISA types it has been added to
+        self._isa_types: dict[str, set[str]] = {}
+
+    @staticmethod
+    def _opcode_key(match: int, mask: int) -> "tuple[int, int]":
+        if mask & 0x7F == 0x7F:
+            return 7, match & 0x7F
+        if mask & 0x3 == 0x3:
+            return 2, match & 0x3
+        return 0, 0
+
+    def add(self, name: str, match: int, mask: int, extensions: "Iterable[str]"):
+        """Adds an instruction from the given extensions to the index."""
+        self._entries[name] = (len(self._entries), match, mask)
+        self._isa_types[name] = set()
+        for ext in extensions:
+            self.add_extension(name, ext)
+
+    def add_extension(self, name: str, ext: str):
+        """Records that an indexed instruction is also part of extension ext."""
+        isa_type = extract_isa_type(ext)
+        if isa_type in self._isa_types[name]:
+            return
+        self._isa_types[name].add(isa_type)
+        _, match, mask = self._entries[name]
+        width, opcode = self._opcode_key(match, mask)
+        self._buckets.setdefault((isa_type, width, opcode), []).append(name)
+
+    def _candidate_keys(
+        self, isa_type: str, match: int, mask: int
+    ) -> "list[tuple[str, int, int]]":
+        width, opcode = self._opcode_key(match, mask)
+        keys: list[tuple[str, int, int]] = []
+        for other_type in same_base_isa_types(isa_type):
+            if width == 7:
+                keys.append((other_type, 7, opcode))
+                keys.append((other_type, 2, opcode & 0x3))
+            else:
+                keys.extend(
+                    (other_type, 7, other)
+                    for other in range(0x80)
+                    if width == 0 or other & 0x3 == opcode
+                )
+                keys.extend(
+                    (other_type, 2, other)
+                    for other in range(0x4)
+                    if width == 0 or other == opcode
+                )
+            keys.append((other_type, 0, 0))
+        return keys
+
+    def overlapping(self, ext_name: str, match: int, mask: int) -> "list[str]":
+        """
+        Returns the indexed instructions, in the order they were added, that
+        share a base ISA with ext_name and whose encoding overlaps match/mask.
+        """
+        found: set[str] = set()
+        for key in self._candidate_keys(extract_isa_type(ext_name), match, mask):
+            for name in self._buckets.get(key, ()):
+                _, other_match, other_mask = self._entries[name]
+                if encodings_overlap(match, mask, other_match, other_mask):
+                    found.add(name)
+        return sorted(found, key=lambda name: self._entries[name][0])
+
+
 # Check presence of keys in dictionary.
 def is_in_nested_dict(a: "dict[str, set[str]]", key1: str, key2: str) -> bool:
     """Checks if key2 exists in the dictionary under key1."""
@@ -297,7 +522,7 @@ def instruction_overlap_allowed(x: str, y: str) -> bool:
 # Check 'nf' field
 def is_segmented_instruction(instruction: SingleInstr) -> bool:
     """Checks if an instruction contains the 'nf' field."""
-    return "nf" in instruction["variable_fields"]
+    return "nf" in instruction.variable_fields
 
 
 # Expand 'nf' fields
@@ -331,18 +556,19 @@ def expand_nf_field(
 ) -> "list[tuple[str, SingleInstr]]":
     """Validate and prepare the instruction dictionary."""
     validate_nf_field(single_dict, name)
-    remove_nf_field(single_dict)
-    update_mask(single_dict)
 
-    name_expand_index = name.find("e")
+    # The expanded instructions fix the 'nf' field instead of taking it as an
+    # argument. They all share the same field and extension tuples.
+    variable_fields = intern_names(
+        field for field in single_dict.variable_fields if field != "nf"
+    )
+    mask = single_dict.mask | 0b111 << 29
 
-    # Pre compute the base match value and encoding prefix
-    base_match = int(single_dict["match"], 16)
-    encoding_prefix = single_dict["encoding"][3:]
+    name_expand_index = name.find("e")
 
     expanded_instructions = [
         create_expanded_instruction(
-            name, single_dict, nf, name_expand_index, base_match, encoding_prefix
+            name, single_dict, nf, name_expand_index, variable_fields, mask
         )
         for nf in range(8)  # Range of 0 to 7
     ]
@@ -353,20 +579,8 @@ def expand_nf_field(
 # Validate the presence of 'nf'
 def validate_nf_field(single_dict: SingleInstr, name: str):
     """Validates the presence of 'nf' in variable fields before expansion."""
-    if "nf" not in single_dict["variable_fields"]:
-        log_and_exit(f"Cannot expand nf field for instruction {name}")
-
-
-# Remove 'nf' from variable fields
-def remove_nf_field(single_dict: SingleInstr):
-    """Removes 'nf' from variable fields in the instruction dictionary."""
-    single_dict["variable_fields"].remove("nf")
-
-
-# Update the mask to include the 'nf' field
-def update_mask(single_dict: SingleInstr):
-    """Updates the mask to include the 'nf' field in the instruction dictionary."""
-    single_dict["mask"] = hex(int(single_dict["mask"], 16) | 0b111 << 29)
+    if "nf" not in single_dict.variable_fields:
+        raise OpcodesError(f"Cannot expand nf field for instruction {name}")
 
 
 # Create an expanded instruction
@@ -375,15 +589,15 @@ def create_expanded_instruction(
     single_dict: SingleInstr,
     nf: int,
     name_expand_index: int,
-    base_match: int,
-    encoding_prefix: str,
+    variable_fields: "tuple[str, ...]",
+    mask: int,
 ) -> "tuple[str, SingleInstr]":
     """Creates an expanded instruction based on 'nf' value."""
-    new_single_dict = copy.deepcopy(single_dict)
-
-    # Update match value in one step
-    new_single_dict["match"] = hex(base_match | (nf << 29))
-    new_single_dict["encoding"] = format(nf, "03b") + encoding_prefix
+    new_single_dict = single_dict.replace(
+        match=single_dict.match | (nf << 29),
+        mask=mask,
+        variable_fields=variable_fields,
+    )
 
     # Construct new instruction name
     new_name = (
@@ -405,67 +619,297 @@ def read_lines(file: str) -> "list[str]":
         return [line for line in lines if line and not line.startswith("#")]
 
 
+class ExtensionFile(NamedTuple):
+    """
+    Tokenized contents of a single extension file. The lines are classified
+    once when the file is loaded so that the standard, pseudo-op and import
+    passes of create_inst_dict never need to touch the file again.
+    """
+
+    # Resource path of the file, e.g. "extensions/rv_i".
+    name: str
+    # Regular instruction lines.
+    standard: "list[str]"
+    # (extension, original instruction, pseudo instruction, encoding) for
+    # every $pseudo_op line.
+    pseudo: "list[tuple[str, str, str, str]]"
+    # (extension, instruction) for every $import line.
+    imports: "list[tuple[str, str]]"
+    # Instruction name (as written in the file) -> its line.
+    index: "dict[str, str]"
+
+
+# Split the lines of an extension file into standard, pseudo and import records
+def tokenize_extension_lines(name: str, lines: "list[str]") -> ExtensionFile:
+    """Classifies the lines of an extension file and indexes them by name."""
+    standard: list[str] = []
+    pseudo: list[tuple[str, str, str, str]] = []
+    imports: list[tuple[str, str]] = []
+    index: dict[str, str] = {}
+
+    for line in lines:
+        index.setdefault(line.split()[0], line)
+        if "$pseudo" in line:
+            pseudo.append(pseudo_regex.findall(line)[0])
+        elif "$import" in line:
+            imports.append(imported_regex.findall(line)[0])
+        else:
+            standard.append(line)
+
+    return ExtensionFile(name, standard, pseudo, imports, index)
+
+
+class ExtensionLoader:
+    """
+    Loads extension files, reading and tokenizing each one at most once.
+    Dependencies named by $pseudo_op and $import lines are resolved through
+    the same cache.
+    """
+
+    def __init__(self):
+        self._files: dict[str, ExtensionFile] = {}
+        self._resolved: dict[str, ExtensionFile] = {}
+
+    def load(self, file_name: str) -> ExtensionFile:
+        """Returns the tokenized extension file at the given resource path."""
+        ext_file = self._files.get(file_name)
+        if ext_file is None:
+            logging.debug(f"Loading File: {file_name}")
+            ext_file = tokenize_extension_lines(file_name, read_lines(file_name))
+            self._files[file_name] = ext_file
+        return ext_file
+
+    def add(self, ext_file: ExtensionFile):
+        """Adds a file that has been tokenized elsewhere to the cache."""
+        self._files.setdefault(ext_file.name, ext_file)
+
+    def resolve(self, ext: str) -> ExtensionFile:
+        """
+        Returns the tokenized extension file for an extension name such as
+        "rv_i", considering the unratified directory if necessary.
+        """
+        ext_file = self._resolved.get(ext)
+        if ext_file is None:
+            ext_file = self.load(extension_file_path(ext))
+            self._resolved[ext] = ext_file
+        return ext_file
+
+    def invalidate(self, file_names: "Iterable[str]"):
+        """
+        Forgets the files at the given resource paths so they are read again.
+        Extension names are resolved again as well, since adding or removing a
+        file can change which directory they resolve to.
+        """
+        for file_name in file_names:
+            self._files.pop(file_name, None)
+        self._resolved.clear()
+
+
+# Build an overlap index from the contents of an instruction dictionary
+def build_overlap_index(instr_dict: InstrDict) -> OverlapIndex:
+    """Creates an OverlapIndex containing every instruction of instr_dict."""
+    overlap_index = OverlapIndex()
+    for name, item in instr_dict.items():
+        overlap_index.add(name, item.match, item.mask, item.extension)
+    return overlap_index
+
+
+# Add a standard instruction to the instruction dictionary
+def add_standard_instruction(
+    name: str,
+    single_dict: SingleInstr,
+    instr_dict: InstrDict,
+    file_name: str,
+    warn_overlap: bool,
+    overlap_index: OverlapIndex,
+):
+    """
+    Adds an encoded standard instruction to the instruction dictionary,
+    checking it against the instructions that have already been added.
+    """
+    ext_name = os.path.basename(file_name)
+
+    if name in instr_dict:
+        var = list(instr_dict[name].extension)
+        if same_base_isa(ext_name, var):
+            raise OpcodesError(
+                f"Instruction {name} from {ext_name} is already added from {var} in same base ISA"
+            )
+        if not same_encoding(instr_dict[name], single_dict):
+            raise OpcodesError(
+                f"Instruction {name} from {ext_name} has different encodings in different base ISAs"
+            )
+
+        instr_dict[name] = instr_dict[name].with_extensions(single_dict.extension)
+        overlap_index.add_extension(name, ext_name)
+    else:
+        match, mask = single_dict.match, single_dict.mask
+        for key in overlap_index.overlapping(ext_name, match, mask):
+            item = instr_dict[key]
+            if not extension_overlap_allowed(
+                ext_name, item.extension[0]
+            ) and not instruction_overlap_allowed(name, key):
+                overlap_msg = f"Instruction {name} in extension {ext_name} overlaps with {key} in {list(item.extension)}"
+                if warn_overlap:
+                    current_context().warn(overlap_msg)
+                else:
+                    raise OpcodesError(overlap_msg)
+
+        instr_dict[name] = single_dict
+        overlap_index.add(name, match, mask, single_dict.extension)
+
+
 # Update the instruction dictionary
 def process_standard_instructions(
     lines: "list[str]",
     instr_dict: InstrDict,
     file_name: str,
     warn_overlap: bool = False,
+    overlap_index: Optional[OverlapIndex] = None,
 ):
-    """Processes standard instructions from the given lines and updates the instruction dictionary."""
+    """
+    Processes standard instructions from the given lines and updates the instruction dictionary.
+
+    overlap_index must describe the contents of instr_dict; it is kept up to
+    date as instructions are added. If it is not given it is built from
+    instr_dict.
+    """
+    if overlap_index is None:
+        overlap_index = build_overlap_index(instr_dict)
+
     for line in lines:
         if "$import" in line or "$pseudo" in line:
             continue
         logging.debug(f"Processing line: {line}")
         name, single_dict = process_enc_line(line, file_name)
-        ext_name = os.path.basename(file_name)
+        add_standard_instruction(
+            name, single_dict, instr_dict, file_name, warn_overlap, overlap_index
+        )
 
-        if name in instr_dict:
-            var = instr_dict[name]["extension"]
-            if same_base_isa(ext_name, var):
-                log_and_exit(
-                    f"Instruction {name} from {ext_name} is already added from {var} in same base ISA"
-                )
-            elif instr_dict[name]["encoding"] != single_dict["encoding"]:
-                log_and_exit(
-                    f"Instruction {name} from {ext_name} has different encodings in different base ISAs"
-                )
 
-            instr_dict[name]["extension"].extend(single_dict["extension"])
-        else:
-            for key, item in instr_dict.items():
-                if (
-                    overlaps(item["encoding"], single_dict["encoding"])
-                    and not extension_overlap_allowed(ext_name, item["extension"][0])
-                    and not instruction_overlap_allowed(name, key)
-                    and same_base_isa(ext_name, item["extension"])
-                ):
-                    overlap_msg = f'Instruction {name} in extension {ext_name} overlaps with {key} in {item["extension"]}'
-                    if warn_overlap:
-                        logging.warning(overlap_msg)
-                    else:
-                        log_and_exit(overlap_msg)
+class LogRecordBuffer(logging.Handler):
+    """Logging handler that keeps records so they can be emitted later."""
 
-            instr_dict[name] = single_dict
+    def __init__(self):
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+# Capture log records instead of emitting them
+@contextmanager
+def capture_log_records() -> "Iterator[list[logging.LogRecord]]":
+    """
+    Sends everything logged inside the block to the returned list instead of
+    the handlers of the root logger, so it can be emitted later with
+    replay_log_records, possibly in another process.
+    """
+    buffer = LogRecordBuffer()
+    root_logger = logging.getLogger()
+    saved_handlers = root_logger.handlers
+    root_logger.handlers = [buffer]
+    try:
+        yield buffer.records
+    finally:
+        root_logger.handlers = saved_handlers
+
+
+# Emit log records captured by capture_log_records
+def replay_log_records(records: "list[logging.LogRecord]"):
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+
+
+class EncodedExtensionFile(NamedTuple):
+    """
+    An extension file whose standard instructions have been encoded, but not
+    yet added to an instruction dictionary.
+    """
+
+    ext_file: ExtensionFile
+    # (name, instruction) for every standard instruction up to the first
+    # line that failed to encode.
+    standard: "list[tuple[str, SingleInstr]]"
+    # Log records emitted while encoding, to be replayed in file order.
+    log_records: "list[logging.LogRecord]"
+    # The error that stopped encoding at an invalid line, if any.
+    error: Optional[OpcodesError]
+
+
+# Encode the standard instructions of an extension file
+def encode_extension_file(
+    file_name: str, capture_logs: bool = True
+) -> EncodedExtensionFile:
+    """
+    Reads an extension file and encodes its standard instructions. This only
+    depends on the file itself so it can run in a worker process. An error
+    is returned instead of raised so that it can be reported in file order,
+    and with capture_logs other log messages are captured instead of being
+    emitted. Capturing swaps the handlers of the root logger, so it is only
+    safe in a process of its own.
+    """
+    standard: list[tuple[str, SingleInstr]] = []
+    error = None
+    # Stands for a file that can't be read or tokenized; error says why.
+    ext_file = ExtensionFile(file_name, [], [], [], {})
+    with capture_log_records() if capture_logs else nullcontext([]) as log_records:
+        try:
+            ext_file = tokenize_extension_lines(file_name, read_lines(file_name))
+            for line in ext_file.standard:
+                logging.debug(f"Processing line: {line}")
+                standard.append(process_enc_line(line, file_name))
+        except OpcodesError as e:
+            error = e
+    return EncodedExtensionFile(ext_file, standard, log_records, error)
+
+
+# Add the encoded standard instructions of an extension file
+def add_encoded_extension_file(
+    encoded: EncodedExtensionFile,
+    instr_dict: InstrDict,
+    warn_overlap: bool,
+    overlap_index: OverlapIndex,
+):
+    """
+    Adds the instructions encoded by encode_extension_file to the instruction
+    dictionary, then replays the messages logged while encoding them and
+    raises the error encoding stopped at.
+    """
+    file_name = encoded.ext_file.name
+    arg_lut = current_context().arg_lut
+    for name, single_dict in encoded.standard:
+        # Register the "field=alias" arguments the worker added to its arg_lut.
+        for arg in single_dict.variable_fields:
+            if arg not in arg_lut:
+                handle_arg_lut_mapping(arg, name)
+        add_standard_instruction(
+            name, single_dict, instr_dict, file_name, warn_overlap, overlap_index
+        )
+
+    replay_log_records(encoded.log_records)
+    if encoded.error is not None:
+        raise encoded.error
 
 
 # Incorporate pseudo instructions into the instruction dictionary based on given conditions
 def process_pseudo_instructions(
-    lines: "list[str]",
+    ext_file: ExtensionFile,
     instr_dict: InstrDict,
-    file_name: str,
+    loader: ExtensionLoader,
     include_pseudo: bool,
     include_pseudo_ops: "list[str]",
 ):
-    """Processes pseudo instructions from the given lines and updates the instruction dictionary."""
-    for line in lines:
-        if "$pseudo" not in line:
-            continue
-        logging.debug(f"Processing pseudo line: {line}")
-        ext, orig_inst, pseudo_inst, line_content = pseudo_regex.findall(line)[0]
-        ext_file = read_extension_file(ext)
-
-        validate_instruction_in_extension(orig_inst, ext_file, file_name, pseudo_inst)
+    """Processes pseudo instructions from the given file and updates the instruction dictionary."""
+    file_name = ext_file.name
+    for ext, orig_inst, pseudo_inst, line_content in ext_file.pseudo:
+        logging.debug(f"Processing pseudo op: {pseudo_inst} in {file_name}")
+        dependent_file = loader.resolve(ext)
+
+        validate_instruction_in_extension(
+            orig_inst, dependent_file, file_name, pseudo_inst
+        )
 
         name, single_dict = process_enc_line(f"{pseudo_inst} {line_content}", file_name)
         if (
@@ -477,78 +921,245 @@ def process_pseudo_instructions(
                 instr_dict[name] = single_dict
                 logging.debug(f"Including pseudo_op: {name}")
             else:
-                if single_dict["match"] != instr_dict[name]["match"]:
+                if single_dict.match != instr_dict[name].match:
                     instr_dict[f"{name}_pseudo"] = single_dict
                 # TODO: This expression is always false since both sides are list[str].
-                elif single_dict["extension"] not in instr_dict[name]["extension"]:  # type: ignore
-                    instr_dict[name]["extension"].extend(single_dict["extension"])
+                elif single_dict.extension not in instr_dict[name].extension:  # type: ignore
+                    instr_dict[name] = instr_dict[name].with_extensions(
+                        single_dict.extension
+                    )
 
 
 # Integrate imported instructions into the instruction dictionary
 def process_imported_instructions(
-    lines: "list[str]", instr_dict: InstrDict, file_name: str
+    ext_file: ExtensionFile, instr_dict: InstrDict, loader: ExtensionLoader
 ):
-    """Processes imported instructions from the given lines and updates the instruction dictionary."""
-    for line in lines:
-        if "$import" not in line:
-            continue
-        logging.debug(f"Processing imported line: {line}")
-        import_ext, reg_instr = imported_regex.findall(line)[0]
-        ext_file = read_extension_file(import_ext)
-
-        validate_instruction_in_extension(reg_instr, ext_file, file_name, line)
-
-        for oline in StringIO(ext_file):
-            if re.findall(f"^\\s*{reg_instr}\\s+", oline):
-                name, single_dict = process_enc_line(oline, file_name)
-                if name in instr_dict:
-                    if instr_dict[name]["encoding"] != single_dict["encoding"]:
-                        log_and_exit(
-                            f"Imported instruction {name} from {os.path.basename(file_name)} has different encodings"
-                        )
-                    instr_dict[name]["extension"].extend(single_dict["extension"])
-                else:
-                    instr_dict[name] = single_dict
-                break
+    """Processes imported instructions from the given file and updates the instruction dictionary."""
+    file_name = ext_file.name
+    for import_ext, reg_instr in ext_file.imports:
+        logging.debug(f"Processing import: {import_ext}::{reg_instr} in {file_name}")
+        dependent_file = loader.resolve(import_ext)
+
+        validate_instruction_in_extension(
+            reg_instr, dependent_file, file_name, f"$import {import_ext}::{reg_instr}"
+        )
+
+        name, single_dict = process_enc_line(dependent_file.index[reg_instr], file_name)
+        if name in instr_dict:
+            if not same_encoding(instr_dict[name], single_dict):
+                raise OpcodesError(
+                    f"Imported instruction {name} from {os.path.basename(file_name)} has different encodings"
+                )
+            instr_dict[name] = instr_dict[name].with_extensions(single_dict.extension)
+        else:
+            instr_dict[name] = single_dict
+
+
+# Locate an extension file, considering the unratified directory if necessary
+def extension_file_path(ext: str) -> str:
+    """
+    Returns the resource path of the extension file, considering the
+    unratified directory if necessary.
+    """
+    for directory in ("extensions", "extensions/unratified"):
+        if (resource_root() / directory / ext).is_file():
+            return f"{directory}/{ext}"
+
+    raise OpcodesError(f"Extension {ext} not found.")
 
 
 def read_extension_file(ext: str) -> str:
     """
     Read the extension file path, considering the unratified directory if necessary.
     """
-    file = resource_root() / "extensions" / ext
-    if file.is_file():
-        return file.read_text(encoding="utf-8")
-    file = resource_root() / "extensions" / "unratified" / ext
-    if file.is_file():
-        return file.read_text(encoding="utf-8")
-
-    log_and_exit(f"Extension {ext} not found.")
+    return read_text_resource(extension_file_path(ext))
 
 
 # Confirm the presence of an original instruction in the corresponding extension file.
 def validate_instruction_in_extension(
-    inst: str, ext_file: str, file_name: str, pseudo_inst: str
+    inst: str, ext_file: ExtensionFile, file_name: str, pseudo_inst: str
 ):
     """Validates if the original instruction exists in the dependent extension."""
-    found = False
-
-    for oline in StringIO(ext_file):
-        if re.findall(f"^\\s*{inst}\\s+", oline):
-            found = True
-            break
-    if not found:
-        log_and_exit(
-            f"Original instruction {inst} required by pseudo_op {pseudo_inst} in {file_name} not found in {ext_file}"
+    if inst not in ext_file.index:
+        raise OpcodesError(
+            f"Original instruction {inst} required by pseudo_op {pseudo_inst} in {file_name} not found in {ext_file.name}"
         )
 
 
+# Split a file filter into the filters of the ratified and unratified files
+def split_file_filter(file_filter: "list[str]") -> "tuple[list[str], list[str]]":
+    ratified_file_filters = [
+        fil for fil in file_filter if not fil.startswith("unratified/")
+    ]
+    unratified_file_filters = [
+        fil.removeprefix("unratified/")
+        for fil in file_filter
+        if fil.startswith("unratified/")
+    ]
+    return ratified_file_filters, unratified_file_filters
+
+
+# Select the extension files matching a file filter
+def select_extension_files(file_filter: "list[str]") -> "list[str]":
+    """
+    Returns the resource paths ("extensions[/unratified]/rv_foo") of the
+    extension files matching the file filter. The files are returned in
+    sorted order so that results do not depend on the order in which the
+    file system lists them.
+    """
+    ratified_file_filters, unratified_file_filters = split_file_filter(file_filter)
+
+    file_names: list[str] = []
+
+    for file in sorted(
+        (resource_root() / "extensions").iterdir(), key=lambda f: f.name
+    ):
+        if file.is_file() and any(
+            fnmatch(file.name, fil) for fil in ratified_file_filters
+        ):
+            file_names.append("extensions/" + file.name)
+    for file in sorted(
+        (resource_root() / "extensions" / "unratified").iterdir(), key=lambda f: f.name
+    ):
+        if file.is_file() and any(
+            fnmatch(file.name, fil) for fil in unratified_file_filters
+        ):
+            file_names.append("extensions/unratified/" + file.name)
+
+    return file_names
+
+
+# Check whether a file filter selects an extension file
+def file_filter_selects(file_filter: "list[str]", file_name: str) -> bool:
+    """
+    Checks whether select_extension_files would return the resource path
+    file_name if the file existed, so that it also works for files that
+    were just deleted.
+    """
+    ratified_file_filters, unratified_file_filters = split_file_filter(file_filter)
+    directory, _, name = file_name.rpartition("/")
+    if directory == "extensions":
+        return any(fnmatch(name, fil) for fil in ratified_file_filters)
+    if directory == "extensions/unratified":
+        return any(fnmatch(name, fil) for fil in unratified_file_filters)
+    return False
+
+
+class InstrModel:
+    """
+    Extension files parsed once and shared by every instruction dictionary
+    created from them. A file is read, tokenized and has its standard
+    instructions encoded the first time a dictionary needs it; later
+    dictionaries only redo the merging passes (duplicate and overlap checks,
+    pseudo-ops and imports) for their own selection of files and pseudo-op
+    policy, which is cheap. Instructions are never modified once they have
+    been created, so the dictionaries can share them.
+    """
+
+    def __init__(self, jobs: int = 1):
+        self.jobs = jobs
+        self.loader = ExtensionLoader()
+        self._encoded: dict[str, EncodedExtensionFile] = {}
+
+    def _add_encoded(self, encoded: EncodedExtensionFile):
+        self.loader.add(encoded.ext_file)
+        self._encoded[encoded.ext_file.name] = encoded
+
+    def encode(self, file_names: "list[str]") -> "list[EncodedExtensionFile]":
+        """
+        Returns the encoded extension files, encoding the ones that have not
+        been needed before (in a process pool if jobs > 1).
+        """
+        missing = [name for name in file_names if name not in self._encoded]
+        if self.jobs > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(
+                max_workers=self.jobs,
+                initializer=use_context,
+                initargs=(current_context(),),
+            ) as executor:
+                for encoded in executor.map(encode_extension_file, missing):
+                    self._add_encoded(encoded)
+        else:
+            for file_name in missing:
+                self._add_encoded(encode_extension_file(file_name, False))
+        return [self._encoded[name] for name in file_names]
+
+    def invalidate(self, file_names: "Iterable[str]"):
+        """
+        Forgets the files at the given resource paths, for instance because
+        they were edited, so the next dictionary that needs them parses them
+        again. The other files stay parsed.
+        """
+        file_names = list(file_names)
+        for file_name in file_names:
+            self._encoded.pop(file_name, None)
+        self.loader.invalidate(file_names)
+
+    def dependencies(self, file_filter: "list[str]") -> "list[str]":
+        """
+        Returns the resource paths of the extension files read by
+        create_inst_dict for the file filter: the selected files and the
+        files named by their $pseudo_op and $import lines.
+        """
+        file_names = dict.fromkeys(select_extension_files(file_filter))
+        for file_name in list(file_names):
+            ext_file = self.loader.load(file_name)
+            for ext, *_ in chain(ext_file.pseudo, ext_file.imports):
+                file_names[self.loader.resolve(ext).name] = None
+        return sorted(file_names)
+
+    def create_inst_dict(
+        self,
+        file_filter: "list[str]",
+        include_pseudo: bool = False,
+        include_pseudo_ops: "Optional[list[str]]" = None,
+        warn_overlap: bool = False,
+    ) -> InstrDict:
+        """
+        Creates a dictionary of instructions from the parsed extension files,
+        see the create_inst_dict function.
+        """
+        if include_pseudo_ops is None:
+            include_pseudo_ops = []
+
+        instr_dict: InstrDict = {}
+        overlap_index = OverlapIndex()
+        ext_files: list[ExtensionFile] = []
+
+        logging.debug("Collecting standard instructions")
+        for encoded in self.encode(select_extension_files(file_filter)):
+            logging.debug(
+                f"Parsing File: {encoded.ext_file.name} for standard instructions"
+            )
+            ext_files.append(encoded.ext_file)
+            add_encoded_extension_file(encoded, instr_dict, warn_overlap, overlap_index)
+
+        logging.debug("Collecting pseudo instructions")
+        for ext_file in ext_files:
+            logging.debug(f"Parsing File: {ext_file.name} for pseudo instructions")
+            process_pseudo_instructions(
+                ext_file,
+                instr_dict,
+                self.loader,
+                include_pseudo,
+                include_pseudo_ops,
+            )
+
+        logging.debug("Collecting imported instructions")
+        for ext_file in ext_files:
+            logging.debug(f"Parsing File: {ext_file.name} for imported instructions")
+            process_imported_instructions(ext_file, instr_dict, self.loader)
+
+        return instr_dict
+
+
 # Construct a dictionary of instructions filtered by specified criteria
 def create_inst_dict(
     file_filter: "list[str]",
     include_pseudo: bool = False,
     include_pseudo_ops: "Optional[list[str]]" = None,
     warn_overlap: bool = False,
+    jobs: int = 1,
 ) -> InstrDict:
     """
     Creates a dictionary of instructions based on the provided file filters.
@@ -569,77 +1180,35 @@ def create_inst_dict(
           this instruction
         - mask: hex value representin the bits that need to be masked to extract
           the value required for matching.
-    In order to build this dictionary, the function does 2 passes over the same
-    rv<file_filter> file:
-        - First pass: extracts all standard instructions, skipping pseudo ops
-          and imported instructions. For each selected line, the `process_enc_line`
-          function is called to create the dictionary contents of the instruction.
-          Checks are performed to ensure that the same instruction is not added
-          twice to the overall dictionary.
+    Each selected rv<file_filter> file is read, tokenized and has its standard
+    instructions encoded by `process_enc_line` exactly once by an InstrModel,
+    which also caches the files that pseudo_ops and imports depend on. The
+    function then does 3 passes over the encoded files:
+        - First pass: adds all standard instructions, skipping pseudo ops
+          and imported instructions. Checks are performed to ensure that the
+          same instruction is not added twice to the overall dictionary.
         - Second pass: parses only pseudo_ops. For each pseudo_op, the function:
             - Checks if the dependent extension and instruction exist.
             - Adds the pseudo_op to the dictionary if the dependent instruction
               is not already present; otherwise, it is skipped.
+        - Third pass: parses only imported instructions, adding the encoding
+          of the instruction from the dependent extension.
+    With jobs > 1 the files are read and their standard instructions encoded
+    in a pool of that many worker processes. The encoded files are still
+    added to the dictionary one by one in sorted file order, so the result
+    and any error messages are the same as for a sequential parse.
+
+    To create several dictionaries from the same files, use the
+    create_inst_dict method of a single InstrModel instead.
     """
-    if include_pseudo_ops is None:
-        include_pseudo_ops = []
-
-    instr_dict: InstrDict = {}
-
-    ratified_file_filters = [
-        fil for fil in file_filter if not fil.startswith("unratified/")
-    ]
-    unratified_file_filters = [
-        fil.removeprefix("unratified/")
-        for fil in file_filter
-        if fil.startswith("unratified/")
-    ]
-
-    # Extension file name, "extensions[/unratified]/rv_foo".
-    file_names: list[str] = []
-
-    for file in (resource_root() / "extensions").iterdir():
-        if file.is_file() and any(
-            fnmatch(file.name, fil) for fil in ratified_file_filters
-        ):
-            file_names.append("extensions/" + file.name)
-    for file in (resource_root() / "extensions" / "unratified").iterdir():
-        if file.is_file() and any(
-            fnmatch(file.name, fil) for fil in unratified_file_filters
-        ):
-            file_names.append("extensions/unratified/" + file.name)
-
-    logging.debug("Collecting standard instructions")
-    for file_name in file_names:
-        logging.debug(f"Parsing File: {file_name} for standard instructions")
-        lines = read_lines(file_name)
-        process_standard_instructions(lines, instr_dict, file_name, warn_overlap)
-
-    logging.debug("Collecting pseudo instructions")
-    for file_name in file_names:
-        logging.debug(f"Parsing File: {file_name} for pseudo instructions")
-        lines = read_lines(file_name)
-        process_pseudo_instructions(
-            lines,
-            instr_dict,
-            file_name,
-            include_pseudo,
-            include_pseudo_ops,
-        )
-
-    logging.debug("Collecting imported instructions")
-
-    for file_name in file_names:
-        logging.debug(f"Parsing File: {file_name} for imported instructions")
-        lines = read_lines(file_name)
-        process_imported_instructions(lines, instr_dict, file_name)
-
-    return instr_dict
+    return InstrModel(jobs).create_inst_dict(
+        file_filter, include_pseudo, include_pseudo_ops, warn_overlap
+    )
 
 
 # Extracts the extensions used in an instruction dictionary
 def instr_dict_2_extensions(instr_dict: InstrDict) -> "list[str]":
-    return list({item["extension"][0] for item in instr_dict.values()})
+    return sorted({item.extension[0] for item in instr_dict.values()})
 
 
 # Returns signed interpretation of a value within a given width
@@ -1,30 +1,87 @@
 import logging
 import pprint
-from pathlib import Path
+from collections.abc import Iterator
 
-from .constants import csrs, csrs32
+from .context import current_context
+from .minimize_utils import cube_encoding, minimize_instructions, minimize_legal
+from .output_utils import OutputTarget, output_sink
 from .shared_utils import InstrDict
 
 pp = pprint.PrettyPrinter(indent=2)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:: %(message)s")
 
 
-def make_sverilog(instr_dict: InstrDict):
-    names_str = ""
-    for i in instr_dict:
-        names_str += f"  localparam [31:0] {i.upper().replace('.','_'):<18s} = 32'b{instr_dict[i]['encoding'].replace('-','?')};\n"
-    names_str += "  /* CSR Addresses */\n"
-    for num, name in csrs + csrs32:
-        names_str += (
-            f"  localparam logic [11:0] CSR_{name.upper()} = 12'h{hex(num)[2:]};\n"
-        )
-
-    Path("inst.sverilog").write_text(
-        f"""
+def emit_sverilog(instr_dict: InstrDict, minimize: bool = False) -> Iterator[str]:
+    context = current_context()
+    yield """
 /* Automatically generated by parse_opcodes */
 package riscv_instr;
-{names_str}
+"""
+    for i, instr in instr_dict.items():
+        yield f"  localparam [31:0] {i.upper().replace('.','_'):<18s} = 32'b{instr.encoding.replace('-','?')};\n"
+    yield "  /* CSR Addresses */\n"
+    for num, name in context.csrs + context.csrs32:
+        yield f"  localparam logic [11:0] CSR_{name.upper()} = 12'h{hex(num)[2:]};\n"
+    if minimize:
+        yield from emit_sverilog_minimized(instr_dict)
+    yield """
 endpackage
-""",
-        encoding="utf-8",
+"""
+
+
+# Name of the enumerator of an instruction in the minimized decoder
+def sverilog_insn_id(name: str) -> str:
+    return f"INSN_{name.upper().replace('.', '_')}"
+
+
+def emit_sverilog_minimized(instr_dict: InstrDict) -> Iterator[str]:
+    """
+    Yields a legal_insn function with a casez item per cube of the
+    minimized legal words, and a decode_insn function with a casez item per
+    cube of the minimized instruction patterns, which only compare the bits
+    that tell the instructions apart.
+    """
+    patterns = minimize_instructions(instr_dict)
+    width = max(1, len(instr_dict).bit_length())
+    yield f"""
+  /* Minimized decoder */
+  typedef enum logic [{width - 1}:0] {{
+    INSN_UNKNOWN,
+"""
+    yield ",\n".join(f"    {sverilog_insn_id(name)}" for name in instr_dict)
+    yield """
+  } insn_e;
+
+  function automatic logic legal_insn(input logic [31:0] insn);
+    casez (insn)
+"""
+    yield ",\n".join(
+        f"      32'b{cube_encoding(cube).replace('-', '?')}"
+        for cube in minimize_legal(instr_dict)
     )
+    yield """: return 1'b1;
+      default: return 1'b0;
+    endcase
+  endfunction
+
+  /* The patterns only tell legal instructions apart, so at most one matches. */
+  function automatic insn_e decode_insn(input logic [31:0] insn);
+    if (!legal_insn(insn)) return INSN_UNKNOWN;
+    unique casez (insn)
+"""
+    for name, cubes in patterns.items():
+        if cubes:
+            items = ", ".join(
+                f"32'b{cube_encoding(cube).replace('-', '?')}" for cube in cubes
+            )
+            yield f"      {items}: return {sverilog_insn_id(name)};\n"
+    yield """      default: return INSN_UNKNOWN;
+    endcase
+  endfunction
+"""
+
+
+def make_sverilog(
+    instr_dict: InstrDict, sink: OutputTarget = None, minimize: bool = False
+) -> bool:
+    return output_sink(sink).write("inst.sverilog", emit_sverilog(instr_dict, minimize))
@@ -1,7 +1,10 @@
+import io
 import logging
 import pprint
+from collections.abc import Iterator
 from typing import Dict, List, NamedTuple
 
+from .output_utils import OutputTarget, output_sink
 from .rv_colors import palette
 from .shared_utils import InstrDict, instr_dict_2_extensions
 
@@ -71,8 +74,8 @@ def plot_image(
     instr_dict: InstrDict,
     instr_dims_dict: InstrDimsDict,
     extension_sizes: Dict[str, float],
-) -> None:
-    """Plot the instruction rectangles using matplotlib."""
+) -> str:
+    """Plot the instruction rectangles using matplotlib and return the SVG."""
 
     from matplotlib import patches
     from matplotlib import pyplot as plt
@@ -98,7 +101,7 @@ def plot_image(
         colors: list[str],
         hatches: list[str],
         extensions: list[str],
-    ) -> None:
+    ) -> str:
         """Plot rectangles with matplotlib using specified styles."""
 
         _, ax = plt.subplots(figsize=(FIGSIZE, FIGSIZE), facecolor="none")  # type: ignore
@@ -151,8 +154,10 @@ def plot_image(
 
         plt.axis("off")  # type: ignore
         plt.tight_layout()  # type: ignore
-        plt.savefig("inst.svg", format="svg")  # type: ignore
+        svg = io.StringIO()
+        plt.savefig(svg, format="svg")  # type: ignore
         plt.show()  # type: ignore
+        return svg.getvalue()
 
     extensions: List[str] = sorted(
         extension_sizes.keys(), key=lambda k: extension_sizes[k], reverse=True
@@ -164,7 +169,7 @@ def plot_image(
         rectangles.append(
             InstrRectangle(
                 dims=dims,
-                extension=instr_dict[instr]["extension"][0],
+                extension=instr_dict[instr].extension[0],
                 label=instr.replace("_", "."),
             )
         )
@@ -175,7 +180,7 @@ def plot_image(
 
     colors, hatches = generate_styles(extensions)
 
-    plot_with_matplotlib(rectangles, colors, hatches, extensions)
+    return plot_with_matplotlib(rectangles, colors, hatches, extensions)
 
 
 def generate_styles(extensions: list[str]) -> tuple[list[str], list[str]]:
@@ -254,31 +259,33 @@ def defragment_encodings(
     return encodings
 
 
-def defragment_encoding_dict(instr_dict: InstrDict) -> InstrDict:
-    """Apply defragmentation to the encoding dictionary."""
-    encodings = [instr["encoding"] for instr in instr_dict.values()]
+def defragment_encoding_dict(instr_dict: InstrDict) -> Dict[str, str]:
+    """Apply defragmentation to the encodings of the instruction dictionary."""
+    encodings = [instr.encoding for instr in instr_dict.values()]
     encodings_defragemented = defragment_encodings(encodings, length=32, offset=0)
-    for index, instr in enumerate(instr_dict):
-        instr_dict[instr]["encoding"] = encodings_defragemented[index]
-    return instr_dict
+    return dict(zip(instr_dict, encodings_defragemented))
 
 
-def make_svg(instr_dict: InstrDict) -> None:
+def emit_svg(instr_dict: InstrDict) -> Iterator[str]:
     """Generate an SVG image from instruction encodings."""
     extensions = instr_dict_2_extensions(instr_dict)
     extension_size: Dict[str, float] = {}
 
-    instr_dict = defragment_encoding_dict(instr_dict)
+    encodings = defragment_encoding_dict(instr_dict)
     instr_dims_dict: InstrDimsDict = {}
 
     for ext in extensions:
         extension_size[ext] = 0
 
     for instr in instr_dict:
-        dims = encoding_to_rect(instr_dict[instr]["encoding"])
+        dims = encoding_to_rect(encodings[instr])
 
-        extension_size[instr_dict[instr]["extension"][0]] += dims.h * dims.w
+        extension_size[instr_dict[instr].extension[0]] += dims.h * dims.w
 
         instr_dims_dict[instr] = dims
 
-    plot_image(instr_dict, instr_dims_dict, extension_size)
+    yield plot_image(instr_dict, instr_dims_dict, extension_size)
+
+
+def make_svg(instr_dict: InstrDict, sink: OutputTarget = None) -> bool:
+    return output_sink(sink).write("inst.svg", emit_svg(instr_dict))
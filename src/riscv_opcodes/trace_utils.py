@@ -0,0 +1,226 @@
+import argparse
+import json
+import logging
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Iterator
+
+from .argument_utils import positive_int
+from .cache import InstrDictCache, default_cache_dir
+from .context import OpcodesError
+from .decoder import Decoder
+from .shared_utils import create_inst_dict
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Number of instruction words decoded at a time.
+DEFAULT_CHUNK_WORDS = 1 << 20
+
+# Number of bytes of a hexadecimal trace read at a time.
+HEX_READ_SIZE = 1 << 16
+
+
+# Read raw little-endian 32-bit instruction words in chunks
+def read_raw_words(stream: IO[bytes], chunk_words: int) -> "Iterator[np.ndarray]":
+    import numpy as np
+
+    while True:
+        data = stream.read(chunk_words * 4)
+        if not data:
+            return
+        if len(data) % 4:
+            logging.warning(f"Ignoring {len(data) % 4} trailing bytes")
+            data = data[: len(data) - len(data) % 4]
+        yield np.frombuffer(data, dtype="<u4")
+
+
+# Report the first token of a hexadecimal trace that isn't a word
+def check_hex_words(text: bytes, first_line_number: int):
+    for line_number, line in enumerate(text.split(b"\n"), first_line_number):
+        for token in line.split():
+            try:
+                word = int(token, 16)
+            except ValueError:
+                word = -1
+            if not 0 <= word <= 0xFFFFFFFF:
+                raise OpcodesError(
+                    f"line {line_number}: '{token.decode(errors='replace')}' is not a 32-bit hexadecimal instruction word"
+                )
+
+
+# Read whitespace separated hexadecimal instruction words in chunks
+def read_hex_words(stream: IO[bytes], chunk_words: int) -> "Iterator[np.ndarray]":
+    """
+    Reads the stream HEX_READ_SIZE bytes at a time rather than a line at a
+    time, so long lines don't have to fit in memory, and yields chunks of
+    chunk_words words. A token cut off at the end of a read is completed by
+    the next one.
+    """
+    import numpy as np
+
+    words: "list[int]" = []
+    line_number = 1
+    partial = b""
+    while True:
+        data = stream.read(HEX_READ_SIZE)
+        text = partial + data
+        if data:
+            end = max(text.rfind(space) for space in b" \t\n\r\v\f") + 1
+            text, partial = text[:end], text[end:]
+        try:
+            new_words = [int(token, 16) for token in text.split()]
+        except ValueError:
+            new_words = [-1]
+        if new_words and not 0 <= min(new_words) <= max(new_words) <= 0xFFFFFFFF:
+            check_hex_words(text, line_number)
+        words += new_words
+        line_number += text.count(b"\n")
+        while len(words) >= chunk_words:
+            yield np.array(words[:chunk_words], dtype=np.uint32)
+            del words[:chunk_words]
+        if not data:
+            break
+        if len(partial) > HEX_READ_SIZE:
+            raise OpcodesError(
+                f"line {line_number}: '{partial[:16].decode(errors='replace')}...' is not a 32-bit hexadecimal instruction word"
+            )
+    if words:
+        yield np.array(words, dtype=np.uint32)
+
+
+class TraceHistogram:
+    """
+    Instruction and extension histograms of a stream of instruction words,
+    accumulated one chunk of words at a time.
+    """
+
+    def __init__(self, decoder: Decoder):
+        self.decoder = decoder
+        self.instructions: "Counter[str]" = Counter()
+        self.extensions: "Counter[str]" = Counter()
+        self.total = 0
+        self.unknown = 0
+
+    def add(self, words: "np.ndarray"):
+        """Decodes a chunk of instruction words and counts them."""
+        decoded = self.decoder.decode_many(words)
+        self.total += len(decoded)
+        self.unknown += int((decoded < 0).sum())
+        self.instructions.update(self.decoder.instruction_counts(decoded))
+        self.extensions.update(self.decoder.extension_counts(decoded))
+
+    def to_dict(self) -> "dict[str, Any]":
+        return {
+            "total": self.total,
+            "unknown": self.unknown,
+            "instructions": dict(self.instructions.most_common()),
+            "extensions": dict(self.extensions.most_common()),
+        }
+
+    def format_text(self) -> str:
+        def percentage(count: int) -> str:
+            return f"{100 * count / self.total:6.2f}%" if self.total else ""
+
+        lines = [
+            f"Instruction words : {self.total}",
+            f"Unknown encodings : {self.unknown} {percentage(self.unknown)}",
+        ]
+        for title, counter in (
+            ("Instructions", self.instructions),
+            ("Extensions", self.extensions),
+        ):
+            lines.append("")
+            lines.append(f"{title}:")
+            width = max((len(name) for name in counter), default=0)
+            for name, count in counter.most_common():
+                lines.append(f"  {name:<{width}} {count:>12} {percentage(count)}")
+        return "\n".join(lines) + "\n"
+
+
+# Decode a stream of instruction words into histograms
+def trace_stream(
+    stream: IO[bytes],
+    decoder: Decoder,
+    raw: bool = False,
+    chunk_words: int = DEFAULT_CHUNK_WORDS,
+) -> TraceHistogram:
+    histogram = TraceHistogram(decoder)
+    read_words = read_raw_words if raw else read_hex_words
+    for words in read_words(stream, chunk_words):
+        histogram.add(words)
+    return histogram
+
+
+def trace_main(argv: "list[str]"):
+    parser = argparse.ArgumentParser(
+        prog="riscv_opcodes trace",
+        description="Count the instructions and extensions used by a stream of instruction words",
+    )
+    parser.add_argument(
+        "trace",
+        help="File of instruction words, or '-' for standard input. By default one or more hexadecimal words per line.",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="The trace holds raw little-endian 32-bit words instead of hexadecimal text",
+    )
+    parser.add_argument(
+        "-pseudo", action="store_true", help="Include pseudo-instructions"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the histograms as JSON"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=positive_int,
+        default=DEFAULT_CHUNK_WORDS,
+        help="Number of instruction words decoded at a time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=default_cache_dir(),
+        help="Directory of the parsed instruction cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always parse the extension files instead of using the cache",
+    )
+    parser.add_argument(
+        "extensions",
+        nargs="+",
+        help="Extensions to decode against. This is a glob of the rv_.. files, e.g. 'rv_i rv64_i rv_c'.",
+    )
+
+    args = parser.parse_args(argv)
+
+    try:
+        import numpy as _  # pylint: disable=unused-import
+    except ImportError as e:
+        raise OpcodesError("The trace command requires numpy") from e
+
+    create = (
+        create_inst_dict
+        if args.no_cache
+        else InstrDictCache(args.cache_dir).create_inst_dict
+    )
+    decoder = Decoder(create(args.extensions, args.pseudo))
+
+    if args.trace == "-":
+        histogram = trace_stream(sys.stdin.buffer, decoder, args.raw, args.chunk_size)
+    else:
+        try:
+            with open(args.trace, "rb") as stream:
+                histogram = trace_stream(stream, decoder, args.raw, args.chunk_size)
+        except OSError as e:
+            raise OpcodesError(f"Could not read {args.trace}: {e}") from e
+
+    if args.json:
+        json.dump(histogram.to_dict(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(histogram.format_text())
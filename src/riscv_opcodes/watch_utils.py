@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from .context import OpcodesError, load_context
+from .depfile_utils import OUTPUT_RESOURCES, PARSER_RESOURCES
+from .resources import resource_root
+from .shared_utils import InstrModel
+
+# Directories of the extension files, relative to the resource root.
+EXTENSION_DIRECTORIES = ["extensions", "extensions/unratified"]
+
+# The other resources read by the parser and the generators.
+WATCHED_RESOURCES = sorted(set(PARSER_RESOURCES).union(*OUTPUT_RESOURCES.values()))
+
+# Seconds between two checks for changed files.
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+class ResourceWatcher:
+    """
+    Finds the extension files and other resources that were added, removed
+    or modified since the last check, from their size and modification time.
+    Checking only stats the files, so it can be done often.
+    """
+
+    def __init__(self):
+        self._stats = self.scan()
+
+    @staticmethod
+    def scan() -> "dict[str, tuple[int, int]]":
+        """Returns the modification time and size of every watched file."""
+        root = resource_root()
+        paths = [
+            f"{directory}/{file.name}"
+            for directory in EXTENSION_DIRECTORIES
+            for file in (root / directory).iterdir()
+            if file.is_file()
+        ]
+        stats = {}
+        for path in paths + WATCHED_RESOURCES:
+            try:
+                stat = os.stat(str(root / path))
+            except FileNotFoundError:
+                continue
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    def changes(self) -> "set[str]":
+        """Returns the resource paths of the files changed since the last call."""
+        stats = self.scan()
+        changed = {
+            path
+            for path in stats.keys() | self._stats.keys()
+            if stats.get(path) != self._stats.get(path)
+        }
+        self._stats = stats
+        return changed
+
+
+# Wait until watched files change
+def wait_for_changes(watcher: ResourceWatcher, interval: float) -> "set[str]":
+    """
+    Polls the watcher every interval seconds until files change, then until
+    a poll finds no further changes, so that the several writes of an editor
+    saving a file are handled together. Returns the changed files.
+    """
+    changed: set[str] = set()
+    while True:
+        time.sleep(interval)
+        new_changes = watcher.changes()
+        if changed and not new_changes:
+            return changed
+        changed |= new_changes
+
+
+# Forget the parsed state that depends on changed files
+def invalidate_model(model: InstrModel, changed: "set[str]") -> InstrModel:
+    """
+    Returns the model to use after the files changed: model without the
+    changed extension files, or a new model if a file every extension file is
+    parsed with changed.
+    """
+    if not changed.isdisjoint(PARSER_RESOURCES):
+        return InstrModel(model.jobs)
+    model.invalidate(changed)
+    return model
+
+
+def watch_extensions(
+    generate: "Callable[..., list[str]]",
+    jobs: int = 1,
+    interval: float = DEFAULT_POLL_INTERVAL,
+):
+    """
+    Calls generate, generate_extensions with the outputs and extensions bound,
+    and calls it again each time watched files change until interrupted. Each
+    run only parses the changed extension files again,
+    and only generates the outputs generated from a changed file. Errors in
+    the extension files are logged and the next change is waited for; the
+    run after a failed one generates every output.
+    """
+    watcher = ResourceWatcher()
+    model = InstrModel(jobs)
+    changed: Optional[set[str]] = None
+    while True:
+        start = time.perf_counter()
+        try:
+            generate(model=model, context=load_context(), changed_files=changed)
+        except OpcodesError as e:
+            logging.error(e)
+            # The outputs of the failed run still have to be generated.
+            failed = True
+        else:
+            logging.info(f"Generated in {time.perf_counter() - start:.2f}s")
+            failed = False
+        logging.info("Waiting for changes")
+        changed = wait_for_changes(watcher, interval)
+        logging.info(f"Changed: {', '.join(sorted(changed))}")
+        model = invalidate_model(model, changed)
+        if failed:
+            changed = None
@@ -1,13 +1,88 @@
 #!/usr/bin/env python3
 
+import argparse
+import contextlib
+import io
+import json
 import logging
+import os
+import random
+import shutil
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from unittest.mock import Mock, patch
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from riscv_opcodes.argument_utils import non_negative_int, positive_int
+from riscv_opcodes.batch_utils import load_manifest, parse_manifest
+from riscv_opcodes.c_utils import emit_c_decoder
+from riscv_opcodes.cache import InstrDictCache
+from riscv_opcodes.client import OpcodesClient, ServerError
+from riscv_opcodes.compressed_utils import (
+    build_compressed_table,
+    compressed_instructions,
+    emit_compressed_npy,
+)
+from riscv_opcodes.constants import arg_lut
+from riscv_opcodes.context import (
+    GenerationContext,
+    OpcodesError,
+    current_context,
+    generation_context,
+)
+from riscv_opcodes.decoder import Decoder
+from riscv_opcodes.depfile_utils import emit_depfile
+from riscv_opcodes.dispatch_utils import build_dispatch_tables, emit_c_dispatch
+from riscv_opcodes.elf_utils import (
+    default_extensions,
+    instruction_words,
+    required_extensions,
+    scan_elf,
+)
+from riscv_opcodes.generate_utils import (
+    EmitterTask,
+    generate_extensions,
+    run_batch,
+    run_emitter_tasks,
+)
+from riscv_opcodes.json_utils import emit_json
+from riscv_opcodes.minimize_utils import (
+    Cube,
+    covers,
+    cube_contains,
+    encoding_cube,
+    minimize_instructions,
+    minimize_legal,
+    sharp,
+)
+from riscv_opcodes.output_utils import render_output, render_output_bytes, write_output
+from riscv_opcodes.resources import resource_root
+from riscv_opcodes.rust_utils import emit_rust
+from riscv_opcodes.serve_utils import OpcodesServer, OpcodesSocketServer
 from riscv_opcodes.shared_utils import (
+    ExtensionLoader,
     InstrDict,
+    InstrModel,
+    OverlapIndex,
+    SingleInstr,
+    add_encoded_extension_file,
     check_arg_lut,
     check_overlapping_bits,
+    create_inst_dict,
+    encode_extension_file,
+    encodings_overlap,
+    expand_nf_field,
     extract_isa_type,
     handle_arg_lut_mapping,
     initialize_encoding,
@@ -19,10 +94,14 @@ from riscv_opcodes.shared_utils import (
     process_fixed_ranges,
     process_standard_instructions,
     read_extension_file,
+    read_lines,
     same_base_isa,
+    tokenize_extension_lines,
     update_encoding_for_fixed_range,
     validate_bit_range,
 )
+from riscv_opcodes.trace_utils import read_hex_words, trace_main, trace_stream
+from riscv_opcodes.watch_utils import ResourceWatcher, invalidate_model
 
 
 class EncodingUtilsTest(unittest.TestCase):
@@ -45,9 +124,9 @@ class EncodingUtilsTest(unittest.TestCase):
         validate_bit_range(31, 0, 0xFFFFFFFF, "test_instr")  # max 32-bit value
 
         # Invalid cases
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(OpcodesError):
             validate_bit_range(3, 7, 1, "test_instr")  # msb < lsb
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(OpcodesError):
             validate_bit_range(3, 0, 16, "test_instr")  # value too large for range
 
     def test_parse_instruction_line(self):
@@ -77,7 +156,7 @@ class BitManipulationTest(unittest.TestCase):
 
         # Invalid case - overlap
         self.test_encoding[31 - 5] = "1"
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(OpcodesError):
             check_overlapping_bits(self.test_encoding, 5, "test_instr")
 
     def test_update_encoding_for_fixed_range(self):
@@ -105,7 +184,7 @@ class EncodingArgsTest(unittest.TestCase):
         self.logger = logging.getLogger()
         self.logger.disabled = True
 
-    @patch.dict("riscv_opcodes.shared_utils.arg_lut", {"rd": (11, 7), "rs1": (19, 15)})
+    @patch.dict("riscv_opcodes.constants.arg_lut", {"rd": (11, 7), "rs1": (19, 15)})
     def test_check_arg_lut(self):
         """Test argument lookup table checking"""
         encoding_args = initialize_encoding()
@@ -116,7 +195,7 @@ class EncodingArgsTest(unittest.TestCase):
         self.assertEqual(encoding_args[31 - 11 : 31 - 6], ["rd"] * 5)
         self.assertEqual(encoding_args[31 - 19 : 31 - 14], ["rs1"] * 5)
 
-    @patch.dict("riscv_opcodes.shared_utils.arg_lut", {"rs1": (19, 15)})
+    @patch.dict("riscv_opcodes.constants.arg_lut", {"rs1": (19, 15)})
     def test_handle_arg_lut_mapping(self):
         """Test handling of argument mappings"""
         # Valid mapping
@@ -124,7 +203,7 @@ class EncodingArgsTest(unittest.TestCase):
         self.assertEqual(result, "rs1=new_arg")
 
         # Invalid mapping
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(OpcodesError):
             handle_arg_lut_mapping("invalid_arg=new_arg", "test_instr")
 
 
@@ -167,6 +246,34 @@ class StringManipulationTest(unittest.TestCase):
         self.assertFalse(overlaps("111", "101"))
 
 
+class OverlapIndexTest(unittest.TestCase):
+    """Tests for the indexed encoding overlap check"""
+
+    def test_encodings_overlap(self):
+        """Test integer overlap checking"""
+        self.assertTrue(encodings_overlap(0b101, 0b101, 0b111, 0b010))
+        self.assertTrue(encodings_overlap(0b101, 0b111, 0b000, 0b000))
+        self.assertFalse(encodings_overlap(0b111, 0b111, 0b101, 0b111))
+
+    def test_overlapping(self):
+        """Test that only overlapping instructions of the same base ISA are found"""
+        index = OverlapIndex()
+        # addi, c.addi, an RV64-only instruction without fixed opcode bits and
+        # an RV64-only 32-bit instruction.
+        index.add("addi", 0x13, 0x707F, ["rv_i"])
+        index.add("c_addi", 0x1, 0xE003, ["rv_c"])
+        index.add("wild", 0x0, 0x0, ["rv64_x"])
+        index.add("addiw", 0x1B, 0x707F, ["rv64_i"])
+
+        self.assertEqual(index.overlapping("rv_i", 0x13, 0x7F), ["addi", "wild"])
+        self.assertEqual(index.overlapping("rv32_i", 0x1, 0x3), ["c_addi"])
+        self.assertEqual(index.overlapping("rv32_i", 0x1B, 0x7F), [])
+        self.assertEqual(index.overlapping("rv_i", 0x1B, 0x7F), ["wild", "addiw"])
+
+        index.add_extension("addiw", "rv32_i")
+        self.assertEqual(index.overlapping("rv32_i", 0x1B, 0x7F), ["addiw"])
+
+
 class InstructionProcessingTest(unittest.TestCase):
     """Tests for instruction processing and validation"""
 
@@ -175,7 +282,7 @@ class InstructionProcessingTest(unittest.TestCase):
         self.logger.disabled = True
         # Create a patch for arg_lut
         self.arg_lut_patcher = patch.dict(
-            "riscv_opcodes.shared_utils.arg_lut", {"rd": (11, 7), "imm20": (31, 12)}
+            "riscv_opcodes.constants.arg_lut", {"rd": (11, 7), "imm20": (31, 12)}
         )
         self.arg_lut_patcher.start()
 
@@ -202,6 +309,57 @@ class InstructionProcessingTest(unittest.TestCase):
         self.assertEqual(data["extension"], ["rv_i"])
         self.assertIn("rd", data["variable_fields"])
         self.assertIn("imm20", data["variable_fields"])
+        self.assertEqual(data.match, 0x34)
+        self.assertEqual(data.mask, 0x7C)
+        self.assertEqual(data["match"], "0x34")
+        self.assertEqual(data["encoding"], "-" * 25 + "01101--")
+
+    def test_single_instr(self):
+        """Test the string forms derived from integer match and mask"""
+        instr = SingleInstr(0x33, 0xFE00707F, ["rd", "rs1", "rs2"], ["rv_i"])
+        self.assertEqual(instr.encoding, "0000000----------000-----0110011")
+        self.assertEqual(
+            instr.to_dict(),
+            {
+                "encoding": "0000000----------000-----0110011",
+                "variable_fields": ["rd", "rs1", "rs2"],
+                "extension": ["rv_i"],
+                "match": "0x33",
+                "mask": "0xfe00707f",
+            },
+        )
+        self.assertEqual(instr["mask"], "0xfe00707f")
+        self.assertEqual(dict(instr), instr.to_dict())
+        with self.assertRaises(KeyError):
+            _ = instr["opcode"]
+        with self.assertRaises(TypeError):
+            instr["mask"] = "0x0"  # type: ignore # pylint: disable=unsupported-assignment-operation
+
+        # The mapping view is read-only.
+        instr["extension"].append("rv_m")  # pylint: disable=no-member
+        self.assertEqual(instr.extension, ("rv_i",))
+        self.assertEqual(instr.with_extensions(["rv_m"]).extension, ("rv_i", "rv_m"))
+        self.assertEqual(instr.extension, ("rv_i",))
+
+        # Identical field lists are shared.
+        other = SingleInstr(0x40000033, 0xFE00707F, ["rd", "rs1", "rs2"], ["rv_i"])
+        self.assertIs(instr.variable_fields, other.variable_fields)
+
+    def test_expand_nf_field(self):
+        """Test expansion of segmented vector loads and stores"""
+        instr = SingleInstr(0x7, 0x1DF0707F, ["nf", "vm", "rs1", "vd"], ["rv_v"])
+        expanded = dict(expand_nf_field("vle8_v", instr))
+        self.assertEqual(len(expanded), 8)
+        self.assertEqual(expanded["vlseg3e8_v"].match, 0x40000007)
+        self.assertEqual(expanded["vlseg3e8_v"].mask, 0xFDF0707F)
+        self.assertEqual(expanded["vle8_v"].variable_fields, ("vm", "rs1", "vd"))
+        # The expanded instructions share their field lists.
+        self.assertIs(
+            expanded["vle8_v"].variable_fields, expanded["vlseg8e8_v"].variable_fields
+        )
+        # The original instruction is left untouched.
+        self.assertEqual(instr.mask, 0x1DF0707F)
+        self.assertIn("nf", instr.variable_fields)
 
     def test_process_standard_instructions(self):
         """Test processing of standard instructions"""
@@ -218,8 +376,13 @@ class InstructionProcessingTest(unittest.TestCase):
         with patch("riscv_opcodes.shared_utils.process_enc_line") as mock_process_enc:
             # Setup mock return values
             mock_process_enc.side_effect = [
-                ("add", {"extension": ["rv32i"], "encoding": "encoding1"}),
-                ("sub", {"extension": ["rv32i"], "encoding": "encoding2"}),
+                ("add", SingleInstr(0x33, 0xFE00707F, ["rd", "rs1", "rs2"], ["rv32i"])),
+                (
+                    "sub",
+                    SingleInstr(
+                        0x40000033, 0xFE00707F, ["rd", "rs1", "rs2"], ["rv32i"]
+                    ),
+                ),
             ]
 
             process_standard_instructions(lines, instr_dict, file_name)
@@ -241,9 +404,982 @@ class InstructionProcessingTest(unittest.TestCase):
         # Unratified
         read_extension_file("rv_zbp")
         # Nonexistent
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(OpcodesError):
             read_extension_file("floop")
 
+    def test_parallel_create_inst_dict(self):
+        """Test that a parallel parse gives the same result as a sequential one"""
+        extensions = ["rv_i", "rv64_i", "rv_f", "rv_d", "rv_zks"]
+        self.assertEqual(
+            list(create_inst_dict(extensions, jobs=2).items()),
+            list(create_inst_dict(extensions).items()),
+        )
+
+    def test_instr_model(self):
+        """Test that dictionaries created from one model are independent"""
+        model = InstrModel()
+        zbb = model.create_inst_dict(["rv_zbb"])
+        both = model.create_inst_dict(["rv_zbb", "rv_zbkb"])
+        self.assertEqual(zbb["andn"].extension, ("rv_zbb",))
+        self.assertEqual(both["andn"].extension, ("rv_zbb", "rv_zbkb"))
+        self.assertEqual(
+            list(both.items()),
+            list(create_inst_dict(["rv_zbb", "rv_zbkb"]).items()),
+        )
+        self.assertEqual(
+            list(model.create_inst_dict(["rv_zbb"]).items()), list(zbb.items())
+        )
+
+    def test_dependencies(self):
+        """Test that files named by $import lines are dependencies"""
+        model = InstrModel()
+        self.assertEqual(
+            model.dependencies(["rv_zbkb"]),
+            ["extensions/rv_zbb", "extensions/rv_zbkb"],
+        )
+        depfile = render_output(
+            emit_depfile("encoding.out.h", ["extensions/rv_zbb", "my file.h"])
+        )
+        self.assertTrue(depfile.startswith("encoding.out.h: \\\n  "))
+        self.assertIn("rv_zbb \\\n  my\\ file.h\n", depfile)
+        self.assertTrue(depfile.endswith("rv_zbb:\n\nmy\\ file.h:\n"))
+
+        # Prerequisites are relative to the directory of the depfile, and
+        # absolute outside of it or without a directory.
+        extensions = os.path.abspath(os.path.join(str(resource_root()), "extensions"))
+        absolute = os.path.join(extensions, "rv_zbb")
+        for directory, path in (
+            (os.path.dirname(extensions), os.path.join("extensions", "rv_zbb")),
+            (extensions, "rv_zbb"),
+            (os.path.join(extensions, "sub"), absolute),
+            (None, absolute),
+        ):
+            self.assertEqual(
+                render_output(
+                    emit_depfile("inst.rs", ["extensions/rv_zbb"], directory)
+                ),
+                f"inst.rs: \\\n  {path}\n\n{path}:\n",
+            )
+
+    def test_encode_extension_file(self):
+        """Test that encoding errors are captured instead of reported"""
+        lines = [
+            "add rd rs1 rs2 31..25=0 14..12=0 6..2=0x0C 1..0=3",
+            "bad rd rs1 rs2 31..25=0 14..12=9 6..2=0x0C 1..0=3",
+        ]
+        with patch("riscv_opcodes.shared_utils.read_lines", return_value=lines):
+            encoded = encode_extension_file("extensions/rv_test")
+        self.assertIsInstance(encoded.error, OpcodesError)
+        self.assertIn("illegal value 9", str(encoded.error))
+        self.assertEqual([name for name, _ in encoded.standard], ["add"])
+        error = OpcodesError("unreadable")
+        with patch("riscv_opcodes.shared_utils.read_lines", side_effect=error):
+            encoded = encode_extension_file("extensions/rv_test")
+        self.assertIs(encoded.error, error)
+        self.assertEqual(encoded.ext_file.name, "extensions/rv_test")
+        with self.assertRaises(OpcodesError):
+            add_encoded_extension_file(encoded, {}, False, OverlapIndex())
+
+    def test_tokenize_extension_lines(self):
+        """Test classification of extension file lines"""
+        ext_file = tokenize_extension_lines(
+            "extensions/rv_test",
+            [
+                "add rd rs1 rs2 31..25=0 14..12=0 6..2=0x0C 1..0=3",
+                "$import rv_zbb::rol",
+                "$pseudo_op rv_i::addi nop 31..0=0x13",
+            ],
+        )
+        self.assertEqual(
+            ext_file.standard, ["add rd rs1 rs2 31..25=0 14..12=0 6..2=0x0C 1..0=3"]
+        )
+        self.assertEqual(ext_file.imports, [("rv_zbb", "rol")])
+        self.assertEqual(ext_file.pseudo, [("rv_i", "addi", "nop", "31..0=0x13")])
+        self.assertIn("add", ext_file.index)
+
+    def test_extension_loader(self):
+        """Test that the extension loader reads each file once"""
+        loader = ExtensionLoader()
+        with patch(
+            "riscv_opcodes.shared_utils.read_lines", wraps=read_lines
+        ) as mock_read_lines:
+            ext_file = loader.resolve("rv_zbp")
+            self.assertIs(loader.load("extensions/unratified/rv_zbp"), ext_file)
+            self.assertIs(loader.resolve("rv_zbp"), ext_file)
+            self.assertEqual(mock_read_lines.call_count, 1)
+        with self.assertRaises(OpcodesError):
+            loader.resolve("floop")
+
+
+class InstrDictCacheTest(unittest.TestCase):
+    """Tests for the on-disk instruction dictionary cache"""
+
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.logger.disabled = True
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.cache = InstrDictCache(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_hit(self):
+        """Test that a warm lookup skips parsing and returns the same result"""
+        cold = self.cache.create_inst_dict(["rv_i"])
+        with patch("riscv_opcodes.cache.create_inst_dict") as mock_create:
+            warm = InstrDictCache(self.tmp_dir).create_inst_dict(["rv_i"])
+            mock_create.assert_not_called()
+        self.assertEqual(cold, warm)
+
+    def test_cache_warnings(self):
+        """Test that a warm lookup reports the warnings of the parse again"""
+
+        def parse(*_):
+            current_context().warn("overlap")
+            return {}
+
+        with generation_context() as cold:
+            with patch("riscv_opcodes.cache.create_inst_dict", side_effect=parse):
+                self.cache.create_inst_dict(["rv_i"], warn_overlap=True)
+        with generation_context() as warm:
+            with patch("riscv_opcodes.cache.create_inst_dict") as mock_create:
+                self.cache.create_inst_dict(["rv_i"], warn_overlap=True)
+                mock_create.assert_not_called()
+        self.assertEqual(cold.warnings, ["overlap"])
+        self.assertEqual(warm.warnings, ["overlap"])
+
+    def test_cache_key(self):
+        """Test that the key depends on the create_inst_dict arguments"""
+        keys = {
+            self.cache.key(["rv_i"], False, [], False),
+            self.cache.key(["rv_i"], True, [], False),
+            self.cache.key(["rv_i"], False, ["pause"], False),
+            self.cache.key(["rv_i", "rv_m"], False, [], False),
+            self.cache.key(["rv_i"], False, [], True),
+        }
+        self.assertEqual(len(keys), 5)
+
+    @patch.dict("riscv_opcodes.constants.arg_lut")
+    def test_cache_arg_aliases(self):
+        """Test that field aliases registered by a parse are restored on a hit"""
+        self.cache.create_inst_dict(["rv_f"])
+        self.assertEqual(arg_lut["rs2=rs1"], arg_lut["rs2"])
+        del arg_lut["rs2=rs1"]
+        self.cache.create_inst_dict(["rv_f"])
+        self.assertEqual(arg_lut["rs2=rs1"], arg_lut["rs2"])
+
+    def test_cache_eviction(self):
+        """Test that least recently used entries are evicted"""
+        self.cache.create_inst_dict(["rv_i"])
+        (old_entry,) = self.tmp_dir.glob("*.json")
+        os.utime(old_entry, (0, 0))
+        self.cache.max_size = old_entry.stat().st_size
+
+        self.cache.create_inst_dict(["rv_m"])
+        entries = list(self.tmp_dir.glob("*.json"))
+        self.assertEqual(len(entries), 1)
+        self.assertNotEqual(entries[0], old_entry)
+
+        self.cache.max_size = 0
+        self.cache.evict()
+        self.assertEqual(list(self.tmp_dir.glob("*.json")), [])
+
+
+class GenerationContextTest(unittest.TestCase):
+    """Tests for running parses in separate contexts"""
+
+    def setUp(self):
+        # Other tests disable the root logger.
+        logging.getLogger().disabled = False
+
+    def test_concurrent_contexts(self):
+        """Test that concurrent parses only see their own aliases"""
+
+        def parse(file_filter: "list[str]") -> GenerationContext:
+            with generation_context() as context:
+                create_inst_dict(file_filter)
+                return context
+
+        with ThreadPoolExecutor(4) as executor:
+            contexts = list(executor.map(parse, [["rv_f"], ["rv_i"]] * 4))
+        for context in contexts[0::2]:
+            self.assertEqual(context.arg_lut["rs2=rs1"], arg_lut["rs2"])
+        for context in contexts[1::2]:
+            self.assertNotIn("rs2=rs1", context.arg_lut)
+        self.assertNotIn(current_context(), contexts)
+
+    def test_warnings(self):
+        """Test that warnings are recorded in the current context"""
+        with generation_context() as context, self.assertLogs(level="WARNING"):
+            context.warn("overlap")
+        self.assertEqual(context.warnings, ["overlap"])
+        self.assertNotIn("overlap", current_context().warnings)
+
+
+class EmitterTasksTest(unittest.TestCase):
+    """Tests for running the generators"""
+
+    def setUp(self):
+        # Other tests disable the root logger.
+        logging.getLogger().disabled = False
+
+    def test_run_emitter_tasks(self):
+        """Test that parallel emitters log in task order and report errors"""
+        tasks = [
+            EmitterTask(str, ("abc",), "first"),
+            EmitterTask(str, ("def",), "second"),
+            EmitterTask(handle_arg_lut_mapping, ("bad", "third"), "third"),
+        ]
+        for jobs in (1, 3):
+            outputs = {"first": b"abc"}
+            with self.assertLogs(level="INFO") as logs:
+                with self.assertRaises(OpcodesError):
+                    run_emitter_tasks(tasks, jobs, outputs)
+            self.assertEqual(
+                logs.output,
+                [
+                    "INFO:root:first is unchanged",
+                    "INFO:root:second generated successfully",
+                ],
+            )
+            self.assertEqual(outputs, {"first": b"abc", "second": b"def"})
+
+        written = []
+        with tempfile.TemporaryDirectory() as tmp_dir, self.assertLogs(level="INFO"):
+            self.assertEqual(
+                run_emitter_tasks(tasks[:2], 2, tmp_dir), ["first", "second"]
+            )
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["first", "second"])
+            run_emitter_tasks(tasks[:2], 2, lambda name, data: written.append(data))
+        self.assertEqual(written, [b"abc", b"def"])
+
+    def test_generate_in_memory(self):
+        """Test that outputs can be generated without touching the disk"""
+        outputs: "dict[str, bytes]" = {}
+        with self.assertLogs(level="INFO"):
+            changed = generate_extensions(
+                ["rv_zbkb"],
+                False,
+                c=True,
+                chisel=False,
+                spinalhdl=False,
+                sverilog=False,
+                rust=True,
+                go=False,
+                latex=False,
+                svg=False,
+                depfiles=True,
+                sink=outputs,
+            )
+        self.assertEqual(
+            sorted(outputs),
+            [
+                "encoding.out.h",
+                "encoding.out.h.d",
+                "inst.rs",
+                "inst.rs.d",
+                "instr_dict.json",
+                "instr_dict.json.d",
+            ],
+        )
+        self.assertEqual(sorted(changed), sorted(outputs))
+        self.assertIn(b"const MATCH_ROL: u32 = 0x60001033;", outputs["inst.rs"])
+        # Outputs kept in memory have no directory to make paths relative to.
+        for line in outputs["inst.rs.d"].decode().splitlines()[1:]:
+            self.assertTrue(os.path.isabs(line.strip(" \\:")) or not line, line)
+
+    def test_run_batch(self):
+        """Test that a manifest generates each configuration into its directory"""
+        manifest = """
+[[config]]
+name = "zbkb"
+extensions = ["rv_zbkb"]
+outputs = ["c", "rust"]
+
+[[config]]
+name = "zicsr"
+directory = "out/zicsr"
+extensions = ["rv_zicsr"]
+outputs = ["rust"]
+depfiles = true
+"""
+        for jobs in (1, 2):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                manifest_file = os.path.join(tmp_dir, "config.toml")
+                with open(manifest_file, "w", encoding="utf-8") as f:
+                    f.write(manifest)
+                with self.assertLogs(level="INFO"):
+                    changed = run_batch(load_manifest(manifest_file), jobs)
+                self.assertEqual(
+                    changed,
+                    {
+                        "zbkb": ["instr_dict.json", "encoding.out.h", "inst.rs"],
+                        "zicsr": [
+                            "instr_dict.json",
+                            "inst.rs",
+                            "instr_dict.json.d",
+                            "inst.rs.d",
+                        ],
+                    },
+                )
+                with open(os.path.join(tmp_dir, "zbkb", "inst.rs"), "rb") as f:
+                    self.assertIn(b"const MATCH_ROL: u32 = 0x60001033;", f.read())
+                with open(os.path.join(tmp_dir, "out", "zicsr", "inst.rs"), "rb") as f:
+                    self.assertNotIn(b"MATCH_ROL", f.read())
+
+        for config in (
+            {"name": "x", "extensions": ["rv_i"], "outputs": ["cobol"]},
+            {"name": "x", "extensions": ["rv_nothing"]},
+            {"extensions": ["rv_i"]},
+        ):
+            with self.assertRaises(OpcodesError):
+                parse_manifest({"config": [config]})
+
+    def test_generate_changed_files(self):
+        """Test that only the outputs generated from changed files are generated"""
+        model = InstrModel()
+        all_outputs = ["instr_dict.json", "encoding.out.h", "inst.rs"]
+        for extensions, changed_files, expected in (
+            (["rv_zbkb"], {"csrs.csv"}, ["encoding.out.h", "inst.rs"]),
+            (["rv_zbkb"], {"extensions/rv_zbb"}, all_outputs),
+            (["rv_zbkb"], {"extensions/rv_v"}, []),
+            # Deleted files are no longer dependencies, but the glob selected them.
+            (["rv_zbk*"], {"extensions/rv_zbkz"}, all_outputs),
+            (["rv_zbk*"], {"extensions/unratified/rv_zbkz"}, []),
+            (["unratified/rv_zbk*"], {"extensions/unratified/rv_zbkz"}, all_outputs),
+        ):
+            outputs: "dict[str, bytes]" = {}
+            with self.assertLogs(level="INFO"):
+                logging.info("Generating")
+                generate_extensions(
+                    extensions,
+                    False,
+                    c=True,
+                    chisel=False,
+                    spinalhdl=False,
+                    sverilog=False,
+                    rust=True,
+                    go=False,
+                    latex=False,
+                    svg=False,
+                    sink=outputs,
+                    model=model,
+                    changed_files=changed_files,
+                )
+            self.assertEqual(list(outputs), expected)
+        self.assertIsNot(invalidate_model(model, {"arg_lut.csv"}), model)
+        self.assertIs(invalidate_model(model, {"extensions/rv_zbkb"}), model)
+
+    def test_argument_types(self):
+        """Test that job counts and chunk sizes are checked on the command line"""
+        self.assertEqual(non_negative_int("0"), 0)
+        self.assertEqual(positive_int("3"), 3)
+        for parse, value in ((non_negative_int, "-1"), (positive_int, "0")):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse(value)
+        with self.assertRaises(argparse.ArgumentTypeError):
+            non_negative_int("x")
+
+    def test_generate_stable(self):
+        """Test that generating again with another hash seed rewrites nothing"""
+        src = Path(__file__).resolve().parent.parent / "src"
+        command = [sys.executable, "-m", "riscv_opcodes", "-c", "-chisel"]
+        command += ["-spinalhdl", "-sverilog", "-rust", "-go", "rv_i", "rv_m", "rv_f"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats = []
+            for seed in ("1", "2"):
+                env = dict(os.environ, PYTHONPATH=str(src), PYTHONHASHSEED=seed)
+                subprocess.run(
+                    command, cwd=tmp_dir, env=env, check=True, capture_output=True
+                )
+                stats.append(
+                    {
+                        name: os.stat(os.path.join(tmp_dir, name)).st_mtime_ns
+                        for name in os.listdir(tmp_dir)
+                    }
+                )
+                # Rewritten files would get a new modification time.
+                for name in os.listdir(tmp_dir):
+                    os.utime(os.path.join(tmp_dir, name), ns=(0, 0))
+            self.assertIn("inst.chisel", stats[1])
+            self.assertEqual(stats[1], dict.fromkeys(stats[0], 0))
+
+    def test_write_output(self):
+        """Test that outputs are only rewritten when their content changes"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "inst.rs")
+            self.assertTrue(write_output(file_name, ["a\n", "b\n"]))
+            os.utime(file_name, (0, 0))
+            self.assertFalse(write_output(file_name, ["a\nb\n"]))
+            self.assertEqual(os.path.getmtime(file_name), 0)
+            self.assertTrue(write_output(file_name, ["a\nc\n"]))
+            with open(file_name, encoding="utf-8") as f:
+                self.assertEqual(f.read(), "a\nc\n")
+            with self.assertRaises(OpcodesError):
+                write_output(
+                    file_name, (handle_arg_lut_mapping("bad", "x") for _ in "a")
+                )
+            self.assertEqual(os.listdir(tmp_dir), ["inst.rs"])
+
+    def test_emit_outputs(self):
+        """Test that the streamed outputs match the documents they replace"""
+        instr_dict = create_inst_dict(["rv_zicsr"], False)
+        self.assertEqual(
+            render_output(emit_json(instr_dict)),
+            json.dumps(
+                {name: instr.to_dict() for name, instr in instr_dict.items()}, indent=2
+            ),
+        )
+        self.assertEqual(render_output(emit_json({})), "{}")
+        rust = render_output(emit_rust(instr_dict)).splitlines()
+        self.assertIn("const MATCH_CSRRW: u32 = 0x1073;", rust)
+        self.assertIn("const MASK_CSRRW: u32 = 0x707f;", rust)
+
+
+class OpcodesServerTest(unittest.TestCase):
+    """Tests for answering requests from parsed state kept in memory"""
+
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.logger.disabled = True
+
+    def test_handle(self):
+        """Test the answers to decode and query requests and their errors"""
+        opcodes = OpcodesServer()
+        self.assertEqual(
+            opcodes.handle(
+                {
+                    "command": "decode",
+                    "extensions": ["rv_i", "rv_c"],
+                    "words": ["00a58533", 1, "ffffffff"],
+                }
+            ),
+            {"instructions": ["add", "c_nop", None]},
+        )
+        self.assertEqual(
+            opcodes.handle(
+                {"command": "query", "extensions": ["rv_i"], "names": ["add", "rol"]}
+            )["instructions"]["add"]["mask"],
+            "0xfe00707f",
+        )
+        for request in (
+            {"command": "assemble"},
+            {"command": "decode", "extensions": ["rv_i"], "words": ["xyz"]},
+            {"command": "query", "extensions": "rv_i"},
+            {"command": "query", "extensions": [1]},
+            {"command": "query", "extensions": ["rv_i"], "names": [{}]},
+            {"command": "decode", "extensions": ["rv_i"], "words": [{}]},
+            {"command": "decode", "extensions": ["rv_i"], "words": [True]},
+            {"command": "decode", "extensions": ["rv_i"], "words": [-1]},
+            {"command": "generate", "outputs": [["c"]]},
+            {"command": "generate", "outputs": ["c"], "directory": "relative"},
+        ):
+            self.assertIn("error", opcodes.handle(request))
+
+    def test_output_root(self):
+        """Test that generate requests can't write outside of the output root"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            opcodes = OpcodesServer(output_root=tmp_dir)
+            for directory, error in (
+                (tmp_dir, False),
+                (os.path.join(tmp_dir, "..", "elsewhere"), True),
+                ("/", True),
+            ):
+                response = opcodes.handle(
+                    {
+                        "command": "generate",
+                        "extensions": ["rv_zbkb"],
+                        "outputs": ["rust"],
+                        "directory": directory,
+                    }
+                )
+                self.assertEqual("error" in response, error, directory)
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)), ["inst.rs", "instr_dict.json"]
+            )
+
+    def test_refresh(self):
+        """Test that only the state derived from changed files is dropped"""
+        opcodes = OpcodesServer()
+        instr_dict = opcodes.instr_dict(["rv_i"], False)
+        self.assertIs(opcodes.instr_dict(["rv_i"], False), instr_dict)
+        opcodes.refresh()
+        self.assertIs(opcodes.instr_dict(["rv_i"], False), instr_dict)
+        # rv_i looks modified to the next scan.
+        stats = {**ResourceWatcher.scan(), "extensions/rv_i": (0, 0)}
+        with patch.object(opcodes.watcher, "scan", return_value=stats):
+            with patch.object(opcodes.model, "invalidate") as invalidate:
+                opcodes.refresh()
+        invalidate.assert_called_once_with({"extensions/rv_i"})
+        self.assertIsNot(opcodes.instr_dict(["rv_i"], False), instr_dict)
+
+    def test_socket(self):
+        """Test a request and an error over the socket"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = Path(tmp_dir) / "opcodes.sock"
+            with OpcodesSocketServer(socket_path, OpcodesServer()) as server:
+                thread = threading.Thread(target=server.serve_forever)
+                thread.start()
+                try:
+                    self.assertEqual(stat.S_IMODE(os.stat(socket_path).st_mode), 0o600)
+                    with OpcodesClient(socket_path) as client:
+                        response = client.request(
+                            {"command": "generate", "extensions": ["rv_zbkb"]}
+                        )
+                        with self.assertRaises(ServerError):
+                            client.request({"command": "assemble"})
+                finally:
+                    server.shutdown()
+                    thread.join()
+            self.assertEqual(response["changed"], ["instr_dict.json"])
+            self.assertIn('"rol"', response["outputs"]["instr_dict.json"])
+            self.assertEqual(os.listdir(tmp_dir), [])
+
+
+# Program that decodes the little-endian words of a file with the DECODE
+# function of HEADER and writes the instruction ids as 16-bit words.
+C_DECODER_TEST_PROGRAM = """
+#include <stdio.h>
+#include HEADER
+
+int main(int argc, char **argv)
+{
+  FILE *in = fopen(argv[1], "rb");
+  FILE *out = fopen(argv[2], "wb");
+  uint32_t word;
+  (void)argc;
+  while (fread(&word, sizeof(word), 1, in) == 1) {
+    uint16_t id = DECODE(word);
+    fwrite(&id, sizeof(id), 1, out);
+  }
+  fclose(in);
+  return fclose(out) != 0;
+}
+"""
+
+
+C_DECODER_NAMES_PROGRAM = """
+#include <stdio.h>
+#include "decode.out.h"
+
+int main(void)
+{
+  int insn;
+  for (insn = 0; insn <= RISCV_INSN_COUNT; insn++) {
+    const char *name = riscv_insn_name((enum riscv_insn)insn);
+    puts(name ? name : "(null)");
+  }
+  return 0;
+}
+"""
+
+
+@unittest.skipIf(shutil.which("cc") is None, "needs a C compiler")
+class CDecoderTest(unittest.TestCase):
+    """Tests for the generated C decode function"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        try:
+            cls.instr_dict = create_inst_dict(
+                ["rv_i", "rv64_i", "rv_m", "rv_a", "rv_f", "rv_d", "rv_zicsr"]
+                + ["rv_c", "rv64_c", "rv_c_d", "rv_zba", "rv_zbb", "rv_v"]
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+        cls.decoder = Decoder(cls.instr_dict)
+        cls.ids = {name: i + 1 for i, name in enumerate(cls.instr_dict)}
+
+    def check_c_decoder(self, header: str, content: str, decode: str, words: list):
+        """Check that a generated C decode function agrees with Decoder on words"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            (tmp / header).write_text(content, encoding="utf-8")
+            (tmp / "test.c").write_text(C_DECODER_TEST_PROGRAM, encoding="utf-8")
+            subprocess.run(
+                ["cc", "-std=c99", "-Wall", "-Werror", "-O1", "-o", "test"]
+                + [f'-DHEADER="{header}"', f"-DDECODE={decode}", "test.c"],
+                cwd=tmp,
+                check=True,
+            )
+            (tmp / "words").write_bytes(struct.pack(f"<{len(words)}I", *words))
+            subprocess.run(["./test", "words", "ids"], cwd=tmp, check=True)
+            decoded = struct.unpack(f"<{len(words)}H", (tmp / "ids").read_bytes())
+
+        for word, decoded_id in zip(words, decoded):
+            name = self.decoder.decode(word)
+            self.assertEqual(
+                decoded_id, 0 if name is None else self.ids[name], hex(word)
+            )
+
+    def test_c_decoder(self):
+        """Test that the C decoder agrees with Decoder on every 16-bit word and random 32-bit words"""
+        rng = random.Random(0)
+        words = list(range(1 << 16)) + [rng.getrandbits(32) | 3 for _ in range(1 << 16)]
+        self.check_c_decoder(
+            "decode.out.h",
+            render_output(emit_c_decoder(self.instr_dict)),
+            "riscv_decode",
+            words,
+        )
+
+    def test_c_decoder_names(self):
+        """Test riscv_insn_name and that including decode.out.h alone warns about nothing"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            (tmp / "decode.out.h").write_text(
+                render_output(emit_c_decoder(self.instr_dict)), encoding="utf-8"
+            )
+            (tmp / "unused.c").write_text('#include "decode.out.h"\n', encoding="utf-8")
+            (tmp / "names.c").write_text(C_DECODER_NAMES_PROGRAM, encoding="utf-8")
+            # Unlike -Wall, =2 also warns about unused constants of headers of
+            # gcc; clang doesn't know it.
+            cc = ["cc", "-std=c99", "-Wall", "-Wextra", "-Wunused-const-variable=2"]
+            cc += ["-Wno-unknown-warning-option", "-Werror"]
+            subprocess.run(cc + ["-c", "unused.c"], cwd=tmp, check=True)
+            subprocess.run(cc + ["-o", "names", "names.c"], cwd=tmp, check=True)
+            names = subprocess.run(
+                ["./names"], cwd=tmp, check=True, capture_output=True, text=True
+            ).stdout.split()
+
+        self.assertEqual(names, ["unknown", *self.instr_dict, "(null)"])
+
+    def test_c_dispatch(self):
+        """Test that the C dispatch tables agree with Decoder on random 32-bit words"""
+        rng = random.Random(0)
+        words = [rng.getrandbits(32) | 3 for _ in range(1 << 16)]
+        # Words with the fields of known encodings and random operands.
+        for instr in self.instr_dict.values():
+            if instr.match & 3 == 3:
+                words += [
+                    instr.match | rng.getrandbits(32) & ~instr.mask for _ in range(8)
+                ]
+        buckets = build_dispatch_tables(self.instr_dict)
+        self.assertEqual(len(buckets), 32)
+        self.assertIn("funct3", [field.name for field in buckets[0x33 >> 2].fields])
+        self.check_c_decoder(
+            "dispatch.out.h",
+            render_output(emit_c_dispatch(self.instr_dict)),
+            "riscv_dispatch",
+            words,
+        )
+
+
+# Program that decodes the little-endian words of a file with the decode
+# module of inst.rs and writes the Opcode values as 16-bit words.
+RUST_DECODER_TEST_PROGRAM = """
+#[allow(dead_code)]
+mod inst;
+
+use std::env;
+use std::fs;
+
+fn main() {
+    let args: Vec<String> = env::args().collect();
+    let words = fs::read(&args[1]).unwrap();
+    let mut ids = Vec::new();
+    for word in words.chunks(4) {
+        let word = u32::from_le_bytes([word[0], word[1], word[2], word[3]]);
+        let id = inst::decode::decode(word).map_or(0, |opcode| opcode as u16);
+        ids.extend_from_slice(&id.to_le_bytes());
+    }
+    fs::write(&args[2], ids).unwrap();
+}
+"""
+
+
+@unittest.skipIf(shutil.which("rustc") is None, "needs a Rust compiler")
+class RustDecoderTest(unittest.TestCase):
+    """Tests for the generated Rust decode module"""
+
+    def test_rust_decoder(self):
+        """Test that the Rust decoder agrees with Decoder on every 16-bit word and random 32-bit words"""
+        logging.disable(logging.CRITICAL)
+        try:
+            instr_dict = create_inst_dict(
+                ["rv_i", "rv64_i", "rv_m", "rv_a", "rv_f", "rv_d", "rv_zicsr"]
+                + ["rv_c", "rv64_c", "rv_c_d", "rv_zba", "rv_zbb", "rv_v"]
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+        decoder = Decoder(instr_dict)
+        ids = {name: i + 1 for i, name in enumerate(instr_dict)}
+        rng = random.Random(0)
+        words = list(range(1 << 16)) + [rng.getrandbits(32) | 3 for _ in range(1 << 16)]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp = Path(tmp_dir)
+            inst_rs = render_output(emit_rust(instr_dict, decoder=True))
+            self.assertIn("pub fn rs1(insn: u32) -> u32", inst_rs)
+            (tmp / "inst.rs").write_text(inst_rs, encoding="utf-8")
+            (tmp / "main.rs").write_text(RUST_DECODER_TEST_PROGRAM, encoding="utf-8")
+            subprocess.run(
+                ["rustc", "--edition", "2021", "-D", "warnings", "main.rs"],
+                cwd=tmp,
+                check=True,
+            )
+            (tmp / "words").write_bytes(struct.pack(f"<{len(words)}I", *words))
+            subprocess.run(["./main", "words", "ids"], cwd=tmp, check=True)
+            decoded = struct.unpack(f"<{len(words)}H", (tmp / "ids").read_bytes())
+
+        for word, decoded_id in zip(words, decoded):
+            name = decoder.decode(word)
+            self.assertEqual(decoded_id, 0 if name is None else ids[name], hex(word))
+
+
+class CompressedTableTest(unittest.TestCase):
+    """Tests for the decode table of the 16-bit instructions"""
+
+    def test_compressed_table(self):
+        """Test that the table agrees with Decoder on every 16-bit word"""
+        logging.disable(logging.CRITICAL)
+        try:
+            instr_dict = create_inst_dict(
+                ["rv_i", "rv_c", "rv64_c", "rv_c_d", "rv_zcb", "rv64_zcb"]
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+        names = compressed_instructions(instr_dict)
+        self.assertIn("c_addi", names)
+        self.assertNotIn("addi", names)
+        decoder = Decoder({name: instr_dict[name] for name in names})
+        table = build_compressed_table(instr_dict)
+        for word in range(1 << 16):
+            name = decoder.decode(word)
+            expected = 0 if name is None else names.index(name) + 1
+            self.assertEqual(table[word], expected, hex(word))
+
+        data = render_output_bytes(emit_compressed_npy(instr_dict))
+        self.assertEqual(data[:8], b"\x93NUMPY\x01\x00")
+        self.assertEqual(len(data), 128 + 2 * len(table))
+        if numpy is not None:
+            array = numpy.load(io.BytesIO(data))
+            self.assertEqual(array.dtype, numpy.uint16)
+            self.assertEqual(array.tolist(), table.tolist())
+
+
+class MinimizeTest(unittest.TestCase):
+    """Tests for the logic minimization of the decode patterns"""
+
+    def test_sharp(self):
+        """Test that sharp leaves the words of a cube outside another"""
+        a = encoding_cube("-" * 30 + "11")
+        b = encoding_cube("-" * 25 + "0110011")
+        parts = sharp(a, b)
+        for word in range(1 << 7):
+            expected = word & 3 == 3 and word & 0x7F != 0x33
+            matches = [part for part in parts if cube_contains(part, Cube(word, 0x7F))]
+            self.assertEqual(len(matches), int(expected), bin(word))
+        self.assertTrue(covers(parts + [b], a))
+        self.assertFalse(covers(parts, a))
+
+    def test_minimize(self):
+        """Test that the minimized patterns decode like Decoder and use fewer bits"""
+        logging.disable(logging.CRITICAL)
+        try:
+            instr_dict = create_inst_dict(
+                ["rv_i", "rv64_i", "rv_m", "rv_f", "rv_c", "rv64_c", "rv_zbb"]
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+        patterns = minimize_instructions(instr_dict)
+        legal = minimize_legal(instr_dict)
+        self.assertLess(
+            sum(
+                bin(cube.care).count("1")
+                for cubes in patterns.values()
+                for cube in cubes
+            ),
+            sum(bin(instr.mask).count("1") for instr in instr_dict.values()),
+        )
+        self.assertLess(len(legal), len(instr_dict))
+
+        decoder = Decoder(instr_dict)
+        rng = random.Random(0)
+        words = [rng.getrandbits(16) for _ in range(1 << 12)]
+        words += [rng.getrandbits(32) | 3 for _ in range(1 << 12)]
+        for instr in instr_dict.values():
+            words += [instr.match | rng.getrandbits(32) & ~instr.mask for _ in range(8)]
+        for word in words:
+            cube = Cube(word, (1 << 32) - 1)
+            name = decoder.decode(word)
+            self.assertEqual(
+                any(cube_contains(other, cube) for other in legal),
+                name is not None,
+                hex(word),
+            )
+            if name is not None:
+                self.assertEqual(
+                    [
+                        other
+                        for other, cubes in patterns.items()
+                        if any(cube_contains(pattern, cube) for pattern in cubes)
+                    ],
+                    [name],
+                    hex(word),
+                )
+
+
+class DecoderTest(unittest.TestCase):
+    """Tests for decoding instruction words"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        try:
+            cls.instr_dict = create_inst_dict(["rv_i", "rv64_i", "rv_c", "rv64_c"])
+        finally:
+            logging.disable(logging.NOTSET)
+        cls.decoder = Decoder(cls.instr_dict)
+
+    def test_decode(self):
+        self.assertEqual(self.decoder.decode(0x00000013), "addi")
+        self.assertEqual(self.decoder.decode(0x00A58533), "add")
+        self.assertEqual(self.decoder.decode(0x0000051B), "addiw")
+        self.assertIsNone(self.decoder.decode(0xFFFFFFFF))
+
+    def test_decode_overlapping(self):
+        """Test that the most specific of overlapping encodings is chosen"""
+        self.assertEqual(self.decoder.decode(0x0001), "c_nop")
+        self.assertEqual(self.decoder.decode(0x0505), "c_addi")
+        self.assertEqual(self.decoder.decode(0x9002), "c_ebreak")
+        self.assertEqual(self.decoder.decode(0x9082), "c_jalr")
+        self.assertEqual(self.decoder.decode(0x952E), "c_add")
+
+    def test_decode_matches(self):
+        """Test that every instruction decodes to itself"""
+        for name, instr in self.instr_dict.items():
+            decoded = self.decoder.decode(instr.match)
+            self.assertIsNotNone(decoded)
+            if decoded != name:
+                # Only allowed for overlapping instructions
+                self.assertEqual(
+                    instr.match & self.instr_dict[decoded].mask,
+                    self.instr_dict[decoded].match,
+                )
+                self.assertGreater(
+                    bin(self.instr_dict[decoded].mask).count("1"),
+                    bin(instr.mask).count("1"),
+                )
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_decode_many(self):
+        words = [0x00000013, 0x0001, 0x00A58533, 0xFFFFFFFF, 0x9002, 0x00000013]
+        decoded = self.decoder.decode_many(numpy.array(words, dtype=numpy.uint32))
+        self.assertEqual(
+            [self.decoder.names[i] if i >= 0 else None for i in decoded],
+            [self.decoder.decode(word) for word in words],
+        )
+        self.assertEqual(
+            self.decoder.instruction_counts(decoded),
+            {"addi": 2, "c_nop": 1, "add": 1, "c_ebreak": 1},
+        )
+        self.assertEqual(self.decoder.extension_counts(decoded), {"rv_i": 3, "rv_c": 2})
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_trace_stream(self):
+        """Test that hex and raw traces give the same histograms"""
+        words = [0x00000013, 0x0001, 0x00A58533, 0xFFFFFFFF, 0x9002, 0x00000013]
+        hex_trace = io.BytesIO(b"00000013 0x0001\n00a58533\nffffffff\n9002\n13\n")
+        raw_trace = io.BytesIO(numpy.array(words, dtype="<u4").tobytes())
+        hex_histogram = trace_stream(hex_trace, self.decoder, chunk_words=2)
+        raw_histogram = trace_stream(raw_trace, self.decoder, raw=True, chunk_words=4)
+        self.assertEqual(hex_histogram.to_dict(), raw_histogram.to_dict())
+        self.assertEqual(hex_histogram.total, 6)
+        self.assertEqual(hex_histogram.unknown, 1)
+        self.assertEqual(hex_histogram.instructions["addi"], 2)
+        self.assertEqual(hex_histogram.extensions["rv_c"], 2)
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_read_hex_words(self):
+        """Test that long hex lines are read in bounded reads and chunks"""
+        trace = b"13 0x0001 00a58533\n\n9002  ffffffff 13\r\n0001"
+        with patch("riscv_opcodes.trace_utils.HEX_READ_SIZE", 8):
+            chunks = list(read_hex_words(io.BytesIO(trace), 2))
+            self.assertEqual(
+                [chunk.tolist() for chunk in chunks],
+                [[0x13, 0x1], [0xA58533, 0x9002], [0xFFFFFFFF, 0x13], [0x1]],
+            )
+            with self.assertRaisesRegex(OpcodesError, "line 3: 'xyz'"):
+                list(read_hex_words(io.BytesIO(b"13\n\n  xyz 13"), 2))
+            with self.assertRaisesRegex(OpcodesError, "line 2: '12345678.*'"):
+                list(read_hex_words(io.BytesIO(b"13\n1234567890"), 2))
+        with self.assertRaises(SystemExit):
+            with contextlib.redirect_stderr(io.StringIO()):
+                trace_main(["--chunk-size", "0", "-", "rv_i"])
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_instruction_words(self):
+        """Test splitting parcels into 16-bit and 32-bit instructions"""
+        parcels = numpy.random.default_rng(0).integers(0, 1 << 16, 1000, "<u2")
+        words = []
+        i = 0
+        while i < len(parcels):
+            if parcels[i] & 3 != 3:
+                words.append(int(parcels[i]))
+                i += 1
+            elif i + 1 < len(parcels):
+                words.append(int(parcels[i]) | int(parcels[i + 1]) << 16)
+                i += 2
+            else:
+                break
+        self.assertEqual(instruction_words(parcels).tolist(), words)
+
+    @staticmethod
+    def scan_text(text, decoder):
+        """Scans an RV64 ELF file whose only section holds text"""
+        header = b"\x7fELF" + bytes([2, 1, 1]) + bytes(9)
+        header += struct.pack(
+            "<HHIQQQIHHHHHH", 1, 243, 1, 0, 0, 64, 0, 64, 0, 0, 64, 2, 0
+        )
+        sections = bytes(64) + struct.pack(
+            "<IIQQQQIIQQ", 0, 1, 0x6, 0, 64 + 128, len(text), 0, 0, 2, 0
+        )
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = Path(tmp_dir) / "test.elf"
+            path.write_bytes(header + sections + text)
+            return scan_elf(path, {2: decoder})
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_scan_elf(self):
+        """Test decoding the executable sections of an ELF file"""
+        # addi a0, a0, 1; c.nop; add a0, a1, a2; c.ebreak
+        text = struct.pack("<IHIH", 0x00150513, 0x0001, 0x00C58533, 0x9002)
+        scan = self.scan_text(text, self.decoder)
+        self.assertEqual(scan.total, 4)
+        self.assertEqual(scan.unknown, 0)
+        self.assertEqual(
+            scan.instructions, {"addi": 1, "c_nop": 1, "add": 1, "c_ebreak": 1}
+        )
+        self.assertEqual(
+            required_extensions(scan.instructions, self.decoder),
+            {"rv_c": 2, "rv_i": 2},
+        )
+
+    @unittest.skipUnless(numpy, "numpy is not installed")
+    def test_scan_elf_default_extensions(self):
+        """Test that RV64GC code isn't decoded as Zcmp or Zcmt"""
+        logging.disable(logging.CRITICAL)
+        try:
+            decoder = Decoder(create_inst_dict(default_extensions(64)))
+        finally:
+            logging.disable(logging.NOTSET)
+        # c.fsdsp fs0, 8(sp); c.fsdsp f16, 48(sp), which is cm.push {ra}, -16
+        # in Zcmp; c.fldsp fs0, 8(sp); c.fsdsp f0, 0(sp), which is a table
+        # jump in Zcmt; c.add a0, a1
+        text = struct.pack("<HHHHH", 0xA422, 0xB842, 0x2422, 0xA002, 0x952E)
+        scan = self.scan_text(text, decoder)
+        self.assertEqual(scan.unknown, 0)
+        self.assertEqual(scan.instructions, {"c_fsdsp": 3, "c_fldsp": 1, "c_add": 1})
+        self.assertEqual(
+            required_extensions(scan.instructions, decoder),
+            {"rv_c": 1, "rv_c_d": 4},
+        )
+
 
 if __name__ == "__main__":
     unittest.main()